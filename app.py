@@ -2,16 +2,26 @@ import os
 import sys
 import json
 import uuid
-import sqlite3
-from datetime import datetime
 from functools import wraps
 from pathlib import Path
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
 from werkzeug.utils import secure_filename
-import pandas as pd
-import pyreadstat
 from dotenv import load_dotenv
-from crosstab_parser import CrosstabParser
+from compute_pool import ComputeBusy, ComputePool, ComputeTimeout
+from cross_analysis import (BreakdownTooLarge, active_filters, banner_columns, canonical_filters,
+                            count_banner, count_batch_with_index, count_batch_with_rows,
+                            count_breakdown, count_with_cube, count_with_index, count_with_rows,
+                            counts_size, format_analysis, format_banner, format_batch,
+                            format_breakdown, row_mask)
+from export import (EXPORT_FORMATS, Sheet, analysis_sheet, batch_sheets, crosstab_question_sheets,
+                    export_format, export_response)
+from ingest import IngestQueue
+from question_catalog import build_question_catalog
+from http_cache import encode_json, etag_for, iter_survey_frames_json, json_response
+from survey_cache import SurveyCache
+from survey_db import SurveyDB
+from survey_store import SurveyStore
+from table_query import aggregate_columns, iter_row_values, parse_table_request, query_table, table_rows
 
 # Load environment variables
 load_dotenv()
@@ -47,6 +57,48 @@ app.config['DATA_FOLDER'] = str(DATA_FOLDER)
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
 app.config['ALLOWED_EXTENSIONS'] = {'csv', 'xlsx', 'xls', 'sav'}
 app.config['SITE_PASSWORD'] = os.getenv('SITE_PASSWORD', 'changeme')
+app.config['SURVEY_CACHE_MB'] = int(os.getenv('SURVEY_CACHE_MB', 256))
+app.config['INGEST_WORKERS'] = int(os.getenv('INGEST_WORKERS', 2))
+app.config['SAV_CHUNK_ROWS'] = int(os.getenv('SAV_CHUNK_ROWS', 50000))
+app.config['SAV_READ_PROCESSES'] = int(os.getenv('SAV_READ_PROCESSES', 1))
+app.config['CROSSTAB_PARSE_WORKERS'] = int(os.getenv('CROSSTAB_PARSE_WORKERS', 1))
+app.config['SQLITE_MMAP_MB'] = int(os.getenv('SQLITE_MMAP_MB', 64))
+app.config['COMPUTE_WORKERS'] = int(os.getenv('COMPUTE_WORKERS', 2))
+app.config['COMPUTE_QUEUE'] = int(os.getenv('COMPUTE_QUEUE', 8))
+app.config['COMPUTE_TIMEOUT'] = float(os.getenv('COMPUTE_TIMEOUT', 60))
+app.config['RESULT_CACHE_MB'] = int(os.getenv('RESULT_CACHE_MB', 32))
+app.config['RESULT_CACHE_TTL'] = float(os.getenv('RESULT_CACHE_TTL', 900))
+app.config['BREAKDOWN_MAX_CELLS'] = int(os.getenv('BREAKDOWN_MAX_CELLS', 5000))
+app.config['TABLE_MAX_ROWS'] = int(os.getenv('TABLE_MAX_ROWS', 1000))
+# Windows can't delete or replace a survey's files while they are mapped
+app.config['SURVEY_MMAP'] = os.getenv('SURVEY_MMAP', '0' if os.name == 'nt' else '1') == '1'
+
+# Columnar storage for tabular (standard and raw_survey) data, with a
+# per-process cache of decoded columns and metadata
+survey_cache = SurveyCache(app.config['SURVEY_CACHE_MB'] * 1024 * 1024)
+store = SurveyStore(DATA_FOLDER, cache=survey_cache, use_mmap=app.config['SURVEY_MMAP'])
+
+# Analysis counts keyed by survey version, target(s) and canonical filters,
+# so analysts flipping between the same views don't recompute them
+result_cache = SurveyCache(app.config['RESULT_CACHE_MB'] * 1024 * 1024,
+                           ttl=app.config['RESULT_CACHE_TTL'])
+
+# Heavy analysis runs on a bounded per-process pool; requests beyond its
+# queue get a 503 rather than piling up behind each other
+compute_pool = ComputePool(max_workers=app.config['COMPUTE_WORKERS'],
+                           max_queue=app.config['COMPUTE_QUEUE'],
+                           timeout=app.config['COMPUTE_TIMEOUT'])
+
+@app.errorhandler(ComputeBusy)
+def compute_busy(error):
+    response = jsonify({'error': 'The server is busy with other analyses, please retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+@app.errorhandler(ComputeTimeout)
+def compute_timeout(error):
+    return jsonify({'error': str(error)}), 504
 
 # Authentication decorator
 def login_required(f):
@@ -58,103 +110,18 @@ def login_required(f):
     return decorated_function
 
 # Initialize database
-def init_db():
-    db_path = DATA_FOLDER / 'surveys.db'
-    conn = sqlite3.connect(str(db_path))
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS surveys
-                 (id TEXT PRIMARY KEY,
-                  filename TEXT NOT NULL,
-                  upload_date TEXT NOT NULL,
-                  columns TEXT NOT NULL,
-                  row_count INTEGER NOT NULL,
-                  file_type TEXT DEFAULT 'standard')''')
-
-    # Add file_type column if it doesn't exist (for existing databases)
-    c.execute("PRAGMA table_info(surveys)")
-    columns = [col[1] for col in c.fetchall()]
-    if 'file_type' not in columns:
-        c.execute('ALTER TABLE surveys ADD COLUMN file_type TEXT DEFAULT "standard"')
-
-    conn.commit()
-    conn.close()
-
-init_db()
+db = SurveyDB(DATA_FOLDER / 'surveys.db', mmap_mb=app.config['SQLITE_MMAP_MB'])
+db.init_schema()
+
+# Uploads are parsed and stored by a background process pool
+ingest_queue = IngestQueue(db, DATA_FOLDER, max_workers=app.config['INGEST_WORKERS'],
+                           sav_chunk_rows=app.config['SAV_CHUNK_ROWS'],
+                           sav_read_processes=app.config['SAV_READ_PROCESSES'],
+                           crosstab_parse_workers=app.config['CROSSTAB_PARSE_WORKERS'])
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def detect_file_type(filepath, file_extension):
-    """Detect if file is standard survey data or crosstab format"""
-    try:
-        if file_extension == 'csv':
-            df = pd.read_csv(filepath, header=None, nrows=20)
-        else:
-            # Check if it has multiple sheets (likely crosstab)
-            xl_file = pd.ExcelFile(filepath)
-            if len(xl_file.sheet_names) > 1:
-                # Check for BANNER pattern
-                if any('BANNER' in sheet.upper() for sheet in xl_file.sheet_names):
-                    return 'crosstab'
-
-            df = pd.read_excel(filepath, header=None, nrows=20)
-
-        # Look for crosstab indicators in first 20 rows
-        for idx, row in df.iterrows():
-            row_text = ' '.join([str(x) for x in row if pd.notna(x)])
-            # Check for question patterns like "Q1.", "Q2.", etc.
-            if any(pattern in row_text for pattern in ['Q1.', 'Q2.', 'Q3.']):
-                # Check for demographic headers
-                if any(keyword in row_text for keyword in ['Region', 'Age', 'Gender']):
-                    return 'crosstab'
-
-        return 'standard'
-
-    except Exception:
-        return 'standard'  # Default to standard if detection fails
-
-
-def process_sav_file(filepath):
-    """Process SPSS SAV file and return dataframe with metadata"""
-    try:
-        # Read SAV file with metadata
-        df, meta = pyreadstat.read_sav(filepath)
-
-        # Get variable labels (question text)
-        variable_labels = meta.column_names_to_labels
-
-        # Get value labels (response options)
-        value_labels = meta.variable_value_labels
-
-        # Clean column names
-        df.columns = df.columns.str.strip()
-
-        return df, variable_labels, value_labels
-    except Exception as e:
-        raise Exception(f"Error processing SAV file: {str(e)}")
-
-
-def process_file(filepath, file_extension):
-    """Process CSV or Excel file and return dataframe"""
-    try:
-        if file_extension == 'csv':
-            df = pd.read_csv(filepath)
-        elif file_extension == 'sav':
-            # For SAV files, only return the dataframe (no metadata for standard view)
-            df, _, _ = process_sav_file(filepath)
-        else:  # xlsx or xls
-            df = pd.read_excel(filepath)
-
-        # Clean column names
-        df.columns = df.columns.str.strip()
-
-        # Convert all data to string for consistency in JSON
-        df = df.fillna('')
-
-        return df
-    except Exception as e:
-        raise Exception(f"Error processing file: {str(e)}")
-
 # Authentication routes
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -179,14 +146,7 @@ def logout():
 @login_required
 def index():
     """Home page with upload form and list of surveys"""
-    db_path = DATA_FOLDER / 'surveys.db'
-    conn = sqlite3.connect(str(db_path))
-    c = conn.cursor()
-    c.execute('SELECT id, filename, upload_date, row_count, file_type FROM surveys ORDER BY upload_date DESC')
-    surveys = [{'id': row[0], 'filename': row[1], 'upload_date': row[2], 'row_count': row[3],
-                'file_type': row[4] if len(row) > 4 else 'standard'}
-               for row in c.fetchall()]
-    conn.close()
+    surveys = db.list_surveys()
 
     return render_template('index.html', surveys=surveys)
 
@@ -215,101 +175,36 @@ def upload_file():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{survey_id}_{filename}")
         file.save(filepath)
 
-        # Handle SAV files specially for cross-question analysis
-        if file_extension == 'sav':
-            # Process SAV file with full metadata
-            df, variable_labels, value_labels = process_sav_file(filepath)
-
-            # Save raw survey data with metadata as JSON
-            data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
-            data = {
-                'columns': df.columns.tolist(),
-                'data': df.to_dict('records'),
-                'variable_labels': variable_labels,
-                'value_labels': value_labels,
-                'file_type': 'raw_survey'
-            }
-            with open(data_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-
-            # Save metadata to database
-            db_path = DATA_FOLDER / 'surveys.db'
-            conn = sqlite3.connect(str(db_path))
-            c = conn.cursor()
-            c.execute('INSERT INTO surveys VALUES (?, ?, ?, ?, ?, ?)',
-                      (survey_id, filename, datetime.now().isoformat(),
-                       json.dumps(df.columns.tolist()), len(df), 'raw_survey'))
-            conn.commit()
-            conn.close()
-
-            return jsonify({'success': True, 'survey_id': survey_id, 'file_type': 'raw_survey'})
-
-        # Detect file type for non-SAV files
-        file_type = detect_file_type(filepath, file_extension)
-
-        if file_type == 'crosstab':
-            # Process as crosstab
-            parser = CrosstabParser(filepath)
-            data = parser.parse_all_sheets()
-
-            # Save crosstab data as JSON
-            data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
-            with open(data_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-
-            # Save metadata
-            db_path = DATA_FOLDER / 'surveys.db'
-            conn = sqlite3.connect(str(db_path))
-            c = conn.cursor()
-            c.execute('INSERT INTO surveys VALUES (?, ?, ?, ?, ?, ?)',
-                      (survey_id, filename, datetime.now().isoformat(),
-                       json.dumps([]), data['metadata']['total_questions'], 'crosstab'))
-            conn.commit()
-            conn.close()
+        # Detection, parsing and storage run in the background; the survey
+        # appears in the list once the job commits
+        job_id = ingest_queue.submit(survey_id, filepath, filename, file_extension)
 
-        else:
-            # Process as standard file
-            df = process_file(filepath, file_extension)
-
-            # Save data as JSON
-            data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
-            data = {
-                'columns': df.columns.tolist(),
-                'data': df.to_dict('records')
-            }
-            with open(data_path, 'w') as f:
-                json.dump(data, f)
-
-            # Save metadata to database
-            db_path = DATA_FOLDER / 'surveys.db'
-            conn = sqlite3.connect(str(db_path))
-            c = conn.cursor()
-            c.execute('INSERT INTO surveys VALUES (?, ?, ?, ?, ?, ?)',
-                      (survey_id, filename, datetime.now().isoformat(),
-                       json.dumps(df.columns.tolist()), len(df), 'standard'))
-            conn.commit()
-            conn.close()
-
-        return jsonify({'success': True, 'survey_id': survey_id, 'file_type': file_type})
+        return jsonify({'success': True, 'job_id': job_id, 'survey_id': survey_id}), 202
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_ingest_job(job_id):
+    """Status of an upload's ingestion job (phase, percent done, errors)"""
+    job = db.get_job(job_id)
+
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
 @app.route('/survey/<survey_id>')
 @login_required
 def view_survey(survey_id):
     """View survey data with filters"""
-    db_path = DATA_FOLDER / 'surveys.db'
-    conn = sqlite3.connect(str(db_path))
-    c = conn.cursor()
-    c.execute('SELECT filename, upload_date, columns, row_count, file_type FROM surveys WHERE id = ?', (survey_id,))
-    result = c.fetchone()
-    conn.close()
+    result = db.get_survey(survey_id)
 
     if not result:
         return "Survey not found", 404
 
-    file_type = result[4] if len(result) > 4 else 'standard'
+    file_type = result['file_type']
 
     if file_type == 'crosstab':
         # Redirect to crosstab viewer
@@ -320,10 +215,10 @@ def view_survey(survey_id):
 
     survey_info = {
         'id': survey_id,
-        'filename': result[0],
-        'upload_date': result[1],
-        'columns': json.loads(result[2]),
-        'row_count': result[3]
+        'filename': result['filename'],
+        'upload_date': result['upload_date'],
+        'columns': json.loads(result['columns']),
+        'row_count': result['row_count']
     }
 
     return render_template('survey.html', survey=survey_info)
@@ -332,15 +227,70 @@ def view_survey(survey_id):
 @login_required
 def get_survey_data(survey_id):
     """API endpoint to get survey data"""
-    data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
+    meta = store.read_meta(survey_id) if store.exists(survey_id) else None
 
-    if not os.path.exists(data_path):
+    if meta is None:
         return jsonify({'error': 'Survey not found'}), 404
 
-    with open(data_path, 'r') as f:
-        data = json.load(f)
+    version = store.version(survey_id)
+
+    def build():
+        # Streamed a slice of rows at a time
+        return iter_survey_frames_json(meta, store.iter_frames(survey_id))
+
+    # Precompressed at ingest; built here for identity requests and legacy surveys
+    return json_response(app, request, etag_for(survey_id, version, 'data'), version,
+                         path=store.response_path(survey_id, 'data'), build=build)
+
+@app.route('/api/survey/<survey_id>/table', methods=['GET', 'POST'])
+@login_required
+def get_survey_table(survey_id):
+    """DataTables server-side processing: one page of filtered, ordered rows"""
+    meta = store.read_meta(survey_id) if store.exists(survey_id) else None
+
+    if meta is None:
+        return jsonify({'error': 'Survey not found'}), 404
+
+    params = request.form if request.method == 'POST' else request.args
+    table_request = parse_table_request(params, meta['columns'], max_length=app.config['TABLE_MAX_ROWS'])
+    return jsonify(compute_pool.run(query_table, store, survey_id, meta, table_request))
+
+@app.route('/api/survey/<survey_id>/export', methods=['GET', 'POST'])
+@login_required
+def export_survey_table(survey_id):
+    """Download the filtered, ordered table (DataTables parameters, paging ignored)
+    as ?format=csv, xlsx or json; rows are decoded from storage in chunks while streaming"""
+    fmt = export_format(request.values.get('format'), EXPORT_FORMATS)
+    if fmt is None:
+        return jsonify({'error': 'Unsupported export format'}), 400
+
+    meta = store.read_meta(survey_id) if store.exists(survey_id) else None
 
-    return jsonify(data)
+    if meta is None:
+        return jsonify({'error': 'Survey not found'}), 404
+
+    params = request.form if request.method == 'POST' else request.args
+    table_request = parse_table_request(params, meta['columns'])
+    rows = compute_pool.run(table_rows, store, survey_id, meta, table_request)
+    sheet = Sheet('Survey', meta['columns'], iter_row_values(store, survey_id, meta['columns'], rows))
+    return export_response(app, [sheet], fmt, f"survey_{survey_id}_export")
+
+@app.route('/api/survey/<survey_id>/aggregate', methods=['POST'])
+@login_required
+def get_survey_aggregate(survey_id):
+    """Chart value counts (and optionally filter dropdown values) under the given filters"""
+    meta = store.read_meta(survey_id) if store.exists(survey_id) else None
+
+    if meta is None:
+        return jsonify({'error': 'Survey not found'}), 404
+
+    params = request.get_json(silent=True) or {}
+    filters = params.get('filters') or {}
+    if not isinstance(filters, dict):
+        return jsonify({'error': 'filters must be an object of column: value'}), 400
+
+    return jsonify(compute_pool.run(aggregate_columns, store, survey_id, meta, filters,
+                                    include_distinct=bool(params.get('include_distinct'))))
 
 @app.route('/delete/<survey_id>', methods=['POST'])
 @login_required
@@ -348,17 +298,11 @@ def delete_survey(survey_id):
     """Delete a survey"""
     try:
         # Delete from database
-        db_path = DATA_FOLDER / 'surveys.db'
-        conn = sqlite3.connect(str(db_path))
-        c = conn.cursor()
-        c.execute('DELETE FROM surveys WHERE id = ?', (survey_id,))
-        conn.commit()
-        conn.close()
-
-        # Delete files
-        data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
-        if os.path.exists(data_path):
-            os.remove(data_path)
+        db.delete_survey(survey_id)
+
+        # Delete files (columnar storage and any legacy/crosstab JSON)
+        store.delete_survey(survey_id)
+        result_cache.invalidate(survey_id)
 
         # Delete uploaded file
         for file in os.listdir(app.config['UPLOAD_FOLDER']):
@@ -370,26 +314,39 @@ def delete_survey(survey_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/cache/stats')
+@login_required
+def get_cache_stats():
+    """Hit/miss/eviction counters for this worker's survey cache"""
+    return jsonify({'pid': os.getpid(), 'survey_cache': survey_cache.stats(),
+                    'result_cache': result_cache.stats(), 'compute_pool': compute_pool.stats()})
+
+
+@app.route('/api/survey/<survey_id>/memory')
+@login_required
+def get_survey_memory(survey_id):
+    """Footprint of a survey before and after compact encoding, per column"""
+    report = store.memory_report(survey_id)
+    if report is None:
+        return jsonify({'error': 'No memory report for this survey'}), 404
+    return jsonify(report)
+
+
 # Crosstab routes
 @app.route('/crosstab/<survey_id>')
 @login_required
 def view_crosstab(survey_id):
     """View crosstab data"""
-    db_path = DATA_FOLDER / 'surveys.db'
-    conn = sqlite3.connect(str(db_path))
-    c = conn.cursor()
-    c.execute('SELECT filename, upload_date, row_count FROM surveys WHERE id = ?', (survey_id,))
-    result = c.fetchone()
-    conn.close()
+    result = db.get_survey(survey_id)
 
     if not result:
         return "Survey not found", 404
 
     survey_info = {
         'id': survey_id,
-        'filename': result[0],
-        'upload_date': result[1],
-        'total_questions': result[2]
+        'filename': result['filename'],
+        'upload_date': result['upload_date'],
+        'total_questions': result['row_count']
     }
 
     return render_template('crosstab.html', survey=survey_info)
@@ -399,47 +356,105 @@ def view_crosstab(survey_id):
 @login_required
 def get_crosstab_data(survey_id):
     """API endpoint to get crosstab data"""
-    data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
+    if not store.exists(survey_id):
+        return jsonify({'error': 'Survey not found'}), 404
 
-    if not os.path.exists(data_path):
+    data_path = store.crosstab_path(survey_id)
+    if data_path is None:
         return jsonify({'error': 'Survey not found'}), 404
 
-    with open(data_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    def build():
+        # Legacy crosstab JSON: re-encode in response form
+        with open(data_path, 'r', encoding='utf-8') as f:
+            return encode_json(json.load(f))
 
-    return jsonify(data)
+    version = store.version(survey_id)
+    return json_response(app, request, etag_for(survey_id, version, 'crosstab'), version,
+                         path=store.sharded_crosstab_path(survey_id), build=build)
 
 
 @app.route('/api/crosstab/<survey_id>/questions')
 @login_required
 def get_crosstab_questions(survey_id):
     """Get list of all questions in crosstab"""
-    data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
+    if not store.exists(survey_id):
+        return jsonify({'error': 'Survey not found'}), 404
 
-    if not os.path.exists(data_path):
+    data_path = store.crosstab_path(survey_id)
+    if data_path is None:
         return jsonify({'error': 'Survey not found'}), 404
 
-    with open(data_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    def build():
+        # Legacy (unsharded) crosstab: load the whole document
+        with open(data_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
 
-    # Extract questions from first banner
-    if data['banners']:
-        first_banner = list(data['banners'].values())[0]
-        questions = [{'id': q['id'], 'text': q['text']} for q in first_banner['questions']]
-        return jsonify({'questions': questions})
+        # Extract questions from first banner
+        questions = []
+        if data['banners']:
+            first_banner = list(data['banners'].values())[0]
+            questions = [{'id': q['id'], 'text': q['text']} for q in first_banner['questions']]
+        return encode_json({'questions': questions})
 
-    return jsonify({'questions': []})
+    version = store.version(survey_id)
+    return json_response(app, request, etag_for(survey_id, version, 'questions'), version,
+                         path=store.crosstab_questions_path(survey_id), build=build)
 
 
 @app.route('/api/crosstab/<survey_id>/question/<question_id>')
 @login_required
 def get_crosstab_question(survey_id, question_id):
     """Get specific question data from all banners"""
-    data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
+    if not store.exists(survey_id):
+        return jsonify({'error': 'Survey not found'}), 404
+
+    body = store.read_crosstab_question(survey_id, question_id)
+    if body == b'':
+        return jsonify({'error': 'Question not found'}), 404
+    if body is not None:
+        return app.response_class(body, mimetype='application/json')
+
+    data_path = store.crosstab_path(survey_id)
+    if data_path is None:
+        return jsonify({'error': 'Survey not found'}), 404
+
+    result = legacy_crosstab_question(data_path, question_id)
+    if result is None:
+        return jsonify({'error': 'Question not found'}), 404
+
+    return jsonify(result)
+
 
-    if not os.path.exists(data_path):
+@app.route('/api/crosstab/<survey_id>/question/<question_id>/export')
+@login_required
+def export_crosstab_question(survey_id, question_id):
+    """Download a question from all banners as ?format=csv or xlsx (one sheet per banner)"""
+    fmt = export_format(request.args.get('format'))
+    if fmt is None:
+        return jsonify({'error': 'Unsupported export format'}), 400
+
+    if not store.exists(survey_id):
         return jsonify({'error': 'Survey not found'}), 404
 
+    body = store.read_crosstab_question(survey_id, question_id)
+    if body == b'':
+        return jsonify({'error': 'Question not found'}), 404
+    if body is not None:
+        result = json.loads(body)
+    else:
+        data_path = store.crosstab_path(survey_id)
+        if data_path is None:
+            return jsonify({'error': 'Survey not found'}), 404
+        result = legacy_crosstab_question(data_path, question_id)
+        if result is None:
+            return jsonify({'error': 'Question not found'}), 404
+
+    return export_response(app, crosstab_question_sheets(result), fmt, f"crosstab_{question_id}")
+
+
+def legacy_crosstab_question(data_path, question_id):
+    """A question from all banners of a legacy (unsharded) crosstab, None if absent"""
+    # Load the whole document
     with open(data_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
@@ -455,10 +470,7 @@ def get_crosstab_question(survey_id, question_id):
                 }
                 break
 
-    if not result['banners']:
-        return jsonify({'error': 'Question not found'}), 404
-
-    return jsonify(result)
+    return result if result['banners'] else None
 
 
 # Cross-question analysis routes
@@ -466,239 +478,317 @@ def get_crosstab_question(survey_id, question_id):
 @login_required
 def view_cross_question(survey_id):
     """View cross-question analysis for raw survey data"""
-    db_path = DATA_FOLDER / 'surveys.db'
-    conn = sqlite3.connect(str(db_path))
-    c = conn.cursor()
-    c.execute('SELECT filename, upload_date, row_count FROM surveys WHERE id = ?', (survey_id,))
-    result = c.fetchone()
-    conn.close()
+    result = db.get_survey(survey_id)
 
     if not result:
         return "Survey not found", 404
 
     survey_info = {
         'id': survey_id,
-        'filename': result[0],
-        'upload_date': result[1],
-        'total_responses': result[2]
+        'filename': result['filename'],
+        'upload_date': result['upload_date'],
+        'total_responses': result['row_count']
     }
 
     return render_template('cross_question.html', survey=survey_info)
 
 
-def clean_question_label(label, col_id):
-    """Clean up question labels for better readability"""
-    import re
+@app.route('/api/cross-question/<survey_id>/metadata')
+@login_required
+def get_cross_question_metadata(survey_id):
+    """Get metadata for cross-question analysis (questions, labels, etc.)"""
+    if not store.exists(survey_id):
+        return jsonify({'error': 'Survey not found'}), 404
+
+    def build():
+        # Surveys stored before the catalog existed
+        return encode_json(build_question_catalog(store.read_meta(survey_id)))
+
+    # The catalog is built at ingest, so this never reads respondent rows
+    version = store.version(survey_id)
+    return json_response(app, request, etag_for(survey_id, version, 'metadata'), version,
+                         path=store.response_path(survey_id, 'metadata'), build=build)
+
+
+def analysis_counts(survey_id, survey_data, target_question, filters):
+    """Counts for one analysis as (counts, cache hit), from the result cache if possible"""
+    def compute():
+        # Labelled questions are answered from the bitmap index without
+        # touching respondent rows, and with at most one filter from the
+        # precomputed pairwise counts without touching the bitmaps either
+        index = store.read_index(survey_id)
+        if index is not None:
+            cube = store.read_contingency(survey_id)
+            if cube is not None:
+                counts = count_with_cube(cube, index, target_question, filters, survey_data['columns'])
+                if counts is not None:
+                    return counts
+            counts = count_with_index(index, target_question, filters, survey_data['columns'])
+            if counts is not None:
+                return counts
+
+        # Load only the target and filter columns
+        needed_columns = [target_question] + [f['question_id'] for f in filters]
+        df = store.read_columns(survey_id, needed_columns)
+        return count_with_rows(df, target_question, filters)
+
+    cache_key = (survey_id, store.version(survey_id), 'analyze', target_question,
+                 canonical_filters(filters, survey_data['columns']))
+    return result_cache.get_entry(cache_key, lambda: compute_pool.run(compute), counts_size)
+
+
+def batch_counts(survey_id, survey_data, target_questions, scenario_filters):
+    """Counts for every scenario and target as (counts, cache hit)"""
+    def compute():
+        # Baselines are shared by every scenario and computed once per target
+        index = store.read_index(survey_id)
+        if index is not None:
+            batch = count_batch_with_index(index, target_questions, scenario_filters,
+                                           survey_data['columns'])
+            if batch is not None:
+                return batch
+
+        needed_columns = list(target_questions)
+        for filters in scenario_filters:
+            needed_columns.extend(f['question_id'] for f in filters)
+        df = store.read_columns(survey_id, needed_columns)
+        return count_batch_with_rows(df, target_questions, scenario_filters)
+
+    cache_key = (survey_id, store.version(survey_id), 'batch', tuple(target_questions),
+                 tuple(canonical_filters(filters, survey_data['columns']) for filters in scenario_filters))
+    return result_cache.get_entry(
+        cache_key, lambda: compute_pool.run(compute),
+        lambda batch: sum(counts_size(counts) for scenario in batch for counts in scenario.values()))
+
+
+def analysis_request(survey_id):
+    """Survey metadata, target and filters of an analyze request, or an error response"""
+    survey_data = store.read_meta(survey_id) if store.exists(survey_id) else None
+
+    if survey_data is None:
+        return None, (jsonify({'error': 'Survey not found'}), 404)
+
+    # Get request parameters
+    params = request.get_json()
+    target_question = params.get('target_question')
+    filters = params.get('filters', [])  # List of {question_id, values}
 
-    if not label or label == col_id:
-        # If no label or label is same as ID, return the ID
-        return col_id
+    if target_question not in survey_data['columns']:
+        return None, (jsonify({'error': 'Target question not found'}), 400)
+    return (survey_data, target_question, filters), None
 
-    # Remove common prefixes
-    label = re.sub(r'^(Q\d+[._-]?\s*)', '', label, flags=re.IGNORECASE)
-    label = re.sub(r'^(Question\s*\d+[._-]?\s*)', '', label, flags=re.IGNORECASE)
-    label = re.sub(r'^(QN\d+[._-]?\s*)', '', label, flags=re.IGNORECASE)
 
-    # Remove trailing dots/dashes
-    label = re.sub(r'[._-]+$', '', label)
+def batch_request(survey_id):
+    """Survey metadata, targets and scenarios of a batch request, or an error response"""
+    survey_data = store.read_meta(survey_id) if store.exists(survey_id) else None
 
-    # Clean up multiple spaces
-    label = re.sub(r'\s+', ' ', label)
+    if survey_data is None:
+        return None, (jsonify({'error': 'Survey not found'}), 404)
 
-    # Trim whitespace
-    label = label.strip()
+    params = request.get_json() or {}
+    target_questions = params.get('target_questions') or [params.get('target_question')]
+    scenarios = params.get('scenarios', [])
 
-    # If label is too short after cleaning, use original
-    if len(label) < 3:
-        return col_id
+    if not scenarios:
+        return None, (jsonify({'error': 'No scenarios provided'}), 400)
 
-    return label
+    for target_question in target_questions:
+        if target_question not in survey_data['columns']:
+            return None, (jsonify({'error': f'Target question not found: {target_question}'}), 400)
+    return (survey_data, target_questions, scenarios), None
 
 
-@app.route('/api/cross-question/<survey_id>/metadata')
+@app.route('/api/cross-question/<survey_id>/analyze', methods=['POST'])
 @login_required
-def get_cross_question_metadata(survey_id):
-    """Get metadata for cross-question analysis (questions, labels, etc.)"""
-    data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
+def analyze_cross_question(survey_id):
+    """Perform cross-question analysis with filters"""
+    parsed, error = analysis_request(survey_id)
+    if error:
+        return error
+    survey_data, target_question, filters = parsed
 
-    if not os.path.exists(data_path):
-        return jsonify({'error': 'Survey not found'}), 404
+    counts, hit = analysis_counts(survey_id, survey_data, target_question, filters)
 
-    with open(data_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    response = jsonify(format_analysis(target_question, counts, survey_data, filters))
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
 
-    # Common metadata column patterns to exclude (exact matches or starts/ends with)
-    metadata_exact = ['id', 'hid', 'respondent_id', 'response_id', 'timestamp',
-                      'start_time', 'end_time', 'duration', 'completion_status',
-                      'source', 'device', 'weight', 'status', 'ip_address',
-                      'location', 'consent']
-
-    metadata_startswith = ['respondent', 'response_', 'timestamp_', 'date_', 'time_',
-                           'duration_', 'completion_', 'weight_', 'status_',
-                           'ip_', 'location_', 'start_', 'end_', 'consent_']
-
-    # Build question list with labels and value options
-    # Only include columns that have value labels (actual questions)
-    questions = []
-    for col in data['columns']:
-        # Check if this column has value labels (indicating it's a question)
-        has_values = col in data['value_labels'] and data['value_labels'][col]
-
-        # Skip if it's likely a metadata column (exact match or starts with pattern)
-        col_lower = col.lower()
-        is_metadata = (col_lower in metadata_exact or
-                      any(col_lower.startswith(pattern) for pattern in metadata_startswith))
-
-        # Only include if it has value labels and isn't metadata
-        if has_values and not is_metadata:
-            label = data['variable_labels'].get(col, col)
-
-            question = {
-                'id': col,
-                'label': label,
-                'values': data['value_labels'].get(col, {}),
-                'value_count': len(data['value_labels'].get(col, {}))
-            }
-            questions.append(question)
-
-    # Sort questions - prioritize key demographic fields at the top
-    priority_fields = ['AGE_GROUP', 'AGE', 'REGION', 'GENDER', 'EDUCATION', 'IDENTITY']
-
-    def natural_sort_key(text):
-        """
-        Convert a string to a list of mixed integers and strings for natural sorting.
-        Example: 'Q7' -> ['Q', 7], 'Q70' -> ['Q', 70]
-        This ensures Q1, Q2, ..., Q9, Q10, Q11, ... Q70, Q71...
-        """
-        import re
-        def atoi(text):
-            return int(text) if text.isdigit() else text
-        return [atoi(c) for c in re.split(r'(\d+)', text)]
-
-    def sort_key(question):
-        col_upper = question['id'].upper()
-        # Check if it's a priority field (exact match or contains the keyword)
-        for i, priority in enumerate(priority_fields):
-            if priority in col_upper or col_upper in priority:
-                return (0, i, [])  # Priority fields first, ordered by priority_fields list
-        # Non-priority fields come after, sorted naturally (Q1, Q2... Q10, Q11... Q70)
-        return (1, 0, natural_sort_key(question['id']))
-
-    questions.sort(key=sort_key)
 
-    return jsonify({
-        'questions': questions,
-        'total_responses': len(data['data'])
-    })
+@app.route('/api/cross-question/<survey_id>/analyze/export', methods=['POST'])
+@login_required
+def export_cross_question(survey_id):
+    """Download an analysis (same body as analyze) as ?format=csv or xlsx"""
+    fmt = export_format(request.args.get('format'))
+    if fmt is None:
+        return jsonify({'error': 'Unsupported export format'}), 400
 
+    parsed, error = analysis_request(survey_id)
+    if error:
+        return error
+    survey_data, target_question, filters = parsed
 
-@app.route('/api/cross-question/<survey_id>/analyze', methods=['POST'])
+    counts, _ = analysis_counts(survey_id, survey_data, target_question, filters)
+    result = format_analysis(target_question, counts, survey_data, filters)
+    return export_response(app, [analysis_sheet(result)], fmt, f"analysis_{target_question}")
+
+
+@app.route('/api/cross-question/<survey_id>/analyze/batch', methods=['POST'])
 @login_required
-def analyze_cross_question(survey_id):
-    """Perform cross-question analysis with filters"""
-    data_path = os.path.join(app.config['DATA_FOLDER'], f"{survey_id}.json")
+def analyze_cross_question_batch(survey_id):
+    """Analyze several filter scenarios (and optionally several targets) at once
+
+    Body: {"target_questions": [...] or "target_question": "...",
+           "scenarios": [{"name": "...", "filters": [{question_id, values}]}]}
+    """
+    parsed, error = batch_request(survey_id)
+    if error:
+        return error
+    survey_data, target_questions, scenarios = parsed
+
+    scenario_filters = [scenario.get('filters', []) for scenario in scenarios]
+    counts_by_scenario, hit = batch_counts(survey_id, survey_data, target_questions, scenario_filters)
+
+    response = jsonify(format_batch(target_questions, scenarios, counts_by_scenario, survey_data))
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+@app.route('/api/cross-question/<survey_id>/analyze/batch/export', methods=['POST'])
+@login_required
+def export_cross_question_batch(survey_id):
+    """Download a scenario comparison (same body as batch) as ?format=csv or xlsx,
+    one sheet per target question"""
+    fmt = export_format(request.args.get('format'))
+    if fmt is None:
+        return jsonify({'error': 'Unsupported export format'}), 400
+
+    parsed, error = batch_request(survey_id)
+    if error:
+        return error
+    survey_data, target_questions, scenarios = parsed
 
-    if not os.path.exists(data_path):
+    scenario_filters = [scenario.get('filters', []) for scenario in scenarios]
+    counts_by_scenario, _ = batch_counts(survey_id, survey_data, target_questions, scenario_filters)
+    batch = format_batch(target_questions, scenarios, counts_by_scenario, survey_data)
+    return export_response(app, batch_sheets(batch), fmt, 'scenario_comparison')
+
+
+@app.route('/api/cross-question/<survey_id>/banner', methods=['POST'])
+@login_required
+def banner_cross_question(survey_id):
+    """Banner crosstab: target answers by the groups of several banner variables
+
+    Body: {"target_questions": [...] or "target_question": "...",
+           "banner_variables": ["AGE_GROUP", "REGION", ...],
+           "filters": [{question_id, values}] (optional)}
+
+    Column percentages use respondents who answered the target as the base.
+    """
+    survey_data = store.read_meta(survey_id) if store.exists(survey_id) else None
+
+    if survey_data is None:
         return jsonify({'error': 'Survey not found'}), 404
 
-    with open(data_path, 'r', encoding='utf-8') as f:
-        survey_data = json.load(f)
+    params = request.get_json() or {}
+    target_questions = params.get('target_questions') or [params.get('target_question')]
+    banner_variables = params.get('banner_variables', [])
+    filters = params.get('filters', [])
 
-    # Get request parameters
-    params = request.get_json()
-    target_question = params.get('target_question')
-    filters = params.get('filters', [])  # List of {question_id, values}
+    if not banner_variables:
+        return jsonify({'error': 'No banner variables provided'}), 400
 
-    # Convert to DataFrame for easier filtering
-    df = pd.DataFrame(survey_data['data'])
-
-    # Apply filters
-    filtered_df = df.copy()
-    for filter_item in filters:
-        question_id = filter_item['question_id']
-        values = filter_item['values']
-        if question_id in filtered_df.columns and values:
-            # Convert values to appropriate types for comparison
-            filtered_df = filtered_df[filtered_df[question_id].isin(values)]
-
-    # Get target question data
-    if target_question not in filtered_df.columns:
-        return jsonify({'error': 'Target question not found'}), 400
-
-    # Calculate value counts for filtered data
-    value_counts_filtered = filtered_df[target_question].value_counts().to_dict()
-
-    # Calculate value counts for unfiltered data (for comparison)
-    value_counts_unfiltered = df[target_question].value_counts().to_dict()
-
-    # Get value labels for display
-    value_labels_raw = survey_data['value_labels'].get(target_question, {})
-
-    # Convert value_labels keys to handle type mismatches (int/float/string)
-    value_labels = {}
-    for k, v in value_labels_raw.items():
-        # Store with multiple key types to handle any mismatch
-        try:
-            # Try as int
-            value_labels[int(float(k))] = v
-            # Try as float
-            value_labels[float(k)] = v
-            # Keep as string
-            value_labels[str(k)] = v
-            # Also store the original key
-            value_labels[k] = v
-        except (ValueError, TypeError):
-            value_labels[k] = v
-
-    # Build result with labels for filtered data
-    results = []
-    all_values = set(value_counts_filtered.keys()) | set(value_counts_unfiltered.keys())
-
-    for value in all_values:
-        filtered_count = value_counts_filtered.get(value, 0)
-        unfiltered_count = value_counts_unfiltered.get(value, 0)
-
-        # Try to find label with multiple type conversions
-        label = None
-        try_values = [value, str(value)]
-        if not isinstance(value, str):
-            try:
-                try_values.append(int(value))
-            except (ValueError, TypeError):
-                pass
-            try:
-                try_values.append(float(value))
-            except (ValueError, TypeError):
-                pass
-
-        for try_value in try_values:
-            if try_value in value_labels:
-                label = value_labels[try_value]
-                break
+    for question_id in list(target_questions) + list(banner_variables):
+        if question_id not in survey_data['columns']:
+            return jsonify({'error': f'Question not found: {question_id}'}), 400
+
+    def compute():
+        mask = None
+        restricting = active_filters(filters, survey_data['columns'])
+        if restricting:
+            filter_df = store.read_columns(survey_id, [f['question_id'] for f in restricting])
+            mask = row_mask(filter_df, restricting)
 
-        if not label:
-            label = str(value)
+        # Integer-coded columns are shared through the survey cache
+        banners = [store.read_codes(survey_id, banner) for banner in banner_variables]
+        banner_sizes = [(codes, len(values)) for codes, values in banners]
 
-        results.append({
-            'value': value,
-            'label': label,
-            'count': int(filtered_count),
-            'percentage': round((filtered_count / len(filtered_df)) * 100, 1) if len(filtered_df) > 0 else 0,
-            'unfiltered_count': int(unfiltered_count),
-            'unfiltered_percentage': round((unfiltered_count / len(df)) * 100, 1) if len(df) > 0 else 0
-        })
+        tables = []
+        for target_question in target_questions:
+            target_codes, target_values = store.read_codes(survey_id, target_question)
+            counts = count_banner(target_codes, len(target_values), banner_sizes, mask)
+            tables.append(format_banner(target_question, target_values, counts, survey_data))
+        return mask, banners, tables
 
-    # Sort by value
-    results.sort(key=lambda x: x['value'])
+    mask, banners, tables = compute_pool.run(compute)
 
     return jsonify({
-        'target_question': target_question,
-        'target_label': survey_data['variable_labels'].get(target_question, target_question),
-        'total_filtered': len(filtered_df),
-        'total_original': len(df),
+        'banner_variables': [
+            {'id': banner, 'label': survey_data.get('variable_labels', {}).get(banner, banner)}
+            for banner in banner_variables
+        ],
+        'columns': banner_columns(banner_variables, [values for _, values in banners], survey_data),
+        'total_filtered': int(mask.sum()) if mask is not None else survey_data['row_count'],
+        'total_original': survey_data['row_count'],
         'filters_applied': filters,
-        'results': results
+        'tables': tables
+    })
+
+
+@app.route('/api/cross-question/<survey_id>/breakdown', methods=['POST'])
+@login_required
+def breakdown_cross_question(survey_id):
+    """Nested breakdown: target answers within every combination of up to three variables
+
+    Body: {"target_question": "...",
+           "breakdown_variables": ["REGION", "AGE_GROUP", ...],
+           "filters": [{question_id, values}] (optional)}
+
+    Tables with more than BREAKDOWN_MAX_CELLS cells (target values times
+    every variable's groups) are refused with a 400.
+    """
+    survey_data = store.read_meta(survey_id) if store.exists(survey_id) else None
+
+    if survey_data is None:
+        return jsonify({'error': 'Survey not found'}), 404
+
+    params = request.get_json() or {}
+    target_question = params.get('target_question')
+    breakdown_variables = params.get('breakdown_variables', [])
+    filters = params.get('filters', [])
+
+    if not 1 <= len(breakdown_variables) <= 3:
+        return jsonify({'error': 'Provide one to three breakdown variables'}), 400
+
+    for question_id in [target_question] + list(breakdown_variables):
+        if question_id not in survey_data['columns']:
+            return jsonify({'error': f'Question not found: {question_id}'}), 400
+
+    def compute():
+        mask = None
+        restricting = active_filters(filters, survey_data['columns'])
+        if restricting:
+            filter_df = store.read_columns(survey_id, [f['question_id'] for f in restricting])
+            mask = row_mask(filter_df, restricting)
+
+        breakdowns = [store.read_codes(survey_id, variable) for variable in breakdown_variables]
+        target_codes, target_values = store.read_codes(survey_id, target_question)
+        counts = count_breakdown(target_codes, len(target_values),
+                                 [(codes, len(values)) for codes, values in breakdowns], mask,
+                                 max_cells=app.config['BREAKDOWN_MAX_CELLS'])
+        return mask, format_breakdown(target_question, target_values, breakdown_variables,
+                                      [values for _, values in breakdowns], counts, survey_data)
+
+    try:
+        mask, table = compute_pool.run(compute)
+    except BreakdownTooLarge as e:
+        return jsonify({'error': str(e)}), 400
+
+    table.update({
+        'total_filtered': int(mask.sum()) if mask is not None else survey_data['row_count'],
+        'total_original': survey_data['row_count'],
+        'filters_applied': filters
     })
+    return jsonify(table)
 
 
 if __name__ == '__main__':
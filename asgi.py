@@ -0,0 +1,22 @@
+"""
+ASGI Entry Point
+Serves the Flask app under an ASGI server (uvicorn, or gunicorn with uvicorn
+workers). a2wsgi's WSGIMiddleware runs every request on its own pool of
+ASGI_THREADS threads, so while one request waits on an analysis the home
+page, listings and metadata keep being answered by the other threads;
+app.py, launcher.py and WSGI servers are unchanged
+
+    uvicorn asgi:asgi_app --host 0.0.0.0 --port 8080 --workers 4
+"""
+
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+
+# Requests handled at once per server process; analyses beyond the compute
+# pool's limits are still answered 503/504 rather than holding a thread
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 16))
+
+asgi_app = WSGIMiddleware(app, workers=ASGI_THREADS)
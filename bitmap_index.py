@@ -0,0 +1,131 @@
+"""
+Bitmap Index for Labelled Survey Questions
+Stores one packed bitmap per distinct coded value of each labelled question so
+filters and target counts can be evaluated with bitwise AND/OR and popcounts
+instead of building DataFrames
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+INDEX_DIR = 'index'
+
+# Number of set bits for every possible byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(packed: np.ndarray, axis: Optional[int] = None):
+    """Count set bits in a packed uint8 array (optionally along an axis)"""
+    return _POPCOUNT[packed].sum(axis=axis, dtype=np.int64)
+
+
+def build_question_bitmaps(series: pd.Series) -> Tuple[List[Any], List[int], np.ndarray]:
+    """Build bitmaps for one question.
+
+    Returns (values, counts, bitmaps) where bitmaps has one packed row per
+    distinct non-null value, in the same order as values.
+    """
+    try:
+        codes, uniques = pd.factorize(series, sort=True)
+    except TypeError:
+        # Mixed types that can't be ordered
+        codes, uniques = pd.factorize(series)
+
+    row_bytes = (len(series) + 7) // 8
+    bitmaps = np.zeros((len(uniques), row_bytes), dtype=np.uint8)
+    for position in range(len(uniques)):
+        bitmaps[position] = np.packbits(codes == position)
+
+    values = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques)).tolist()
+    return values, counts, bitmaps
+
+
+def write_index(index_dir: Path, df: Mapping[str, pd.Series], questions: List[str],
+                file_stems: Dict[str, str],
+                progress: Optional[Callable[[float], None]] = None) -> Dict[str, Dict[str, Any]]:
+    """Write bitmaps for the given questions and return the index descriptor.
+
+    ``df`` is a DataFrame or any mapping of column name to Series; each
+    question's column is fetched once.
+    """
+    index_dir.mkdir(exist_ok=True)
+    entries = {}
+    for position, question in enumerate(questions):
+        if progress:
+            progress(position / max(len(questions), 1))
+        if question not in df:
+            continue
+        values, counts, bitmaps = build_question_bitmaps(df[question])
+        file_stem = file_stems[question]
+        np.save(index_dir / f"{file_stem}.npy", bitmaps)
+        entries[question] = {'file': file_stem, 'values': values, 'counts': counts}
+    return entries
+
+
+class BitmapIndex:
+    """Query view over a survey's bitmap index.
+
+    ``entries`` is the descriptor stored in the survey metadata and
+    ``load_bitmaps`` returns the packed (values x row bytes) array for a
+    question, so bitmaps are only read for questions a query touches.
+    """
+
+    def __init__(self, entries: Dict[str, Dict[str, Any]], row_count: int,
+                 load_bitmaps: Callable[[str], np.ndarray]):
+        self.entries = entries
+        self.row_count = row_count
+        self._load_bitmaps = load_bitmaps
+
+    def has(self, question: str) -> bool:
+        return question in self.entries
+
+    def values(self, question: str) -> List[Any]:
+        return self.entries[question]['values']
+
+    def counts(self, question: str) -> List[int]:
+        return self.entries[question]['counts']
+
+    def bitmaps(self, question: str) -> np.ndarray:
+        return self._load_bitmaps(question)
+
+    def positions(self, question: str, wanted: Iterable[Any]) -> Optional[List[int]]:
+        """Positions (in value order) of the indexed values among ``wanted``.
+
+        Returns None if the values can't be matched exactly against the
+        index (null/NaN values match missing answers, which have no bitmap).
+        """
+        wanted = list(wanted)
+        if any(value is None or value != value for value in wanted):
+            return None
+
+        try:
+            wanted_set = set(wanted)
+        except TypeError:
+            return None
+        return [i for i, value in enumerate(self.values(question)) if value in wanted_set]
+
+    def select(self, question: str, wanted: Iterable[Any]) -> Optional[np.ndarray]:
+        """Packed mask of rows whose answer is any of ``wanted`` (OR).
+
+        Returns None if the request can't be answered exactly from the
+        index (see positions).
+        """
+        positions = self.positions(question, wanted)
+        if positions is None:
+            return None
+
+        bitmaps = self.bitmaps(question)
+        if not positions:
+            return np.zeros(bitmaps.shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(bitmaps[positions], axis=0)
+
+    def count_by_value(self, question: str, mask: Optional[np.ndarray] = None) -> List[int]:
+        """Per-value counts for a question, restricted to ``mask`` if given"""
+        if mask is None:
+            return self.counts(question)
+        return popcount(self.bitmaps(question) & mask, axis=1).tolist()
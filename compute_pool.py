@@ -0,0 +1,100 @@
+"""
+Bounded Compute Pool for Analysis Requests
+Runs the CPU-heavy part of analysis requests (cross-question counts, banner
+tables, table queries) on a fixed set of threads with a queue-depth limit and
+a per-request timeout, so a burst of scenario comparisons is answered with a
+quick 503 instead of tying up every server worker while light pages wait
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+
+class ComputeBusy(Exception):
+    """Raised when the pool is already running and queueing as much as it may"""
+
+
+class ComputeTimeout(Exception):
+    """Raised when a job doesn't finish within the pool's timeout"""
+
+
+class ComputePool:
+    """Thread pool with admission control.
+
+    At most ``max_workers`` jobs run at once and ``max_queue`` more may
+    wait; further submissions are rejected immediately with ComputeBusy.
+    Callers wait up to ``timeout`` seconds for their result. A job that
+    times out keeps its slot until it actually finishes (threads can't be
+    interrupted), so slow work still counts against the limit. With
+    ``max_workers <= 0`` jobs run inline in the calling thread.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, timeout: float = 60.0):
+        self.max_workers = max_workers
+        self.max_queue = max(max_queue, 0)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(max_workers, 1) + self.max_queue)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and return its result"""
+        if self.max_workers <= 0:
+            return fn(*args, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise ComputeBusy('Too many analysis requests in progress')
+
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        self._count('in_flight')
+        future.add_done_callback(self._on_done)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Drops the job if it hasn't started yet
+            future.cancel()
+            self._count('timeouts')
+            raise ComputeTimeout(f'Analysis did not finish within {self.timeout:g}s')
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the pool per worker"""
+        with self._stats_lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'timeout': self.timeout,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='compute')
+            return self._executor
+
+    def _on_done(self, future):
+        self._slots.release()
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
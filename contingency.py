@@ -0,0 +1,97 @@
+"""
+Pairwise Contingency Cube for Labelled Questions
+Precomputes, when a survey is stored, the joint answer counts of every pair of
+labelled questions (as many as fit a value budget) as one compact integer
+matrix, so an analysis with a single filter (or none) is answered by summing a
+few cells instead of scanning the respondent bitmaps
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+CONTINGENCY_FILE = 'contingency.npy'
+
+# Distinct values covered by the cube (it grows with the square of the value
+# count). Questions are added in priority order while they fit; analyses
+# involving a question left out use the bitmap index instead
+CONTINGENCY_MAX_VALUES = 2048
+
+# Unpacked bitmaps are multiplied this many bytes (cells) at a time
+_BLOCK_CELLS = 32 * 1024 * 1024
+
+
+def write_contingency(index_dir: Path, entries: Dict[str, Dict[str, Any]], row_count: int,
+                      load_bitmaps: Callable[[str], np.ndarray],
+                      questions: Optional[List[str]] = None,
+                      max_values: int = CONTINGENCY_MAX_VALUES) -> Optional[Dict[str, Any]]:
+    """Write the joint count matrix of the indexed questions and return its descriptor.
+
+    ``questions`` lists the indexed questions in priority order (index order
+    if None); each is included if its values still fit within
+    ``max_values``, so one wide question doesn't exclude the rest. Rows and
+    columns follow the included questions, each spanning one slot per
+    distinct value (the bitmap index's value order), so cell (a, b) counts
+    respondents who gave answer a and answer b. The diagonal block of a
+    question holds its own value counts. Returns None (and writes nothing)
+    if no question fits.
+    """
+    offsets = {}
+    total_values = 0
+    for question in (list(entries) if questions is None else questions):
+        value_count = len(entries[question]['values'])
+        if value_count and total_values + value_count <= max_values:
+            offsets[question] = total_values
+            total_values += value_count
+    if not offsets:
+        return None
+    questions = list(offsets)
+
+    # One-hot rows for each block of respondents; float32 products are exact
+    # because a block has far fewer than 2**24 rows
+    block_bytes = max(_BLOCK_CELLS // (8 * total_values), 1)
+    row_bytes = (row_count + 7) // 8
+    joint = np.zeros((total_values, total_values), dtype=np.int64)
+    bitmaps = [load_bitmaps(question) for question in questions]
+    for start in range(0, row_bytes, block_bytes):
+        one_hot = np.unpackbits(
+            np.concatenate([b[:, start:start + block_bytes] for b in bitmaps]), axis=1)
+        one_hot = one_hot.astype(np.float32)
+        joint += np.rint(one_hot @ one_hot.T).astype(np.int64)
+
+    dtype = np.uint16 if row_count <= np.iinfo(np.uint16).max else np.uint32
+    np.save(index_dir / CONTINGENCY_FILE, joint.astype(dtype))
+    return {'file': CONTINGENCY_FILE, 'offsets': offsets}
+
+
+class ContingencyCube:
+    """Lookup view over a survey's joint count matrix.
+
+    ``descriptor`` is the one stored in the survey metadata, ``entries``
+    the bitmap index descriptor it was built from and ``load_matrix``
+    returns the stored matrix (only read when a lookup needs it).
+    """
+
+    def __init__(self, descriptor: Dict[str, Any], entries: Dict[str, Dict[str, Any]],
+                 load_matrix: Callable[[], np.ndarray]):
+        self.offsets = descriptor['offsets']
+        self.entries = entries
+        self._load_matrix = load_matrix
+
+    def has(self, question: str) -> bool:
+        return question in self.offsets
+
+    def joint(self, question: str, other: str, positions: Optional[List[int]] = None) -> np.ndarray:
+        """Per-value counts of ``question`` among respondents who gave any of
+        ``other``'s values at ``positions`` (all of them if None)"""
+        start = self.offsets[question]
+        rows = slice(start, start + len(self.entries[question]['values']))
+        other_start = self.offsets[other]
+        if positions is None:
+            columns = slice(other_start, other_start + len(self.entries[other]['values']))
+            block = self._load_matrix()[rows, columns]
+        else:
+            block = self._load_matrix()[rows][:, [other_start + p for p in positions]]
+        return block.sum(axis=1, dtype=np.int64)
@@ -0,0 +1,496 @@
+"""
+Cross-Question Analysis
+Counts a target question's answers under a set of filters, from the pairwise
+contingency cube or bitmap index (labelled questions) or by filtering the
+respondent rows
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bitmap_index import BitmapIndex, popcount
+from contingency import ContingencyCube
+
+
+class AnalysisCounts(NamedTuple):
+    """Raw counts behind an analysis result"""
+    filtered: Dict[Any, int]
+    unfiltered: Dict[Any, int]
+    total_filtered: int
+    total_original: int
+
+
+def active_filters(filters: List[Dict], columns) -> List[Dict]:
+    """Filters that actually restrict rows (known question, non-empty values)"""
+    return [f for f in filters if f['question_id'] in columns and f['values']]
+
+
+def canonical_filters(filters: List[Dict], columns) -> Tuple:
+    """Hashable form of a filter list; equivalent filter lists give equal keys.
+
+    Filters that don't restrict rows are dropped, the rest are ordered by
+    question, and each filter's values are de-duplicated, type-normalized
+    (1 and 1.0 select the same rows) and sorted.
+    """
+    canonical = set()
+    for filter_item in active_filters(filters, columns):
+        values = tuple(sorted({_canonical_value(value) for value in filter_item['values']}))
+        canonical.add((filter_item['question_id'], values))
+    return tuple(sorted(canonical))
+
+
+def _canonical_value(value: Any) -> Tuple:
+    # Tagged so values of different types never compare with each other
+    if value is None:
+        return ('none',)
+    if isinstance(value, bool):
+        return ('bool', value)
+    if isinstance(value, (int, float)):
+        if value != value:
+            return ('nan',)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return ('number', value)
+    if isinstance(value, str):
+        return ('str', value)
+    return ('json', json.dumps(value, sort_keys=True, default=str))
+
+
+def counts_size(counts: AnalysisCounts) -> int:
+    """Approximate footprint of AnalysisCounts, for result cache budgets"""
+    entries = len(counts.filtered) + len(counts.unfiltered)
+    return sys.getsizeof(counts.filtered) + sys.getsizeof(counts.unfiltered) + entries * 64
+
+
+def count_with_index(index: BitmapIndex, target_question: str,
+                     filters: List[Dict], columns) -> Optional[AnalysisCounts]:
+    """Evaluate filters with bitmaps: OR within a question, AND across questions.
+
+    Returns None when the target or a filter question isn't indexed (or the
+    filter values can't be matched exactly), so the caller can fall back to
+    the row engine.
+    """
+    if not index.has(target_question):
+        return None
+
+    mask = None
+    for filter_item in active_filters(filters, columns):
+        question_id = filter_item['question_id']
+        if not index.has(question_id):
+            return None
+        question_mask = index.select(question_id, filter_item['values'])
+        if question_mask is None:
+            return None
+        mask = question_mask if mask is None else mask & question_mask
+
+    values = index.values(target_question)
+    unfiltered_counts = index.counts(target_question)
+    filtered_counts = index.count_by_value(target_question, mask)
+    total_filtered = index.row_count if mask is None else int(popcount(mask))
+
+    return AnalysisCounts(
+        filtered={v: c for v, c in zip(values, filtered_counts) if c},
+        unfiltered=dict(zip(values, unfiltered_counts)),
+        total_filtered=total_filtered,
+        total_original=index.row_count
+    )
+
+
+def count_with_cube(cube: ContingencyCube, index: BitmapIndex, target_question: str,
+                    filters: List[Dict], columns) -> Optional[AnalysisCounts]:
+    """Answer an analysis with at most one filter from the pairwise joint counts.
+
+    Gives the same counts as count_with_index without reading any bitmaps.
+    Returns None when it can't (several filters, a question outside the
+    cube, values that can't be matched exactly), so the caller falls back.
+    """
+    if not cube.has(target_question):
+        return None
+
+    applied = active_filters(filters, columns)
+    if len(applied) > 1:
+        return None
+
+    values = index.values(target_question)
+    unfiltered_counts = index.counts(target_question)
+    filtered_counts = unfiltered_counts
+    total_filtered = index.row_count
+    if applied:
+        question_id = applied[0]['question_id']
+        if not cube.has(question_id):
+            return None
+        positions = index.positions(question_id, applied[0]['values'])
+        if positions is None:
+            return None
+        filtered_counts = cube.joint(target_question, question_id, positions).tolist()
+        question_counts = index.counts(question_id)
+        total_filtered = sum(question_counts[position] for position in positions)
+
+    return AnalysisCounts(
+        filtered={v: c for v, c in zip(values, filtered_counts) if c},
+        unfiltered=dict(zip(values, unfiltered_counts)),
+        total_filtered=total_filtered,
+        total_original=index.row_count
+    )
+
+
+def count_batch_with_index(index: BitmapIndex, target_questions: List[str],
+                           scenario_filters: List[List[Dict]], columns,
+                           chunk_bytes: int = 65536) -> Optional[List[Dict[str, AnalysisCounts]]]:
+    """Evaluate every scenario against every target in one pass over the bitmaps.
+
+    Scenario masks are stacked into a (scenarios x row bytes) matrix and
+    ANDed against each target's (values x row bytes) bitmaps, chunked over
+    the row bytes to bound temporary memory. Returns one {target: counts}
+    dict per scenario, or None if anything isn't indexed.
+    """
+    if not all(index.has(target) for target in target_questions):
+        return None
+
+    row_bytes = (index.row_count + 7) // 8
+    masks = np.full((len(scenario_filters), row_bytes), 0xFF, dtype=np.uint8)
+    unrestricted = []
+    for position, filters in enumerate(scenario_filters):
+        restricting = active_filters(filters, columns)
+        unrestricted.append(not restricting)
+        for filter_item in restricting:
+            question_id = filter_item['question_id']
+            if not index.has(question_id):
+                return None
+            question_mask = index.select(question_id, filter_item['values'])
+            if question_mask is None:
+                return None
+            masks[position] &= question_mask
+
+    # Padding bits past the last row are zero in every bitmap, so an
+    # all-ones mask only needs trimming for the totals
+    totals = [index.row_count if free else int(popcount(mask))
+              for free, mask in zip(unrestricted, masks)]
+
+    per_target = {}
+    for target in target_questions:
+        bitmaps = index.bitmaps(target)
+        counts = np.zeros((len(scenario_filters), bitmaps.shape[0]), dtype=np.int64)
+        for start in range(0, row_bytes, chunk_bytes):
+            stop = start + chunk_bytes
+            counts += popcount(masks[:, None, start:stop] & bitmaps[None, :, start:stop], axis=2)
+        per_target[target] = counts
+
+    results = []
+    for position in range(len(scenario_filters)):
+        scenario = {}
+        for target in target_questions:
+            values = index.values(target)
+            scenario[target] = AnalysisCounts(
+                filtered={v: int(c) for v, c in zip(values, per_target[target][position]) if c},
+                unfiltered=dict(zip(values, index.counts(target))),
+                total_filtered=totals[position],
+                total_original=index.row_count
+            )
+        results.append(scenario)
+    return results
+
+
+def count_batch_with_rows(df: pd.DataFrame, target_questions: List[str],
+                          scenario_filters: List[List[Dict]]) -> List[Dict[str, AnalysisCounts]]:
+    """Row-engine batch: one mask per scenario, targets coded and baselined once"""
+    masks = np.stack([row_mask(df, filters) for filters in scenario_filters])
+    totals = masks.sum(axis=1)
+
+    coded = {}
+    for target in target_questions:
+        codes, uniques = pd.factorize(df[target])
+        values = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+        answered = codes >= 0
+        baseline = dict(zip(values, np.bincount(codes[answered], minlength=len(values)).tolist()))
+        coded[target] = (codes, answered, values, baseline)
+
+    results = []
+    for position in range(len(scenario_filters)):
+        scenario = {}
+        for target in target_questions:
+            codes, answered, values, baseline = coded[target]
+            selected = codes[masks[position] & answered]
+            filtered = np.bincount(selected, minlength=len(values))
+            scenario[target] = AnalysisCounts(
+                filtered={v: int(c) for v, c in zip(values, filtered) if c},
+                unfiltered=baseline,
+                total_filtered=int(totals[position]),
+                total_original=len(df)
+            )
+        results.append(scenario)
+    return results
+
+
+def row_mask(df: pd.DataFrame, filters: List[Dict]) -> np.ndarray:
+    """Boolean row mask for filters: isin within a question, AND across questions"""
+    mask = np.ones(len(df), dtype=bool)
+    for filter_item in active_filters(filters, df.columns):
+        mask &= df[filter_item['question_id']].isin(filter_item['values']).to_numpy()
+    return mask
+
+
+def count_with_rows(df: pd.DataFrame, target_question: str, filters: List[Dict]) -> AnalysisCounts:
+    """Evaluate filters by successive isin masks over the respondent rows"""
+    mask = row_mask(df, filters)
+
+    target = df[target_question]
+    return AnalysisCounts(
+        filtered=target[mask].value_counts().to_dict(),
+        unfiltered=target.value_counts().to_dict(),
+        total_filtered=int(mask.sum()),
+        total_original=len(df)
+    )
+
+
+def count_banner(target_codes: np.ndarray, target_size: int,
+                 banners: List[Tuple[np.ndarray, int]],
+                 mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Contingency counts of a target against banner groups in one bincount.
+
+    Column 0 is the Total column, followed by each banner variable's groups
+    in order. Each (target code, column) pair maps to a single combined key
+    ``target_code * n_columns + column`` so the whole table is one bincount.
+    Returns a (target values x columns) int64 array.
+    """
+    n_columns = 1 + sum(size for _, size in banners)
+
+    answered = target_codes >= 0
+    if mask is not None:
+        answered &= mask
+
+    keys = [target_codes[answered].astype(np.int64) * n_columns]
+    offset = 1
+    for codes, size in banners:
+        in_group = answered & (codes >= 0)
+        keys.append(target_codes[in_group].astype(np.int64) * n_columns + offset + codes[in_group])
+        offset += size
+
+    counts = np.bincount(np.concatenate(keys), minlength=target_size * n_columns)
+    return counts.reshape(target_size, n_columns)
+
+
+class BreakdownTooLarge(ValueError):
+    """Raised when a breakdown would have more cells than allowed"""
+
+
+def count_breakdown(target_codes: np.ndarray, target_size: int,
+                    breakdowns: List[Tuple[np.ndarray, int]],
+                    mask: Optional[np.ndarray] = None,
+                    max_cells: Optional[int] = None) -> np.ndarray:
+    """Counts of a target within every combination of nested breakdown groups.
+
+    Each respondent who answered the target and every breakdown variable
+    maps to one combined key ``((target_code * n1 + code1) * n2 + code2) ...``
+    so the whole table is a single bincount. Returns an int64 array shaped
+    (target values, n1, n2, ...). Raises BreakdownTooLarge before counting
+    if the table would have more than ``max_cells`` cells.
+    """
+    shape = (target_size,) + tuple(size for _, size in breakdowns)
+    n_cells = int(np.prod(shape, dtype=np.int64))
+    if max_cells is not None and n_cells > max_cells:
+        raise BreakdownTooLarge(f'Breakdown would have {n_cells} cells (limit {max_cells})')
+
+    answered = target_codes >= 0
+    if mask is not None:
+        answered &= mask
+    for codes, _ in breakdowns:
+        answered &= codes >= 0
+
+    keys = target_codes[answered].astype(np.int64)
+    for codes, size in breakdowns:
+        keys = keys * size + codes[answered]
+
+    return np.bincount(keys, minlength=n_cells).reshape(shape)
+
+
+def format_breakdown(target_question: str, target_values: List[Any],
+                     breakdown_variables: List[str], breakdown_values: List[List[Any]],
+                     counts: np.ndarray, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a nested breakdown table: one cell per combination of groups.
+
+    Cells are listed with the last breakdown variable varying fastest. Each
+    cell carries its base (respondents in the cell who answered the
+    target), counts per target answer, column percentages (share of the
+    cell) and row percentages (share of everyone giving that answer).
+    """
+    value_labels = _label_lookup(meta.get('value_labels', {}).get(target_question, {}))
+    variable_labels = meta.get('variable_labels', {})
+    group_labels = [_label_lookup(meta.get('value_labels', {}).get(variable, {}))
+                    for variable in breakdown_variables]
+
+    # (target values, cells) view; empty rows/cells divide by 1 and give 0%
+    flat = counts.reshape(len(target_values), -1)
+    bases = flat.sum(axis=0)
+    row_totals = flat.sum(axis=1)
+    column_percentages = np.round(flat / np.maximum(bases, 1) * 100, 1)
+    row_percentages = np.round(flat / np.maximum(row_totals, 1)[:, None] * 100, 1)
+
+    cells = []
+    for position, groups in enumerate(np.ndindex(*counts.shape[1:])):
+        values = [breakdown_values[level][code] for level, code in enumerate(groups)]
+        cells.append({
+            'values': values,
+            'labels': [_find_label(value, labels) for value, labels in zip(values, group_labels)],
+            'base': int(bases[position]),
+            'counts': flat[:, position].tolist(),
+            'column_percentages': column_percentages[:, position].tolist(),
+            'row_percentages': row_percentages[:, position].tolist()
+        })
+
+    return {
+        'target_question': target_question,
+        'target_label': variable_labels.get(target_question, target_question),
+        'breakdown_variables': [
+            {'id': variable, 'label': variable_labels.get(variable, variable), 'values': [
+                {'value': value, 'label': _find_label(value, labels)} for value in values]}
+            for variable, values, labels in zip(breakdown_variables, breakdown_values, group_labels)
+        ],
+        'rows': [
+            {'value': value, 'label': _find_label(value, value_labels), 'total': int(total)}
+            for value, total in zip(target_values, row_totals)
+        ],
+        'total': int(bases.sum()),
+        'cells': cells
+    }
+
+
+def format_banner(target_question: str, target_values: List[Any], counts: np.ndarray,
+                  meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Build one banner table: rows are target answers, columns are banner groups"""
+    value_labels = _label_lookup(meta.get('value_labels', {}).get(target_question, {}))
+    bases = counts.sum(axis=0)
+    # Empty columns have all-zero counts, so dividing by 1 yields 0%
+    percentages = counts / np.maximum(bases, 1) * 100
+
+    rows = []
+    for position, value in enumerate(target_values):
+        rows.append({
+            'value': value,
+            'label': _find_label(value, value_labels),
+            'counts': counts[position].tolist(),
+            'column_percentages': np.round(percentages[position], 1).tolist()
+        })
+
+    return {
+        'target_question': target_question,
+        'target_label': meta.get('variable_labels', {}).get(target_question, target_question),
+        'bases': bases.tolist(),
+        'rows': rows
+    }
+
+
+def banner_columns(banner_variables: List[str], banner_values: List[List[Any]],
+                   meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Column headers matching count_banner's layout (Total first)"""
+    columns = [{'banner': None, 'value': None, 'label': 'Total'}]
+    for banner, values in zip(banner_variables, banner_values):
+        value_labels = _label_lookup(meta.get('value_labels', {}).get(banner, {}))
+        for value in values:
+            columns.append({'banner': banner, 'value': value, 'label': _find_label(value, value_labels)})
+    return columns
+
+
+def _label_lookup(value_labels_raw: Dict) -> Dict:
+    """Index value labels under int/float/str keys to absorb type mismatches"""
+    value_labels = {}
+    for k, v in value_labels_raw.items():
+        # Store with multiple key types to handle any mismatch
+        try:
+            # Try as int
+            value_labels[int(float(k))] = v
+            # Try as float
+            value_labels[float(k)] = v
+            # Keep as string
+            value_labels[str(k)] = v
+            # Also store the original key
+            value_labels[k] = v
+        except (ValueError, TypeError):
+            value_labels[k] = v
+    return value_labels
+
+
+def _find_label(value, value_labels: Dict) -> str:
+    """Try to find a label with multiple type conversions"""
+    try_values = [value, str(value)]
+    if not isinstance(value, str):
+        try:
+            try_values.append(int(value))
+        except (ValueError, TypeError):
+            pass
+        try:
+            try_values.append(float(value))
+        except (ValueError, TypeError):
+            pass
+
+    for try_value in try_values:
+        if try_value in value_labels:
+            label = value_labels[try_value]
+            if label:
+                return label
+            break
+
+    return str(value)
+
+
+def format_analysis(target_question: str, counts: AnalysisCounts,
+                    meta: Dict[str, Any], filters: List[Dict]) -> Dict[str, Any]:
+    """Build the analyze response payload from raw counts"""
+    value_labels = _label_lookup(meta.get('value_labels', {}).get(target_question, {}))
+
+    # Build result with labels for filtered data
+    results = []
+    all_values = set(counts.filtered.keys()) | set(counts.unfiltered.keys())
+
+    for value in all_values:
+        filtered_count = counts.filtered.get(value, 0)
+        unfiltered_count = counts.unfiltered.get(value, 0)
+
+        results.append({
+            'value': value,
+            'label': _find_label(value, value_labels),
+            'count': int(filtered_count),
+            'percentage': round((filtered_count / counts.total_filtered) * 100, 1) if counts.total_filtered > 0 else 0,
+            'unfiltered_count': int(unfiltered_count),
+            'unfiltered_percentage': round((unfiltered_count / counts.total_original) * 100, 1) if counts.total_original > 0 else 0
+        })
+
+    # Sort by value
+    results.sort(key=lambda x: x['value'])
+
+    return {
+        'target_question': target_question,
+        'target_label': meta.get('variable_labels', {}).get(target_question, target_question),
+        'total_filtered': counts.total_filtered,
+        'total_original': counts.total_original,
+        'filters_applied': filters,
+        'results': results
+    }
+
+
+def format_batch(target_questions: List[str], scenarios: List[Dict],
+                 counts_by_scenario: List[Dict[str, AnalysisCounts]],
+                 meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the batch analyze response payload from per-scenario counts"""
+    results = []
+    for position, (scenario, counts) in enumerate(zip(scenarios, counts_by_scenario)):
+        scenario_filters = scenario.get('filters', [])
+        results.append({
+            'name': scenario.get('name', f'Scenario {position + 1}'),
+            'results': {
+                target_question: format_analysis(target_question, counts[target_question],
+                                                 meta, scenario_filters)
+                for target_question in target_questions
+            }
+        })
+
+    return {
+        'target_questions': target_questions,
+        'total_original': meta['row_count'],
+        'scenarios': results
+    }
@@ -3,36 +3,122 @@ Crosstab Parser for Survey Detailed Tables
 Parses Environics-style banner/crosstab Excel files
 """
 
+import numpy as np
 import pandas as pd
 import json
 import re
-from typing import Dict, List, Tuple, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Any
+
+
+# Rows in a question block that are separators or notes, not responses
+QUESTION_SKIP_PATTERNS = ['====', '----', 'Comparison Groups', 'Paired', 'Uppercase', 'SUBSAMPLE']
+INDICES_SKIP_PATTERNS = ['====', '----', 'Comparison Groups', 'Paired', 'Uppercase', 'Total']
+
+
+def _convert_cell(cell: Any) -> Any:
+    """Convert one table cell: percent text kept, numbers as float, blanks as None"""
+    if pd.isna(cell):
+        return None
+    if isinstance(cell, str) and '%' in cell:
+        return cell
+    try:
+        return float(cell)
+    except (ValueError, TypeError):
+        return str(cell)
+
+
+_convert_cells = np.frompyfunc(_convert_cell, 1, 1)
+
+
+def _parse_sheet_in_worker(file_path: str, sheet_name: str) -> Dict[str, Any]:
+    """Process pool entry point: read and parse one sheet through the
+    worker's own read-only workbook"""
+    with CrosstabParser(file_path) as parser:
+        return parser.parse_banner(sheet_name)
 
 
 class CrosstabParser:
-    """Parse survey crosstab/banner tables into structured data"""
+    """Parse survey crosstab/banner tables into structured data.
 
-    def __init__(self, file_path: str):
+    Sheets are parsed on first use and kept, so repeated lookups and
+    searches don't read the workbook again. ``max_workers`` > 1 lets
+    parse_all_sheets read and parse sheets in that many processes; by
+    default they are parsed inline.
+    """
+
+    def __init__(self, file_path: str, max_workers: Optional[int] = None,
+                 xl_file: Optional[pd.ExcelFile] = None):
         self.file_path = file_path
-        self.xl_file = pd.ExcelFile(file_path)
+        self.max_workers = max_workers
+        # An already-open workbook (e.g. from file type detection) is reused
+        self._xl_file = xl_file
+        # Parsed banners by sheet name, filled in as sheets are first used
         self.sheets = {}
-        self.questions = []
+        # Banner -> question id -> position in that banner's questions
+        self._question_index: Dict[str, Dict[str, int]] = {}
+        # (id, text, lowercased text) of the first banner's questions
+        self._search_entries: Optional[List[Tuple[str, str, str]]] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def xl_file(self) -> pd.ExcelFile:
+        """Workbook handle, opened once on first use"""
+        if self._xl_file is None:
+            self._xl_file = pd.ExcelFile(self.file_path)
+        return self._xl_file
+
+    def close(self):
+        """Release the workbook handle"""
+        if self._xl_file is not None:
+            self._xl_file.close()
+            self._xl_file = None
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return self.xl_file.sheet_names
+
+    def read_sheet(self, sheet_name: str) -> pd.DataFrame:
+        """Read one sheet through the already-open workbook"""
+        return self.xl_file.parse(sheet_name=sheet_name, header=None)
 
     def parse_all_sheets(self) -> Dict[str, Any]:
-        """Parse all sheets in the Excel file"""
+        """Parse all sheets in the Excel file
+
+        Sheets that haven't been parsed yet are parsed inline, or with
+        ``max_workers`` > 1 across a process pool where each worker reads its
+        own sheet from the file and results are merged back in sheet order.
+        Parsed banners are kept, so later calls (and lookups) reuse them.
+        """
+        sheet_names = self.sheet_names
         result = {
             'metadata': {
                 'filename': self.file_path.split('/')[-1],
-                'sheets': self.xl_file.sheet_names,
+                'sheets': sheet_names,
                 'total_questions': 0
             },
             'banners': {}
         }
 
-        for sheet_name in self.xl_file.sheet_names:
-            print(f"Parsing {sheet_name}...")
-            banner_data = self.parse_banner(sheet_name)
-            result['banners'][sheet_name] = banner_data
+        pending = [sheet_name for sheet_name in sheet_names if sheet_name not in self.sheets]
+
+        max_workers = min(self.max_workers or 1, len(pending))
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                banners = executor.map(_parse_sheet_in_worker, [self.file_path] * len(pending), pending)
+                self.sheets.update(zip(pending, banners))
+        else:
+            for sheet_name in pending:
+                print(f"Parsing {sheet_name}...")
+                self.parse_banner(sheet_name)
+
+        for sheet_name in sheet_names:
+            result['banners'][sheet_name] = self.sheets[sheet_name]
 
         # Get total questions from first banner
         if result['banners']:
@@ -42,26 +128,33 @@ class CrosstabParser:
         return result
 
     def parse_banner(self, sheet_name: str) -> Dict[str, Any]:
-        """Parse a single banner sheet"""
-        df = pd.read_excel(self.file_path, sheet_name=sheet_name, header=None)
+        """Parse a single banner sheet (once; later calls return the same banner)"""
+        if sheet_name not in self.sheets:
+            self.sheets[sheet_name] = self.parse_sheet_frame(sheet_name, self.read_sheet(sheet_name))
+        return self.sheets[sheet_name]
 
+    def parse_sheet_frame(self, sheet_name: str, df: pd.DataFrame) -> Dict[str, Any]:
+        """Parse a banner sheet that has already been read into a DataFrame"""
         # Find header information
         demographic_headers, header_row_idx = self._find_demographic_headers(df)
         column_labels, label_row_idx = self._find_column_labels(df)
 
+        # Label every row of column 0 once (question/boundary/response/indices)
+        row_labels = self._classify_rows(df)
+
         # Find all questions
-        questions = self._find_questions(df)
+        questions = self._find_questions(df, row_labels)
 
         # Parse each question's data
         parsed_questions = []
         for q in questions:
             question_data = self._parse_question_data(
-                df, q, demographic_headers, column_labels
+                df, q, demographic_headers, column_labels, row_labels
             )
             parsed_questions.append(question_data)
 
         # Check for INDICES TABLE
-        indices_data = self._find_and_parse_indices(df, demographic_headers, column_labels)
+        indices_data = self._find_and_parse_indices(df, demographic_headers, column_labels, row_labels)
         if indices_data:
             parsed_questions.append(indices_data)
 
@@ -170,20 +263,73 @@ class CrosstabParser:
 
         return [], -1
 
-    def _find_questions(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+    def _classify_rows(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Label column 0 of every row in one vectorized pass
+
+        Returns boolean arrays (one entry per row) for question rows, block
+        boundaries, response rows and INDICES TABLE rows, plus the stripped
+        cell text.
+        """
+        first_col = df.iloc[:, 0] if df.shape[1] else pd.Series([], dtype=object)
+        present = first_col.notna()
+
+        raw_text = pd.Series('', index=first_col.index, dtype=object)
+        raw_text[present] = first_col[present].astype(str).astype(object)
+        stripped = raw_text.str.strip()
+        is_text = present & (first_col.astype(object) == raw_text)
+
+        question_pattern = r'^Q\d+\.'
+        response_skip = '|'.join(re.escape(p) for p in QUESTION_SKIP_PATTERNS)
+        indices_skip = '|'.join(re.escape(p) for p in INDICES_SKIP_PATTERNS)
+
+        return {
+            'text': stripped.to_numpy(),
+            # Question headers: text cells whose stripped text is "Q<n>."
+            'question': (is_text & stripped.str.match(question_pattern)).to_numpy(),
+            # A question block ends at the next (unstripped) "Q<n>." row or the INDICES TABLE
+            'boundary': (present & (raw_text.str.match(question_pattern)
+                                    | raw_text.str.contains('INDICES TABLE', regex=False))).to_numpy(),
+            'indices_marker': (present & stripped.str.contains('INDICES TABLE', regex=False)).to_numpy(),
+            'response': (present & (stripped != '') & ~stripped.str.contains(response_skip)).to_numpy(),
+            'index_row': (present & ~stripped.str.contains(indices_skip)
+                          & (stripped.str.contains('Index', regex=False) | (stripped == 'SUBSAMPLE'))).to_numpy(),
+        }
+
+    def _extract_values(self, df: pd.DataFrame, rows: np.ndarray,
+                        demographics: List[Dict]) -> List[Tuple[int, List[Any]]]:
+        """Pull the demographic columns for the given rows as one block
+
+        Returns (row, values) pairs for rows with at least one non-empty
+        value. Percent strings are kept as text, other cells become floats
+        (or text if not numeric) and empty cells become None.
+        """
+        if len(rows) == 0 or not demographics:
+            return []
+
+        column_positions = [demo['column_index'] for demo in demographics]
+        available = [i for i, col_idx in enumerate(column_positions) if col_idx < df.shape[1]]
+
+        values = np.full((len(rows), len(demographics)), None, dtype=object)
+        keep = np.zeros(len(rows), dtype=bool)
+        if available:
+            block = df.iloc[rows, [column_positions[i] for i in available]].to_numpy(dtype=object)
+            missing = pd.isna(block)
+            values[:, available] = _convert_cells(block)
+            keep = (~missing).any(axis=1)
+
+        return [(int(row), values[i].tolist()) for i, row in enumerate(rows) if keep[i]]
+
+    def _find_questions(self, df: pd.DataFrame, row_labels: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Find all question rows in the dataframe"""
         questions = []
 
-        for idx, row in df.iterrows():
-            if pd.notna(row[0]) and isinstance(row[0], str):
-                text = str(row[0]).strip()
-                # Look for question pattern: Q followed by number and period
-                if re.match(r'^Q\d+\.', text):
-                    questions.append({
-                        'row': idx,
-                        'text': text,
-                        'id': self._extract_question_id(text)
-                    })
+        for idx in np.flatnonzero(row_labels['question']):
+            text = row_labels['text'][idx]
+            questions.append({
+                'row': int(idx),
+                'text': text,
+                'id': self._extract_question_id(text)
+            })
 
         return questions
 
@@ -193,67 +339,24 @@ class CrosstabParser:
         return match.group(1) if match else 'Unknown'
 
     def _find_and_parse_indices(self, df: pd.DataFrame, demographics: List[str],
-                                 column_labels: List[str]) -> Dict[str, Any]:
+                                 column_labels: List[str], row_labels: Dict[str, Any]) -> Dict[str, Any]:
         """Find and parse the INDICES TABLE section"""
         # Look for "INDICES TABLE" marker
-        indices_row = -1
-        for idx in range(len(df)):
-            if pd.notna(df.iloc[idx, 0]):
-                text = str(df.iloc[idx, 0]).strip()
-                if 'INDICES TABLE' in text:
-                    indices_row = idx
-                    break
-
-        if indices_row == -1:
+        markers = np.flatnonzero(row_labels['indices_marker'])
+        if len(markers) == 0:
             return None
-
-        # Parse indices similar to questions
-        response_data = []
+        indices_row = int(markers[0])
 
         # Start parsing from a few rows after the INDICES TABLE marker
         start_row = indices_row + 5
         end_row = min(start_row + 50, len(df))  # Look ahead up to 50 rows
 
-        for idx in range(start_row, end_row):
-            row = df.iloc[idx]
-
-            if pd.notna(row[0]):
-                response_text = str(row[0]).strip()
-
-                # Skip certain rows
-                skip_patterns = [
-                    '====', '----', 'Comparison Groups',
-                    'Paired', 'Uppercase', 'Total'
-                ]
-                if any(pattern in response_text for pattern in skip_patterns):
-                    continue
-
-                # Check if this looks like an index name (contains "Index")
-                if 'Index' in response_text or response_text in ['SUBSAMPLE']:
-                    # Extract values for each demographic column
-                    values = []
-                    for demo in demographics:
-                        col_idx = demo['column_index']
-                        if col_idx < len(row):
-                            cell_value = row[col_idx]
-                            try:
-                                if pd.notna(cell_value):
-                                    if isinstance(cell_value, str) and '%' in cell_value:
-                                        values.append(cell_value)
-                                    else:
-                                        values.append(float(cell_value))
-                                else:
-                                    values.append(None)
-                            except (ValueError, TypeError):
-                                values.append(str(cell_value) if pd.notna(cell_value) else None)
-                        else:
-                            values.append(None)
-
-                    if values and any(v is not None for v in values):
-                        response_data.append({
-                            'response': response_text,
-                            'values': values
-                        })
+        # Rows that look like an index name (contain "Index") or SUBSAMPLE
+        candidate_rows = start_row + np.flatnonzero(row_labels['index_row'][start_row:end_row])
+        response_data = [
+            {'response': row_labels['text'][row], 'values': values}
+            for row, values in self._extract_values(df, candidate_rows, demographics)
+        ]
 
         if not response_data:
             return None
@@ -266,64 +369,26 @@ class CrosstabParser:
         }
 
     def _parse_question_data(self, df: pd.DataFrame, question: Dict,
-                            demographics: List[str], column_labels: List[str]) -> Dict[str, Any]:
+                            demographics: List[str], column_labels: List[str],
+                            row_labels: Dict[str, Any]) -> Dict[str, Any]:
         """Parse data for a specific question"""
         start_row = question['row']
 
         # Find the end of this question's data (next question, or INDICES TABLE)
         end_row = start_row + 100  # Default lookahead
-        for idx in range(start_row + 1, min(start_row + 150, len(df))):
-            row_text = str(df.iloc[idx, 0]) if pd.notna(df.iloc[idx, 0]) else ''
-            # Stop at next question OR at INDICES TABLE
-            if re.match(r'^Q\d+\.', row_text) or 'INDICES TABLE' in row_text:
-                end_row = idx
-                break
-
-        # Extract response options and their values
-        response_data = []
-
-        for idx in range(start_row + 1, min(end_row, len(df))):
-            row = df.iloc[idx]
-
-            # Skip empty rows and separator rows
-            if pd.notna(row[0]):
-                response_text = str(row[0]).strip()
-
-                # Skip certain rows
-                skip_patterns = [
-                    '====', '----', 'Comparison Groups',
-                    'Paired', 'Uppercase', 'SUBSAMPLE'
-                ]
-                if any(pattern in response_text for pattern in skip_patterns):
-                    continue
-
-                if response_text and response_text not in ['']:
-                    # Extract values for each demographic column (using their column indices)
-                    values = []
-                    for demo in demographics:
-                        col_idx = demo['column_index']
-                        if col_idx < len(row):
-                            cell_value = row[col_idx]
-                            # Try to convert to numeric, otherwise keep as string
-                            try:
-                                if pd.notna(cell_value):
-                                    # Check if it's a percentage
-                                    if isinstance(cell_value, str) and '%' in cell_value:
-                                        values.append(cell_value)
-                                    else:
-                                        values.append(float(cell_value))
-                                else:
-                                    values.append(None)
-                            except (ValueError, TypeError):
-                                values.append(str(cell_value) if pd.notna(cell_value) else None)
-                        else:
-                            values.append(None)
-
-                    if values and any(v is not None for v in values):
-                        response_data.append({
-                            'response': response_text,
-                            'values': values
-                        })
+        lookahead_end = min(start_row + 150, len(df))
+        boundaries = np.flatnonzero(row_labels['boundary'][start_row + 1:lookahead_end])
+        if len(boundaries):
+            end_row = start_row + 1 + int(boundaries[0])
+
+        # Extract response options and their values (skipping empty and
+        # separator rows)
+        stop_row = min(end_row, len(df))
+        response_rows = start_row + 1 + np.flatnonzero(row_labels['response'][start_row + 1:stop_row])
+        response_data = [
+            {'response': row_labels['text'][row], 'values': values}
+            for row, values in self._extract_values(df, response_rows, demographics)
+        ]
 
         return {
             'id': question['id'],
@@ -340,38 +405,37 @@ class CrosstabParser:
         return data
 
     def get_question_by_id(self, question_id: str, banner: str = 'BANNER 1') -> Dict:
-        """Get specific question data"""
-        data = self.parse_all_sheets()
-        if banner in data['banners']:
-            for q in data['banners'][banner]['questions']:
-                if q['id'] == question_id:
-                    return q
-        return None
+        """Get specific question data, parsing only that banner's sheet"""
+        if banner not in self.sheet_names:
+            return None
+        if banner not in self._question_index:
+            positions = {}
+            for position, q in enumerate(self.parse_banner(banner)['questions']):
+                positions.setdefault(q['id'], position)
+            self._question_index[banner] = positions
+
+        position = self._question_index[banner].get(question_id)
+        if position is None:
+            return None
+        return self.sheets[banner]['questions'][position]
 
     def get_all_question_ids(self) -> List[str]:
-        """Get list of all question IDs"""
-        data = self.parse_all_sheets()
-        if data['banners']:
-            first_banner = list(data['banners'].values())[0]
-            return [q['id'] for q in first_banner['questions']]
-        return []
+        """Get list of all question IDs (from the first banner)"""
+        return [question_id for question_id, _, _ in self._first_banner_entries()]
 
     def search_questions(self, search_term: str) -> List[Dict]:
         """Search questions by text"""
-        data = self.parse_all_sheets()
-        results = []
-
-        if data['banners']:
-            first_banner = list(data['banners'].values())[0]
-            for q in first_banner['questions']:
-                if search_term.lower() in q['text'].lower():
-                    results.append({
-                        'id': q['id'],
-                        'text': q['text']
-                    })
-
-        return results
-
+        search_term = search_term.lower()
+        return [{'id': question_id, 'text': text}
+                for question_id, text, lowered in self._first_banner_entries()
+                if search_term in lowered]
+
+    def _first_banner_entries(self) -> List[Tuple[str, str, str]]:
+        """(id, text, lowercased text) per question of the first banner, built once"""
+        if self._search_entries is None:
+            questions = self.parse_banner(self.sheet_names[0])['questions'] if self.sheet_names else []
+            self._search_entries = [(q['id'], q['text'], q['text'].lower()) for q in questions]
+        return self._search_entries
 
 if __name__ == '__main__':
     # Test the parser
@@ -0,0 +1,240 @@
+"""
+Spreadsheet Export
+Streams tables as CSV or XLSX downloads (and survey tables as JSON). Rows are
+consumed from iterators as they are written, so callers can generate them
+from storage a chunk at a time; XLSX files are assembled with openpyxl's
+write-only mode in a temporary file and streamed from there
+"""
+
+import csv
+import io
+import json
+import re
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from http_cache import FILE_BLOCK_SIZE
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json',
+}
+
+# JSON rows are objects keyed by column, so it is only offered for tables
+# whose header names are unique (survey tables)
+SPREADSHEET_FORMATS = ('csv', 'xlsx')
+
+# CSV and JSON output is flushed to the client every this many rows
+CSV_FLUSH_ROWS = 1000
+
+# Excel limits sheet names to 31 characters without []:*?/\
+_SHEET_TITLE_INVALID = re.compile(r'[\[\]:*?/\\]')
+_FILENAME_INVALID = re.compile(r'[^A-Za-z0-9._-]+')
+
+# Spreadsheet apps evaluate CSV text starting with these as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Sheet(NamedTuple):
+    """One exported table: a title (sheet name / CSV section), header and rows.
+
+    Rows hold plain Python values, with None for an empty cell.
+    """
+    title: str
+    header: List[str]
+    rows: Iterable[List[Any]]
+
+
+def export_format(requested: Optional[str], formats: Iterable[str] = SPREADSHEET_FORMATS) -> Optional[str]:
+    """Normalized export format from a query parameter, None if not one of ``formats``"""
+    requested = (requested or 'csv').lower()
+    return requested if requested in formats else None
+
+
+def export_response(app, sheets: Iterable[Sheet], fmt: str, filename: str):
+    """Streamed download of the sheets in the given format (csv, xlsx or json)"""
+    writers = {'csv': iter_csv, 'xlsx': iter_xlsx, 'json': iter_json}
+    body = writers[fmt](sheets)
+    response = app.response_class(body, mimetype=EXPORT_FORMATS[fmt])
+    filename = _FILENAME_INVALID.sub('_', filename) or 'export'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# ----------------------------------------------------------------------
+# Result layouts
+# ----------------------------------------------------------------------
+def analysis_sheet(result: Dict[str, Any]) -> Sheet:
+    """One analyze response as a table, columns as on the results page"""
+    rows = [[item['value'], item['label'], item['count'], item['percentage'],
+             item['unfiltered_count'], item['unfiltered_percentage']] for item in result['results']]
+    rows.append([None, 'Total', result['total_filtered'], None, result['total_original'], None])
+    return Sheet(result['target_question'],
+                 ['Value', 'Label', 'Count (Filtered)', 'Percentage (Filtered)',
+                  'Count (All Data)', 'Percentage (All Data)'],
+                 rows)
+
+
+def batch_sheets(batch: Dict[str, Any]) -> List[Sheet]:
+    """A batch analyze response as one table per target question: the
+    unfiltered baseline, then a count and percentage column per scenario"""
+    sheets = []
+    for target_question in batch['target_questions']:
+        results = [scenario['results'][target_question] for scenario in batch['scenarios']]
+        header = ['Value', 'Label', 'Count (All Data)', 'Percentage (All Data)']
+        for scenario in batch['scenarios']:
+            header += [f"{scenario['name']} Count", f"{scenario['name']} Percentage"]
+
+        # Every scenario lists every value answered in the survey, in order
+        rows = []
+        for position, item in enumerate(results[0]['results'] if results else []):
+            row = [item['value'], item['label'], item['unfiltered_count'], item['unfiltered_percentage']]
+            for result in results:
+                row += [result['results'][position]['count'], result['results'][position]['percentage']]
+            rows.append(row)
+        totals = [None, 'Total', batch['total_original'], None]
+        for result in results:
+            totals += [result['total_filtered'], None]
+        rows.append(totals)
+        sheets.append(Sheet(target_question, header, rows))
+    return sheets
+
+
+def crosstab_question_sheets(question: Dict[str, Any]) -> List[Sheet]:
+    """A crosstab question response as one table per banner"""
+    sheets = []
+    for banner_name, banner in question['banners'].items():
+        header = ['Response']
+        for demographic in banner['demographics']:
+            category, label = demographic.get('category'), demographic.get('label')
+            header.append(label if not category or category == label else f"{category}: {label}")
+        rows = [[response['response']] + list(response['values'])
+                for response in banner['question']['responses']]
+        sheets.append(Sheet(banner_name, header, rows))
+    return sheets
+
+
+# ----------------------------------------------------------------------
+# Writers
+# ----------------------------------------------------------------------
+def iter_csv(sheets: Iterable[Sheet]) -> Iterator[bytes]:
+    """CSV body, a batch of rows at a time.
+
+    A single sheet is written as a plain table. Several sheets are written
+    one after another, each headed by its title and separated by a blank
+    line. Output starts with a UTF-8 BOM so Excel detects the encoding.
+    Text that a spreadsheet would run as a formula is prefixed with ``'``.
+    """
+    sheets = list(sheets)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    for position, sheet in enumerate(sheets):
+        if len(sheets) > 1:
+            if position:
+                writer.writerow([])
+            writer.writerow([_csv_cell(sheet.title)])
+        writer.writerow([_csv_cell(value) for value in sheet.header])
+        for count, row in enumerate(sheet.rows, start=1):
+            writer.writerow([_csv_cell(value) for value in row])
+            if count % CSV_FLUSH_ROWS == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_xlsx(sheets: Iterable[Sheet]) -> Iterator[bytes]:
+    """XLSX body, written through a temporary file.
+
+    Write-only worksheets keep only the current row in memory; the finished
+    workbook is read back and sent in FILE_BLOCK_SIZE blocks.
+    """
+    workbook = Workbook(write_only=True)
+    titles = set()
+    for sheet in sheets:
+        worksheet = workbook.create_sheet(_sheet_title(sheet.title, titles))
+        worksheet.append([_xlsx_cell(worksheet, value) for value in sheet.header])
+        for row in sheet.rows:
+            worksheet.append([_xlsx_cell(worksheet, value) for value in row])
+    if not titles:
+        workbook.create_sheet('Sheet1')
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            block = f.read(FILE_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+
+
+def iter_json(sheets: Iterable[Sheet]) -> Iterator[bytes]:
+    """JSON body, a batch of rows at a time.
+
+    Each row is an object keyed by the header. A single sheet is written as
+    an array of rows, several as an object of such arrays keyed by title.
+    """
+    sheets = list(sheets)
+    buffer = io.StringIO()
+    if len(sheets) > 1:
+        buffer.write('{')
+    for position, sheet in enumerate(sheets):
+        if len(sheets) > 1:
+            buffer.write(f"{',' if position else ''}{json.dumps(str(sheet.title))}:")
+        buffer.write('[')
+        for count, row in enumerate(sheet.rows, start=1):
+            if count > 1:
+                buffer.write(',')
+            buffer.write('\n')
+            buffer.write(json.dumps(dict(zip(sheet.header, row)), default=str))
+            if count % CSV_FLUSH_ROWS == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        buffer.write('\n]')
+    if len(sheets) > 1:
+        buffer.write('}')
+    buffer.write('\n')
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _csv_cell(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > 1 and value.startswith(_FORMULA_PREFIXES):
+        try:
+            float(value)
+        except ValueError:
+            # Not a plain number such as -5: keep it as text
+            return "'" + value
+    return value
+
+
+def _xlsx_cell(worksheet, value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    if value.startswith('='):
+        # Keep answers that look like formulas as text
+        cell = WriteOnlyCell(worksheet, value)
+        cell.data_type = 's'
+        return cell
+    return value
+
+
+def _sheet_title(title: str, used: set) -> str:
+    """Valid, unique sheet name for a title"""
+    base = _SHEET_TITLE_INVALID.sub('_', str(title)).strip("'")[:31] or 'Sheet'
+    candidate = base
+    suffix = 2
+    while candidate.lower() in used:
+        candidate = f"{base[:31 - len(str(suffix)) - 1]}_{suffix}"
+        suffix += 1
+    used.add(candidate.lower())
+    return candidate
@@ -0,0 +1,240 @@
+"""
+HTTP Caching for Survey Data Responses
+Encodes response bodies exactly as jsonify does, precompresses them (gzip, and
+brotli when installed) when a survey is stored, and serves them with ETag /
+Last-Modified validation so a browser revisiting unchanged data gets a 304
+"""
+
+import dataclasses
+import decimal
+import gzip
+import json
+import os
+import re
+import uuid
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from werkzeug.http import http_date
+from werkzeug.wsgi import wrap_file
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants are always written
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional: rows are encoded with json
+    orjson = None
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Browsers must revalidate (cheap with the ETag) and shared caches must not
+# store login-protected data
+CACHE_CONTROL = 'private, no-cache'
+
+# Stored files are streamed to the client in blocks of this size
+FILE_BLOCK_SIZE = 64 * 1024
+
+# orjson writes exponents differently (1e-5 vs 1e-05) and NaN/Infinity as
+# null; output containing either is re-encoded with json instead. The
+# pattern starts with a literal so the scan stays fast on text
+_ORJSON_EXPONENT = re.compile(rb'e(?<=[0-9]e)[-0-9]')
+_NON_ASCII = re.compile('[\x7f-\U0010ffff]')
+
+
+# ----------------------------------------------------------------------
+# Encoding
+# ----------------------------------------------------------------------
+def _json_default(o: Any) -> Any:
+    # Same conversions as Flask's default JSON provider
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, default=_json_default, ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+
+
+def encode_json(obj: Any) -> bytes:
+    """Response body jsonify would produce for obj (outside an app context)"""
+    return (_dumps(obj) + '\n').encode('utf-8')
+
+
+def _escape_non_ascii(match) -> str:
+    # Same escapes as json's ensure_ascii, including surrogate pairs
+    code = ord(match.group())
+    if code < 0x10000:
+        return f'\\u{code:04x}'
+    code -= 0x10000
+    return f'\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}'
+
+
+def _dumps_rows(rows: List[Dict[str, Any]]) -> str:
+    """Rows joined by commas exactly as _dumps writes them, using orjson when it can"""
+    if orjson is not None and rows:
+        try:
+            encoded = orjson.dumps(rows, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            encoded = None
+        if encoded is not None and b'null' not in encoded and not _ORJSON_EXPONENT.search(encoded):
+            text = encoded[1:-1].decode('utf-8')
+            if text.isascii() and '\x7f' not in text:
+                return text
+            return _NON_ASCII.sub(_escape_non_ascii, text)
+    return ','.join(_dumps(row) for row in rows)
+
+
+def iter_survey_frames_json(meta: Dict[str, Any], frames: Iterable[Any]) -> Iterator[bytes]:
+    """Body of the survey data endpoint from consecutive row chunks (DataFrames).
+
+    Keys are emitted in sorted order (as jsonify sorts them), so the
+    respondent rows can be streamed between the columns and labels.
+    """
+    extra = {}
+    if meta['file_type'] == 'raw_survey':
+        extra = {'file_type': meta['file_type'],
+                 'value_labels': meta.get('value_labels', {}),
+                 'variable_labels': meta.get('variable_labels', {})}
+
+    yield ('{"columns":' + _dumps(meta['columns']) + ',"data":[').encode('utf-8')
+    separator = ''
+    for frame in frames:
+        if len(frame) == 0:
+            continue
+        chunk = _dumps_rows(frame.to_dict('records'))
+        yield (separator + chunk).encode('utf-8')
+        separator = ','
+    tail = ''.join(f',"{key}":' + _dumps(value) for key, value in extra.items())
+    yield (']' + tail + '}\n').encode('utf-8')
+
+
+class _GzipWriter:
+    def __init__(self, raw):
+        # mtime=0 keeps the compressed bytes deterministic
+        self.raw = raw
+        self.gzip = gzip.GzipFile(filename='', mode='wb', compresslevel=6, fileobj=raw, mtime=0)
+
+    def write(self, data: bytes):
+        self.gzip.write(data)
+
+    def close(self):
+        self.gzip.close()
+        self.raw.close()
+
+
+class _BrotliWriter:
+    def __init__(self, raw):
+        self.raw = raw
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=9)
+
+    def write(self, data: bytes):
+        self.raw.write(self.compressor.process(data))
+
+    def close(self):
+        self.raw.write(self.compressor.finish())
+        self.raw.close()
+
+
+def write_precompressed(path: Path, chunks: Iterable[bytes], identity: bool = True):
+    """Write a body and its compressed variants (path.gz, path.br) in one pass.
+
+    Each file is written under a temporary name and renamed into place once
+    complete. With ``identity=False`` only the compressed variants are kept
+    (for bodies the server can rebuild from storage).
+    """
+    path = Path(path)
+    outputs = [(path, None)] if identity else []
+    outputs.append((path.with_name(path.name + '.gz'), _GzipWriter))
+    if brotli is not None:
+        outputs.append((path.with_name(path.name + '.br'), _BrotliWriter))
+
+    writers = []
+    try:
+        for target, wrapper in outputs:
+            raw = open(target.with_name(target.name + '.tmp'), 'wb')
+            writers.append(raw if wrapper is None else wrapper(raw))
+        for chunk in chunks:
+            for writer in writers:
+                writer.write(chunk)
+    except Exception:
+        for writer in writers:
+            writer.close()
+        for target, _ in outputs:
+            target.with_name(target.name + '.tmp').unlink(missing_ok=True)
+        raise
+
+    for writer in writers:
+        writer.close()
+    for target, _ in outputs:
+        os.replace(target.with_name(target.name + '.tmp'), target)
+
+
+# ----------------------------------------------------------------------
+# Serving
+# ----------------------------------------------------------------------
+def etag_for(survey_id: str, version: int, variant: str) -> str:
+    """ETag for one representation of a survey's data at a storage version"""
+    return f"{survey_id}-{version:x}-{variant}"
+
+
+def json_response(app, request, etag: str, version: int,
+                  path: Optional[Path] = None,
+                  build: Optional[Callable[[], Union[bytes, Iterable[bytes]]]] = None):
+    """Conditional JSON response for a versioned survey resource.
+
+    Answers 304 when the client's validators match, without reading or
+    building the body. Otherwise streams the best precompressed variant of
+    ``path`` the client accepts, then ``path`` itself if it exists (stored
+    bytes pass through as they are), then the body returned by ``build``,
+    which may be bytes or an iterable of byte chunks to stream.
+    """
+    chosen = None
+    for encoding, suffix in ENCODINGS:
+        if path is None or not request.accept_encodings[encoding]:
+            continue
+        candidate = path.with_name(path.name + suffix)
+        if candidate.exists():
+            chosen = (encoding, candidate)
+            break
+
+    response = app.response_class(mimetype='application/json')
+    response.set_etag(etag if chosen is None else f"{etag}-{chosen[0]}")
+    response.last_modified = datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    if chosen is not None:
+        response.headers['Content-Encoding'] = chosen[0]
+        _stream_file(response, request, chosen[1])
+    elif path is not None and path.exists():
+        _stream_file(response, request, path)
+    else:
+        body = build()
+        if isinstance(body, bytes):
+            response.set_data(body)
+        else:
+            response.response = body
+    return response
+
+
+def _stream_file(response, request, path: Path):
+    """Send a stored file without reading it into memory (sendfile where the server supports it)"""
+    f = open(path, 'rb')
+    response.content_length = os.fstat(f.fileno()).st_size
+    response.response = wrap_file(request.environ, f, FILE_BLOCK_SIZE)
+    response.direct_passthrough = True
@@ -0,0 +1,315 @@
+"""
+Survey Ingestion
+Detects, parses and stores uploaded survey files. Uploads run as jobs on a
+local process pool; each job reports its phase and progress in surveys.db so
+any worker can answer status polls
+"""
+
+import csv
+import io
+import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+
+import openpyxl
+import pandas as pd
+import pyreadstat
+
+from crosstab_parser import CrosstabParser
+from survey_db import SurveyDB
+from survey_store import SurveyStore
+
+
+# Overall progress range (start, end) covered by each phase
+PHASES = {
+    'queued': (0, 0),
+    'detect': (0, 5),
+    'parse': (5, 45),
+    'serialize': (45, 80),
+    'index': (80, 95),
+    'commit': (95, 100),
+}
+
+# Rows (and, for CSV, leading bytes) inspected when detecting the file type
+SNIFF_ROWS = 20
+SNIFF_BYTES = 64 * 1024
+
+
+class SniffedFile(NamedTuple):
+    """Detected file type, plus the open workbook for Excel uploads"""
+    file_type: str
+    workbook: Optional[pd.ExcelFile] = None
+
+
+def sniff_file(filepath, file_extension) -> SniffedFile:
+    """Detect if file is standard survey data or crosstab format.
+
+    Only the leading bytes of a CSV are read. Workbooks are opened once in
+    openpyxl's streaming read-only mode (the mode pandas itself uses), which
+    reads sheet names from the manifest and rows on demand; the open
+    workbook is returned for the parser to reuse. Callers close it.
+    """
+    workbook = None
+    try:
+        if file_extension == 'csv':
+            rows = _leading_csv_rows(filepath)
+        else:
+            workbook = _open_workbook(filepath, file_extension)
+            # Check if it has multiple sheets (likely crosstab)
+            if len(workbook.sheet_names) > 1:
+                # Check for BANNER pattern
+                if any('BANNER' in sheet.upper() for sheet in workbook.sheet_names):
+                    return SniffedFile('crosstab', workbook)
+            rows = _leading_sheet_rows(workbook)
+
+        return SniffedFile('crosstab' if _looks_like_crosstab(rows) else 'standard', workbook)
+
+    except Exception:
+        # Default to standard if detection fails
+        return SniffedFile('standard', workbook)
+
+
+def _looks_like_crosstab(rows: Iterable[Iterable]) -> bool:
+    # Look for crosstab indicators in the first rows
+    for row in rows:
+        row_text = ' '.join([str(x) for x in row if x is not None and x != ''])
+        # Check for question patterns like "Q1.", "Q2.", etc.
+        if any(pattern in row_text for pattern in ['Q1.', 'Q2.', 'Q3.']):
+            # Check for demographic headers
+            if any(keyword in row_text for keyword in ['Region', 'Age', 'Gender']):
+                return True
+    return False
+
+
+def _leading_csv_rows(filepath) -> list:
+    with open(filepath, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    lines = head.decode('utf-8', errors='replace').splitlines()[:SNIFF_ROWS]
+    return list(csv.reader(io.StringIO('\n'.join(lines))))
+
+
+def _open_workbook(filepath, file_extension) -> pd.ExcelFile:
+    if file_extension == 'xlsx':
+        workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+        return pd.ExcelFile(workbook, engine='openpyxl')
+    return pd.ExcelFile(filepath)
+
+
+def _leading_sheet_rows(workbook: pd.ExcelFile) -> list:
+    book = workbook.book
+    if isinstance(book, openpyxl.Workbook):
+        sheet = book.worksheets[0]
+        return list(sheet.iter_rows(max_row=SNIFF_ROWS, values_only=True))
+    # Other engines (.xls) read the first rows through pandas
+    df = workbook.parse(sheet_name=0, header=None, nrows=SNIFF_ROWS)
+    return [[x for x in row if pd.notna(x)] for row in df.itertuples(index=False)]
+
+
+def read_sav_metadata(filepath):
+    """Read a SAV file's dictionary (columns, labels, row count) without any rows"""
+    try:
+        _, meta = pyreadstat.read_sav(filepath, metadataonly=True)
+        return meta
+    except Exception as e:
+        raise Exception(f"Error processing SAV file: {str(e)}")
+
+
+def iter_sav_chunks(filepath, chunk_rows: int, total_rows: Optional[int] = None,
+                    num_processes: int = 1,
+                    progress: Optional[Callable[[str, float], None]] = None) -> Iterator[pd.DataFrame]:
+    """Yield a SAV file's rows as DataFrames of at most ``chunk_rows`` rows.
+
+    Memory stays bounded by the chunk size however large the file is. With
+    ``num_processes > 1`` pyreadstat reads chunks in parallel processes.
+    """
+    try:
+        chunks = pyreadstat.read_file_in_chunks(
+            pyreadstat.read_sav, filepath, chunksize=chunk_rows,
+            multiprocess=num_processes > 1, num_processes=max(num_processes, 1))
+        rows_read = 0
+        for df, _ in chunks:
+            # Clean column names
+            df.columns = df.columns.str.strip()
+            rows_read += len(df)
+            if progress and total_rows:
+                progress('parse', rows_read / total_rows)
+            yield df
+    except Exception as e:
+        raise Exception(f"Error processing SAV file: {str(e)}")
+
+
+def process_file(filepath, file_extension, workbook: Optional[pd.ExcelFile] = None):
+    """Process CSV or Excel file and return dataframe
+
+    ``workbook`` is an already-open handle for the Excel file (see sniff_file).
+    """
+    try:
+        if file_extension == 'csv':
+            df = pd.read_csv(filepath)
+        else:  # xlsx or xls
+            df = pd.read_excel(workbook if workbook is not None else filepath)
+
+        # Clean column names
+        df.columns = df.columns.str.strip()
+
+        # Missing cells are kept as NaN so columns keep their dtype; they are
+        # stored compactly and read back as '' (see ingest_survey)
+        return df
+    except Exception as e:
+        raise Exception(f"Error processing file: {str(e)}")
+
+
+# ----------------------------------------------------------------------
+# Job tracking
+# ----------------------------------------------------------------------
+class JobReporter:
+    """Writes phase/percent updates for one job, skipping no-op updates"""
+
+    def __init__(self, db: SurveyDB, job_id: str):
+        self.db = db
+        self.job_id = job_id
+        self._last = None
+
+    def report(self, phase: str, fraction: float = 0.0):
+        start, end = PHASES[phase]
+        percent = int(start + (end - start) * min(max(fraction, 0.0), 1.0))
+        if (phase, percent) == self._last:
+            return
+        self._last = (phase, percent)
+        self.db.update_job_progress(self.job_id, phase, percent)
+
+    def fail(self, error: str):
+        self.db.fail_job(self.job_id, error)
+
+
+# ----------------------------------------------------------------------
+# Ingestion pipeline (runs inside a pool process)
+# ----------------------------------------------------------------------
+_worker_dbs: Dict[str, SurveyDB] = {}
+
+
+def _worker_db(db_path: str) -> SurveyDB:
+    """SurveyDB for this pool process, reused across the jobs it runs"""
+    if db_path not in _worker_dbs:
+        _worker_dbs[db_path] = SurveyDB(db_path)
+    return _worker_dbs[db_path]
+
+
+def ingest_survey(db_path: str, data_folder: str, job_id: str, survey_id: str,
+                  filepath: str, filename: str, file_extension: str,
+                  sav_chunk_rows: int = 50000, sav_read_processes: int = 1,
+                  crosstab_parse_workers: int = 1):
+    """Run every ingestion phase for an uploaded file.
+
+    The survey row is inserted in the same transaction that marks the job
+    done, so the survey only appears in surveys.db once its data is fully
+    written. Storage left by a failed job is removed. SAV files are read
+    ``sav_chunk_rows`` rows at a time; crosstab workbooks are parsed in
+    ``crosstab_parse_workers`` processes (1 = inline in this worker).
+    """
+    db = _worker_db(db_path)
+    reporter = JobReporter(db, job_id)
+    store = SurveyStore(data_folder)
+
+    try:
+        reporter.report('detect')
+        if file_extension == 'sav':
+            # SAV files always go to cross-question analysis
+            file_type = 'raw_survey'
+            reporter.report('parse')
+            sav_meta = read_sav_metadata(filepath)
+            chunks = iter_sav_chunks(filepath, sav_chunk_rows, total_rows=sav_meta.number_rows,
+                                     num_processes=sav_read_processes, progress=reporter.report)
+
+            meta = store.write_survey_chunks(survey_id, chunks, file_type=file_type,
+                                             columns=[col.strip() for col in sav_meta.column_names],
+                                             variable_labels=sav_meta.column_names_to_labels,
+                                             value_labels=sav_meta.variable_value_labels,
+                                             progress=reporter.report)
+            columns, row_count = meta['columns'], meta['row_count']
+
+        else:
+            sniffed = sniff_file(filepath, file_extension)
+            file_type = sniffed.file_type
+
+            if file_type == 'crosstab':
+                reporter.report('parse')
+                # The parser reuses the workbook opened for detection
+                with CrosstabParser(filepath, max_workers=crosstab_parse_workers,
+                                    xl_file=sniffed.workbook) as parser:
+                    data = parser.parse_all_sheets()
+
+                reporter.report('serialize')
+                store.write_crosstab(survey_id, data)
+                columns, row_count = [], data['metadata']['total_questions']
+
+            else:
+                reporter.report('parse')
+                try:
+                    df = process_file(filepath, file_extension, workbook=sniffed.workbook)
+                finally:
+                    if sniffed.workbook is not None:
+                        sniffed.workbook.close()
+
+                # Missing cells read back as '' for consistency in JSON
+                store.write_survey(survey_id, df, file_type=file_type, fill_missing='',
+                                   progress=reporter.report)
+                columns, row_count = df.columns.tolist(), len(df)
+
+        reporter.report('commit')
+        db.finish_job(job_id, survey_id, filename, json.dumps(columns), row_count, file_type)
+
+    except Exception as e:
+        store.delete_survey(survey_id)
+        reporter.fail(str(e))
+
+
+class IngestQueue:
+    """Runs ingestion jobs on a lazily created process pool.
+
+    With ``max_workers <= 0`` jobs run inline in the calling process, which
+    is useful where subprocesses aren't available.
+    """
+
+    def __init__(self, db: SurveyDB, data_folder, max_workers: int = 2,
+                 sav_chunk_rows: int = 50000, sav_read_processes: int = 1,
+                 crosstab_parse_workers: int = 1):
+        self.db = db
+        self.data_folder = str(data_folder)
+        self.max_workers = max_workers
+        self.sav_chunk_rows = sav_chunk_rows
+        self.sav_read_processes = sav_read_processes
+        self.crosstab_parse_workers = crosstab_parse_workers
+        self._executor = None
+        self._lock = Lock()
+
+    def submit(self, survey_id: str, filepath: str, filename: str, file_extension: str) -> str:
+        """Record a queued job and start it; returns the job id"""
+        job_id = uuid.uuid4().hex
+        self.db.create_job(job_id, survey_id, filename)
+
+        args = (self.db.db_path, self.data_folder, job_id, survey_id, filepath, filename, file_extension,
+                self.sav_chunk_rows, self.sav_read_processes, self.crosstab_parse_workers)
+        if self.max_workers <= 0:
+            ingest_survey(*args)
+            return job_id
+
+        future = self._get_executor().submit(ingest_survey, *args)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _on_done(self, job_id: str, future):
+        # ingest_survey records its own errors; this catches a crashed worker
+        error = future.exception()
+        if error is not None:
+            self.db.fail_job(job_id, f"Ingestion worker failed: {error}")
+            with self._lock:
+                self._executor = None
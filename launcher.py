@@ -5,6 +5,7 @@ Handles startup, directory creation, browser launch, and graceful shutdown
 
 import os
 import sys
+import multiprocessing
 import time
 import threading
 import webbrowser
@@ -117,4 +118,6 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
+    # Required for the upload process pool in the bundled exe
+    multiprocessing.freeze_support()
     main()
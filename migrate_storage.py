@@ -0,0 +1,64 @@
+"""
+Storage Migration Tool
+Converts legacy per-survey JSON files (data/<survey_id>.json) to the storage
+layouts used by the app: columnar files for tabular surveys and per-question
+shards for crosstabs
+
+Usage:
+    python migrate_storage.py [--data-folder PATH] [--keep-json] [--dry-run]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from survey_store import SurveyStore
+
+
+def find_legacy_surveys(data_folder: Path):
+    """Return survey ids that still have a legacy JSON document"""
+    return sorted(path.stem for path in data_folder.glob('*.json'))
+
+
+def main(argv=None):
+    default_folder = Path(__file__).parent / 'data'
+
+    arg_parser = argparse.ArgumentParser(description='Migrate legacy survey JSON to the current storage layout')
+    arg_parser.add_argument('--data-folder', default=str(default_folder),
+                            help=f'Data folder to migrate (default: {default_folder})')
+    arg_parser.add_argument('--keep-json', action='store_true',
+                            help='Keep the original JSON files after migrating')
+    arg_parser.add_argument('--dry-run', action='store_true',
+                            help='List surveys that would be migrated without writing anything')
+    args = arg_parser.parse_args(argv)
+
+    data_folder = Path(args.data_folder)
+    if not data_folder.is_dir():
+        print(f"❌ Data folder not found: {data_folder}")
+        return 1
+
+    store = SurveyStore(data_folder)
+    migrated, skipped, failed = 0, 0, 0
+
+    for survey_id in find_legacy_surveys(data_folder):
+        if args.dry_run:
+            print(f"  would migrate {survey_id}")
+            continue
+
+        try:
+            if store.migrate_legacy(survey_id, keep_json=args.keep_json):
+                print(f"✓ Migrated {survey_id}")
+                migrated += 1
+            else:
+                print(f"- Skipped {survey_id} (already migrated)")
+                skipped += 1
+        except Exception as e:
+            print(f"❌ Failed {survey_id}: {e}")
+            failed += 1
+
+    print(f"\nMigrated: {migrated}  Skipped: {skipped}  Failed: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Question Catalog for Cross-Question Analysis
+Selects the analysable questions of a labelled (SAV) survey, orders them with
+demographics first and attaches labels, value options and answer counts. The
+catalog is built once from survey metadata when the survey is stored
+"""
+
+import re
+from typing import Any, Dict
+
+# Common metadata column patterns to exclude (exact matches or starts/ends with)
+METADATA_EXACT = ['id', 'hid', 'respondent_id', 'response_id', 'timestamp',
+                  'start_time', 'end_time', 'duration', 'completion_status',
+                  'source', 'device', 'weight', 'status', 'ip_address',
+                  'location', 'consent']
+
+METADATA_STARTSWITH = ['respondent', 'response_', 'timestamp_', 'date_', 'time_',
+                       'duration_', 'completion_', 'weight_', 'status_',
+                       'ip_', 'location_', 'start_', 'end_', 'consent_']
+
+# Key demographic fields listed first, in this order
+PRIORITY_FIELDS = ['AGE_GROUP', 'AGE', 'REGION', 'GENDER', 'EDUCATION', 'IDENTITY']
+
+
+def clean_question_label(label, col_id):
+    """Clean up question labels for better readability"""
+    if not label or label == col_id:
+        # If no label or label is same as ID, return the ID
+        return col_id
+
+    # Remove common prefixes
+    label = re.sub(r'^(Q\d+[._-]?\s*)', '', label, flags=re.IGNORECASE)
+    label = re.sub(r'^(Question\s*\d+[._-]?\s*)', '', label, flags=re.IGNORECASE)
+    label = re.sub(r'^(QN\d+[._-]?\s*)', '', label, flags=re.IGNORECASE)
+
+    # Remove trailing dots/dashes
+    label = re.sub(r'[._-]+$', '', label)
+
+    # Clean up multiple spaces
+    label = re.sub(r'\s+', ' ', label)
+
+    # Trim whitespace
+    label = label.strip()
+
+    # If label is too short after cleaning, use original
+    if len(label) < 3:
+        return col_id
+
+    return label
+
+
+def is_metadata_column(col: str) -> bool:
+    """True if a column looks like respondent/system metadata rather than a question"""
+    col_lower = col.lower()
+    return (col_lower in METADATA_EXACT or
+            any(col_lower.startswith(pattern) for pattern in METADATA_STARTSWITH))
+
+
+def natural_sort_key(text):
+    """
+    Convert a string to a list of mixed integers and strings for natural sorting.
+    Example: 'Q7' -> ['Q', 7], 'Q70' -> ['Q', 70]
+    This ensures Q1, Q2, ..., Q9, Q10, Q11, ... Q70, Q71...
+    """
+    def atoi(text):
+        return int(text) if text.isdigit() else text
+    return [atoi(c) for c in re.split(r'(\d+)', text)]
+
+
+def question_sort_key(question_id: str):
+    col_upper = question_id.upper()
+    # Check if it's a priority field (exact match or contains the keyword)
+    for i, priority in enumerate(PRIORITY_FIELDS):
+        if priority in col_upper or col_upper in priority:
+            return (0, i, [])  # Priority fields first, ordered by PRIORITY_FIELDS
+    # Non-priority fields come after, sorted naturally (Q1, Q2... Q10, Q11... Q70)
+    return (1, 0, natural_sort_key(question_id))
+
+
+def build_question_catalog(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Body of the cross-question metadata endpoint, from survey metadata only.
+
+    Only columns with value labels (actual questions) that don't look like
+    metadata are included. Indexed questions also carry per-value answer
+    counts from the bitmap index, keyed like their value labels (0 for a
+    labelled value nobody gave).
+    """
+    value_labels = meta['value_labels']
+    bitmap_index = meta.get('bitmap_index', {})
+
+    questions = []
+    for col in meta['columns']:
+        if not value_labels.get(col) or is_metadata_column(col):
+            continue
+
+        label = meta['variable_labels'].get(col, col)
+        question = {
+            'id': col,
+            'label': label,
+            'clean_label': clean_question_label(label, col),
+            'values': value_labels[col],
+            'value_count': len(value_labels[col])
+        }
+        if col in bitmap_index:
+            entry = bitmap_index[col]
+            value_counts = {str(value): 0 for value in value_labels[col]}
+            value_counts.update((str(value), count) for value, count
+                                in zip(entry['values'], entry['counts']))
+            question['value_counts'] = value_counts
+        questions.append(question)
+
+    questions.sort(key=lambda question: question_sort_key(question['id']))
+
+    return {
+        'questions': questions,
+        'total_responses': meta['row_count']
+    }
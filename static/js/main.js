@@ -35,11 +35,19 @@ uploadForm.addEventListener('submit', async function(e) {
         if (data.error) {
             uploadStatus.textContent = 'Error: ' + data.error;
             uploadStatus.className = 'status-message error';
+            return;
+        }
+
+        const job = await waitForJob(data.job_id);
+
+        if (job.status === 'failed') {
+            uploadStatus.textContent = 'Error: ' + (job.error || 'Processing failed');
+            uploadStatus.className = 'status-message error';
         } else {
             uploadStatus.textContent = 'Upload successful! Redirecting...';
             uploadStatus.className = 'status-message success';
             setTimeout(() => {
-                window.location.href = '/survey/' + data.survey_id;
+                window.location.href = '/survey/' + job.survey_id;
             }, 1000);
         }
     } catch (error) {
@@ -48,6 +56,34 @@ uploadForm.addEventListener('submit', async function(e) {
     }
 });
 
+// Poll an ingestion job until it finishes, showing its progress
+const phaseLabels = {
+    queued: 'Waiting to start',
+    detect: 'Detecting file type',
+    parse: 'Reading file',
+    serialize: 'Saving data',
+    index: 'Building indexes',
+    commit: 'Finishing up'
+};
+
+async function waitForJob(jobId) {
+    while (true) {
+        const response = await fetch('/api/jobs/' + jobId);
+        const job = await response.json();
+
+        if (job.error && !job.status) {
+            throw new Error(job.error);
+        }
+
+        if (job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+
+        uploadStatus.textContent = `Processing... ${phaseLabels[job.phase] || job.phase} (${job.percent}%)`;
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+}
+
 // Delete survey
 async function deleteSurvey(surveyId) {
     if (!confirm('Are you sure you want to delete this survey? This action cannot be undone.')) {
@@ -1,5 +1,6 @@
 let table;
-let surveyData = [];
+let unfilteredAggregate = null;
+let distinctValues = {};
 let filterValues = {};
 let charts = [];
 let chartsVisible = true;
@@ -8,38 +9,57 @@ let groupAFilters = {};
 let groupBFilters = {};
 let comparisonCharts = [];
 
+// Fetch chart value counts (and optionally filter dropdown values) for a set of filters
+async function fetchAggregate(filters, includeDistinct = false) {
+    const response = await fetch(`/api/survey/${surveyId}/aggregate`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filters: filters, include_distinct: includeDistinct })
+    });
+    return response.json();
+}
+
 // Load survey data
 async function loadSurveyData() {
     try {
-        const response = await fetch(`/api/survey/${surveyId}/data`);
-        const data = await response.json();
+        // Rows are paged by the table; the page itself only needs aggregates
+        const data = await fetchAggregate({}, true);
 
         if (data.error) {
             alert('Error loading data: ' + data.error);
             return;
         }
 
-        surveyData = data.data;
-        initializeTable(data.columns, data.data);
-        generateCharts(data.columns, data.data);
-        generateFilters(data.columns, data.data);
+        unfilteredAggregate = data;
+        distinctValues = data.distinct_values;
+        initializeTable(columns);
+        generateCharts(columns, data);
+        generateFilters(columns, distinctValues);
     } catch (error) {
         alert('Error: ' + error.message);
     }
 }
 
 // Initialize DataTable
-function initializeTable(columns, data) {
+function initializeTable(columns) {
     const columnDefs = columns.map(col => ({
         title: col,
         data: col
     }));
 
+    // Rows are paged, ordered and filtered on the server; only the visible
+    // page is sent to the browser
     table = $('#surveyTable').DataTable({
-        data: data,
+        serverSide: true,
+        processing: true,
+        ajax: {
+            url: `/api/survey/${surveyId}/table`,
+            type: 'POST'
+        },
+        searchDelay: 300,
         columns: columnDefs,
         pageLength: 25,
-        lengthMenu: [[10, 25, 50, 100, -1], [10, 25, 50, 100, "All"]],
+        lengthMenu: [10, 25, 50, 100],
         responsive: true,
         dom: 'lrtip',
         language: {
@@ -64,12 +84,12 @@ function initializeTable(columns, data) {
 }
 
 // Generate dynamic filters
-function generateFilters(columns, data) {
+function generateFilters(columns, distinctValues) {
     const filtersContainer = document.getElementById('filtersContainer');
 
     columns.forEach(column => {
-        // Get unique values for this column
-        const uniqueValues = [...new Set(data.map(row => row[column]))].filter(val => val !== '');
+        // Unique non-empty values for this column (omitted by the server above 100)
+        const uniqueValues = [...(distinctValues[column] || [])];
         uniqueValues.sort();
 
         // Only create filter if there are reasonable number of unique values
@@ -112,54 +132,21 @@ function generateFilters(columns, data) {
 }
 
 // Apply filters
-function applyFilters() {
-    // Custom filter function
-    $.fn.dataTable.ext.search.pop(); // Remove previous filter
-    $.fn.dataTable.ext.search.push(function(settings, data, dataIndex) {
-        const rowData = surveyData[dataIndex];
-
-        for (let column in filterValues) {
-            if (filterValues[column]) {
-                // Convert both values to strings for comparison to handle numbers
-                const filterVal = String(filterValues[column]);
-                const rowVal = String(rowData[column]);
-                if (rowVal !== filterVal) {
-                    return false;
-                }
-            }
-        }
-        return true;
+async function applyFilters() {
+    // Column filters are sent as per-column searches and matched exactly on the server
+    columns.forEach((column, index) => {
+        table.column(index).search(filterValues[column] ? String(filterValues[column]) : '');
     });
 
     table.draw();
 
-    // Update charts with filtered data
-    const filteredData = getFilteredData();
-    updateCharts(filteredData);
+    // Update charts with counts for the filtered rows
+    const aggregate = await fetchAggregate(filterValues);
+    updateCharts(aggregate);
 }
 
-// Get currently filtered data based on active filters
-function getFilteredData() {
-    if (Object.keys(filterValues).length === 0) {
-        return surveyData;
-    }
-
-    return surveyData.filter(row => {
-        for (let column in filterValues) {
-            if (filterValues[column]) {
-                const filterVal = String(filterValues[column]);
-                const rowVal = String(row[column]);
-                if (rowVal !== filterVal) {
-                    return false;
-                }
-            }
-        }
-        return true;
-    });
-}
-
-// Update charts with new data
-function updateCharts(data) {
+// Update charts with new aggregate counts
+function updateCharts(aggregate) {
     const chartsContainer = document.getElementById('chartsContainer');
     const filterStatus = document.getElementById('filterStatus');
 
@@ -171,17 +158,17 @@ function updateCharts(data) {
     chartsContainer.innerHTML = '';
 
     // Update filter status indicator
-    const isFiltered = data.length < surveyData.length;
+    const isFiltered = aggregate.filtered_rows < aggregate.total_rows;
     if (isFiltered) {
         filterStatus.style.display = 'block';
-        document.getElementById('filteredCount').textContent = data.length;
-        document.getElementById('totalCount').textContent = surveyData.length;
+        document.getElementById('filteredCount').textContent = aggregate.filtered_rows;
+        document.getElementById('totalCount').textContent = aggregate.total_rows;
     } else {
         filterStatus.style.display = 'none';
     }
 
-    // Regenerate charts with filtered data
-    generateCharts(columns, data);
+    // Regenerate charts with filtered counts
+    generateCharts(columns, aggregate);
 }
 
 // Clear filters
@@ -191,11 +178,11 @@ document.getElementById('clearFilters').addEventListener('click', function() {
         select.value = '';
     });
     document.getElementById('globalSearch').value = '';
-    $.fn.dataTable.ext.search.pop();
+    table.columns().search('');
     table.search('').draw();
 
     // Reset charts to full dataset
-    updateCharts(surveyData);
+    updateCharts(unfilteredAggregate);
 });
 
 // Global search
@@ -203,62 +190,33 @@ document.getElementById('globalSearch').addEventListener('keyup', function() {
     table.search(this.value).draw();
 });
 
-// Export to CSV
-document.getElementById('exportCSV').addEventListener('click', function() {
-    const filteredData = table.rows({ search: 'applied' }).data().toArray();
-
-    if (filteredData.length === 0) {
-        alert('No data to export');
-        return;
-    }
-
-    // Create CSV content
-    const headers = columns.join(',');
-    const rows = filteredData.map(row => {
-        return columns.map(col => {
-            const value = row[col] || '';
-            // Escape quotes and wrap in quotes if contains comma
-            return value.includes(',') || value.includes('"') || value.includes('\n')
-                ? `"${value.replace(/"/g, '""')}"`
-                : value;
-        }).join(',');
+// Download the rows matching the table's current search, filters and order;
+// the server streams the file, so a plain form post lets the browser save it
+function downloadExport(format) {
+    const params = Object.assign({}, table.ajax.params(), { start: 0 });
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = `/api/survey/${surveyId}/export?format=${format}`;
+    $.param(params).split('&').forEach(pair => {
+        const [name, value] = pair.split('=').map(part => decodeURIComponent(part.replace(/\+/g, ' ')));
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value ?? '';
+        form.appendChild(input);
     });
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+}
 
-    const csv = [headers, ...rows].join('\n');
-
-    // Download
-    const blob = new Blob([csv], { type: 'text/csv' });
-    const url = window.URL.createObjectURL(blob);
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = `survey_${surveyId}_export.csv`;
-    a.click();
-    window.URL.revokeObjectURL(url);
-});
-
-// Export to JSON
-document.getElementById('exportJSON').addEventListener('click', function() {
-    const filteredData = table.rows({ search: 'applied' }).data().toArray();
-
-    if (filteredData.length === 0) {
-        alert('No data to export');
-        return;
-    }
-
-    const json = JSON.stringify(filteredData, null, 2);
-
-    // Download
-    const blob = new Blob([json], { type: 'application/json' });
-    const url = window.URL.createObjectURL(blob);
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = `survey_${surveyId}_export.json`;
-    a.click();
-    window.URL.revokeObjectURL(url);
-});
+// Export to CSV / Excel / JSON
+document.getElementById('exportCSV').addEventListener('click', () => downloadExport('csv'));
+document.getElementById('exportXLSX').addEventListener('click', () => downloadExport('xlsx'));
+document.getElementById('exportJSON').addEventListener('click', () => downloadExport('json'));
 
 // Generate charts
-function generateCharts(columns, data) {
+function generateCharts(columns, aggregate) {
     const chartsContainer = document.getElementById('chartsContainer');
 
     columns.forEach(column => {
@@ -267,11 +225,16 @@ function generateCharts(columns, data) {
             return;
         }
 
-        // Get unique values and their counts
+        // Value counts computed by the server (omitted above 20 distinct values)
+        const columnCounts = aggregate.columns[column];
+        if (!columnCounts) {
+            return;
+        }
+
         const valueCounts = {};
-        data.forEach(row => {
-            const value = row[column] || '(empty)';
-            valueCounts[value] = (valueCounts[value] || 0) + 1;
+        columnCounts.values.forEach((rawValue, i) => {
+            const value = rawValue || '(empty)';
+            valueCounts[value] = (valueCounts[value] || 0) + columnCounts.counts[i];
         });
 
         const uniqueValues = Object.keys(valueCounts);
@@ -380,7 +343,7 @@ document.getElementById('toggleCharts').addEventListener('click', function() {
 document.getElementById('enableComparison').addEventListener('click', function() {
     comparisonMode = true;
     document.getElementById('comparisonSection').style.display = 'block';
-    generateComparisonFilters(columns, surveyData);
+    generateComparisonFilters(columns, distinctValues);
 });
 
 // Close comparison mode
@@ -417,7 +380,7 @@ document.getElementById('clearGroupB').addEventListener('click', function() {
 });
 
 // Generate comparison filters
-function generateComparisonFilters(columns, data) {
+function generateComparisonFilters(columns, distinctValues) {
     const groupAContainer = document.getElementById('groupAFilters');
     const groupBContainer = document.getElementById('groupBFilters');
 
@@ -426,8 +389,8 @@ function generateComparisonFilters(columns, data) {
     groupBContainer.innerHTML = '';
 
     columns.forEach(column => {
-        // Get unique values for this column
-        const uniqueValues = [...new Set(data.map(row => row[column]))].filter(val => val !== '');
+        // Unique non-empty values for this column (omitted by the server above 100)
+        const uniqueValues = [...(distinctValues[column] || [])];
         uniqueValues.sort();
 
         // Only create filter if there are reasonable number of unique values
@@ -495,34 +458,22 @@ function createComparisonFilter(column, uniqueValues, group) {
 }
 
 // Update comparison results
-function updateComparison() {
-    // Filter data for each group
-    const groupAData = filterData(surveyData, groupAFilters);
-    const groupBData = filterData(surveyData, groupBFilters);
+async function updateComparison() {
+    // Count values for each group on the server
+    const [groupA, groupB] = await Promise.all([
+        fetchAggregate(groupAFilters),
+        fetchAggregate(groupBFilters)
+    ]);
 
     // Update counts
-    document.getElementById('groupACount').textContent = groupAData.length;
-    document.getElementById('groupBCount').textContent = groupBData.length;
+    document.getElementById('groupACount').textContent = groupA.filtered_rows;
+    document.getElementById('groupBCount').textContent = groupB.filtered_rows;
 
     // Generate comparison charts
-    generateComparisonCharts(groupAData, groupBData);
+    generateComparisonCharts(groupA, groupB);
 }
 
-function filterData(data, filters) {
-    return data.filter(row => {
-        for (let column in filters) {
-            // Convert both values to strings for comparison to handle numbers
-            const filterVal = String(filters[column]);
-            const rowVal = String(row[column]);
-            if (rowVal !== filterVal) {
-                return false;
-            }
-        }
-        return true;
-    });
-}
-
-function generateComparisonCharts(groupAData, groupBData) {
+function generateComparisonCharts(groupA, groupB) {
     const chartsContainer = document.getElementById('comparisonCharts');
 
     // Clear existing charts
@@ -530,22 +481,26 @@ function generateComparisonCharts(groupAData, groupBData) {
     comparisonCharts = [];
     chartsContainer.innerHTML = '';
 
-    if (groupAData.length === 0 && groupBData.length === 0) {
+    if (groupA.filtered_rows === 0 && groupB.filtered_rows === 0) {
         chartsContainer.innerHTML = '<p style="text-align: center; color: #999;">Select filters to compare data</p>';
         return;
     }
 
     // Generate comparison charts for each categorical column
     columns.forEach(column => {
+        // Counts are omitted for a group with more than 20 values in this column
+        const countsA = groupA.columns[column];
+        const countsB = groupB.columns[column];
+        if (!countsA || !countsB) {
+            return;
+        }
+
         // Get unique values for this column from both groups
-        const allValues = new Set([
-            ...groupAData.map(row => row[column]),
-            ...groupBData.map(row => row[column])
-        ]);
+        const allValues = new Set([...countsA.values, ...countsB.values]);
 
         // Only create charts for columns with reasonable unique values
         if (allValues.size > 0 && allValues.size <= 20) {
-            createComparisonChart(column, groupAData, groupBData, Array.from(allValues), chartsContainer);
+            createComparisonChart(column, countsA, countsB, Array.from(allValues), chartsContainer);
         }
     });
 
@@ -554,7 +509,7 @@ function generateComparisonCharts(groupAData, groupBData) {
     }
 }
 
-function createComparisonChart(columnName, groupAData, groupBData, values, container) {
+function createComparisonChart(columnName, countsA, countsB, values, container) {
     // Create chart container
     const chartDiv = document.createElement('div');
     chartDiv.className = 'chart-container';
@@ -571,14 +526,9 @@ function createComparisonChart(columnName, groupAData, groupBData, values, conta
     chartDiv.appendChild(canvasWrapper);
     container.appendChild(chartDiv);
 
-    // Count values for each group
-    const groupACounts = {};
-    const groupBCounts = {};
-
-    values.forEach(val => {
-        groupACounts[val] = groupAData.filter(row => row[columnName] === val).length;
-        groupBCounts[val] = groupBData.filter(row => row[columnName] === val).length;
-    });
+    // Look up each value's count per group
+    const groupACounts = new Map(countsA.values.map((val, i) => [val, countsA.counts[i]]));
+    const groupBCounts = new Map(countsB.values.map((val, i) => [val, countsB.counts[i]]));
 
     values.sort();
 
@@ -590,14 +540,14 @@ function createComparisonChart(columnName, groupAData, groupBData, values, conta
             datasets: [
                 {
                     label: 'Group A',
-                    data: values.map(val => groupACounts[val] || 0),
+                    data: values.map(val => groupACounts.get(val) || 0),
                     backgroundColor: 'rgba(102, 126, 234, 0.7)',
                     borderColor: 'rgba(102, 126, 234, 1)',
                     borderWidth: 1
                 },
                 {
                     label: 'Group B',
-                    data: values.map(val => groupBCounts[val] || 0),
+                    data: values.map(val => groupBCounts.get(val) || 0),
                     backgroundColor: 'rgba(255, 99, 132, 0.7)',
                     borderColor: 'rgba(255, 99, 132, 1)',
                     borderWidth: 1
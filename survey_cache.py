@@ -0,0 +1,124 @@
+"""
+Decoded Survey Cache
+Process-wide LRU cache for decoded survey columns and metadata, bounded by a
+memory budget so each gunicorn worker keeps its hot surveys in memory
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class SurveyCache:
+    """Thread-safe LRU cache with a byte budget.
+
+    Keys are tuples whose first element is the survey id, so every entry
+    belonging to a survey can be dropped with ``invalidate(survey_id)``.
+    Callers put the storage mtime in the key, which makes entries written by
+    an older ingest unreachable even if another worker re-ingested the
+    survey; those entries simply age out of the LRU. With ``ttl`` (seconds)
+    entries also expire that long after they were stored.
+    """
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple, Tuple[Any, int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple[Hashable, ...], loader: Callable[[], Any],
+            sizer: Callable[[Any], int] = None) -> Any:
+        """Return the cached value for key, calling loader on a miss"""
+        return self.get_entry(key, loader, sizer)[0]
+
+    def get_entry(self, key: Tuple[Hashable, ...], loader: Callable[[], Any],
+                  sizer: Callable[[Any], int] = None) -> Tuple[Any, bool]:
+        """Like get, but returns (value, hit) so callers can report cache status"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self.current_bytes -= self._entries.pop(key)[1]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], True
+            self.misses += 1
+
+        # Load outside the lock so slow reads don't serialize other requests
+        value = loader()
+        size = (sizer or estimate_size)(value)
+
+        if size > self.max_bytes:
+            return value, False
+
+        expires = time.monotonic() + self.ttl if self.ttl else float('inf')
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, expires)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+        return value, False
+
+    def invalidate(self, survey_id: str):
+        """Drop every entry belonging to a survey"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == survey_id]
+            for key in stale:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the budget per worker"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate in-memory footprint of a cached value in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            # Object arrays share their element objects; count each once
+            unique_ids = {}
+            for item in value.ravel():
+                unique_ids.setdefault(id(item), item)
+            return value.nbytes + sum(sys.getsizeof(item) for item in unique_ids.values())
+        return value.nbytes
+    return sys.getsizeof(value)
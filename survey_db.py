@@ -0,0 +1,158 @@
+"""
+Survey Database Access
+All reads and writes of surveys.db go through SurveyDB, which keeps one
+persistent connection per thread in each worker process, runs SQLite in WAL
+mode and owns the schema (surveys and ingest_jobs tables)
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache reuses the prepared statements across requests
+_LIST_SURVEYS = ('SELECT id, filename, upload_date, row_count, file_type FROM surveys '
+                 'ORDER BY upload_date DESC')
+_GET_SURVEY = ('SELECT id, filename, upload_date, columns, row_count, file_type FROM surveys '
+               'WHERE id = ?')
+_INSERT_SURVEY = 'INSERT INTO surveys VALUES (?, ?, ?, ?, ?, ?)'
+_DELETE_SURVEY = 'DELETE FROM surveys WHERE id = ?'
+
+_JOB_COLUMNS = 'id, survey_id, filename, status, phase, percent, file_type, error, created_at, updated_at'
+_GET_JOB = f'SELECT {_JOB_COLUMNS} FROM ingest_jobs WHERE id = ?'
+_INSERT_JOB = ('INSERT INTO ingest_jobs (id, survey_id, filename, status, phase, percent, '
+               'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+_UPDATE_JOB_PROGRESS = ('UPDATE ingest_jobs SET status = ?, phase = ?, percent = ?, updated_at = ? '
+                        'WHERE id = ?')
+_FAIL_JOB = 'UPDATE ingest_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?'
+_FINISH_JOB = ('UPDATE ingest_jobs SET status = ?, phase = ?, percent = ?, file_type = ?, '
+               'updated_at = ? WHERE id = ?')
+
+
+class SurveyDB:
+    """Connection holder and queries for surveys.db.
+
+    Connections are opened lazily per (process, thread) and kept for the
+    life of the worker: gunicorn worker processes, threads within a worker
+    and ingestion pool processes each get their own, and a connection
+    inherited across fork is never reused.
+    """
+
+    def __init__(self, db_path, mmap_mb: int = 64, timeout: float = 30.0):
+        self.db_path = str(db_path)
+        self.mmap_bytes = max(int(mmap_mb), 0) * 1024 * 1024
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, cached_statements=64)
+        conn.row_factory = sqlite3.Row
+        # WAL lets page loads read while an upload commits; NORMAL is
+        # durable across application crashes in WAL mode
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={self.mmap_bytes}')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close this thread's connection (it reopens on next use)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    # ------------------------------------------------------------------
+    # Schema
+    # ------------------------------------------------------------------
+    def init_schema(self):
+        conn = self.connection()
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS surveys
+                            (id TEXT PRIMARY KEY,
+                             filename TEXT NOT NULL,
+                             upload_date TEXT NOT NULL,
+                             columns TEXT NOT NULL,
+                             row_count INTEGER NOT NULL,
+                             file_type TEXT DEFAULT 'standard')''')
+
+            # Add file_type column if it doesn't exist (for existing databases)
+            columns = [col[1] for col in conn.execute('PRAGMA table_info(surveys)').fetchall()]
+            if 'file_type' not in columns:
+                conn.execute('ALTER TABLE surveys ADD COLUMN file_type TEXT DEFAULT "standard"')
+
+            # Home page lists surveys newest first
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_surveys_upload_date ON surveys (upload_date)')
+
+            conn.execute('''CREATE TABLE IF NOT EXISTS ingest_jobs
+                            (id TEXT PRIMARY KEY,
+                             survey_id TEXT NOT NULL,
+                             filename TEXT NOT NULL,
+                             status TEXT NOT NULL,
+                             phase TEXT NOT NULL,
+                             percent INTEGER NOT NULL DEFAULT 0,
+                             file_type TEXT,
+                             error TEXT,
+                             created_at TEXT NOT NULL,
+                             updated_at TEXT NOT NULL)''')
+
+    # ------------------------------------------------------------------
+    # Surveys
+    # ------------------------------------------------------------------
+    def list_surveys(self) -> List[Dict[str, Any]]:
+        rows = self.connection().execute(_LIST_SURVEYS).fetchall()
+        return [{'id': row['id'], 'filename': row['filename'], 'upload_date': row['upload_date'],
+                 'row_count': row['row_count'], 'file_type': row['file_type'] or 'standard'}
+                for row in rows]
+
+    def get_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection().execute(_GET_SURVEY, (survey_id,)).fetchone()
+        if row is None:
+            return None
+        survey = dict(row)
+        survey['file_type'] = survey['file_type'] or 'standard'
+        return survey
+
+    def delete_survey(self, survey_id: str):
+        conn = self.connection()
+        with conn:
+            conn.execute(_DELETE_SURVEY, (survey_id,))
+
+    # ------------------------------------------------------------------
+    # Ingestion jobs
+    # ------------------------------------------------------------------
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection().execute(_GET_JOB, (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def create_job(self, job_id: str, survey_id: str, filename: str):
+        now = datetime.now().isoformat()
+        conn = self.connection()
+        with conn:
+            conn.execute(_INSERT_JOB, (job_id, survey_id, filename, 'queued', 'queued', 0, now, now))
+
+    def update_job_progress(self, job_id: str, phase: str, percent: int):
+        conn = self.connection()
+        with conn:
+            conn.execute(_UPDATE_JOB_PROGRESS, ('running', phase, percent, datetime.now().isoformat(), job_id))
+
+    def fail_job(self, job_id: str, error: str):
+        conn = self.connection()
+        with conn:
+            conn.execute(_FAIL_JOB, ('failed', error, datetime.now().isoformat(), job_id))
+
+    def finish_job(self, job_id: str, survey_id: str, filename: str, columns_json: str,
+                   row_count: int, file_type: str):
+        """Insert the survey row and mark its job done in one transaction"""
+        now = datetime.now().isoformat()
+        conn = self.connection()
+        with conn:
+            conn.execute(_INSERT_SURVEY, (survey_id, filename, now, columns_json, row_count, file_type))
+            conn.execute(_FINISH_JOB, ('done', 'commit', 100, file_type, now, job_id))
@@ -0,0 +1,899 @@
+"""
+Columnar Survey Storage
+Persists ingested survey tables as one NumPy file per column so that readers
+only load the columns a request actually touches
+"""
+
+import json
+import os
+import pickle
+import re
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from bitmap_index import INDEX_DIR, BitmapIndex, write_index
+from contingency import ContingencyCube, write_contingency
+from http_cache import encode_json, iter_survey_frames_json, write_precompressed
+from question_catalog import build_question_catalog, is_metadata_column, question_sort_key
+from survey_cache import SurveyCache, estimate_size
+
+STORAGE_VERSION = 2
+META_FILE = 'meta.json'
+COLUMNS_DIR = 'columns'
+CROSSTAB_FILE = 'crosstab.json'
+CROSSTAB_DIR = 'crosstab'
+RESPONSES_DIR = 'responses'
+MEMORY_REPORT_FILE = 'memory.json'
+
+# Float columns with at most this many distinct values (or with value labels
+# or missing answers) are stored as dictionary codes
+LOW_CARDINALITY = 256
+
+# Stored arrays at least this large are memory-mapped rather than read into
+# each worker; smaller ones cost less to copy than a mapping and its file handle
+MMAP_MIN_BYTES = 64 * 1024
+
+# Precomputed data responses are encoded this many cells (rows x columns) at
+# a time, so wide surveys decode proportionally fewer rows per step
+RESPONSE_CHUNK_CELLS = 500_000
+
+_SURVEY_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class SurveyStore:
+    """Read and write columnar survey data under the data folder.
+
+    Layout for a survey::
+
+        data/<survey_id>/meta.json           columns, labels, row count, encodings
+        data/<survey_id>/columns/0000.npy    one array per column
+        data/<survey_id>/columns/0000.json   dictionary for string/mixed columns
+        data/<survey_id>/index/0000.npy      value bitmaps for labelled questions
+        data/<survey_id>/index/contingency.npy  joint counts of labelled question pairs
+        data/<survey_id>/responses/data.json.gz  precompressed data response
+        data/<survey_id>/responses/metadata.json question catalog (labelled surveys)
+
+    Crosstab surveys are stored as::
+
+        data/<survey_id>/crosstab.json              full parsed document (+ .gz/.br)
+        data/<survey_id>/crosstab/questions.json    question list
+        data/<survey_id>/crosstab/index.json        question id -> shard
+        data/<survey_id>/crosstab/q0000.json        one question, all banners
+
+    Surveys ingested before these layouts existed live in
+    ``data/<survey_id>.json``; they are still readable until migrated.
+
+    With ``use_mmap`` the fixed-width arrays (numbers, dictionary codes,
+    bitmaps) are opened as read-only memory maps, so every worker process
+    reads the same OS page cache instead of holding a private copy. Files
+    are never modified in place (a re-ingest swaps in a new directory), which
+    keeps existing mappings valid.
+    """
+
+    def __init__(self, data_folder, cache: Optional[SurveyCache] = None, use_mmap: bool = True):
+        self.data_folder = Path(data_folder)
+        self.cache = cache
+        self.use_mmap = use_mmap
+
+    # ------------------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------------------
+    def survey_path(self, survey_id: str) -> Path:
+        """Directory holding the columnar files for a survey"""
+        if not _SURVEY_ID_PATTERN.match(survey_id or ''):
+            raise ValueError(f"Invalid survey id: {survey_id!r}")
+        return self.data_folder / survey_id
+
+    def legacy_path(self, survey_id: str) -> Path:
+        """Path of the pre-columnar JSON document for a survey"""
+        if not _SURVEY_ID_PATTERN.match(survey_id or ''):
+            raise ValueError(f"Invalid survey id: {survey_id!r}")
+        return self.data_folder / f"{survey_id}.json"
+
+    def has_columnar(self, survey_id: str) -> bool:
+        return (self.survey_path(survey_id) / META_FILE).exists()
+
+    def exists(self, survey_id: str) -> bool:
+        """True if the survey has columnar, sharded crosstab or legacy JSON storage"""
+        try:
+            return (self.has_columnar(survey_id)
+                    or (self.survey_path(survey_id) / CROSSTAB_FILE).exists()
+                    or self.legacy_path(survey_id).exists())
+        except ValueError:
+            return False
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def write_survey(self, survey_id: str, df: pd.DataFrame, file_type: str,
+                     variable_labels: Optional[Dict] = None,
+                     value_labels: Optional[Dict] = None,
+                     fill_missing: Optional[Any] = None,
+                     progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        """Write a DataFrame as columnar storage and return its metadata.
+
+        Files are written to a temporary directory first and swapped into
+        place (see _swap_into_place), so readers never observe a
+        half-written survey. Missing
+        values are stored as such (code -1 / NaN); if ``fill_missing`` is
+        given, readers see that value in their place instead. ``progress``
+        is called as progress(phase, fraction) with phase 'serialize' or
+        'index'.
+        """
+        return self._write_survey(survey_id, df, df.columns.tolist(), len(df), file_type,
+                                  variable_labels, value_labels, fill_missing, progress)
+
+    def write_survey_chunks(self, survey_id: str, chunks: Iterable[pd.DataFrame], file_type: str,
+                            columns: Optional[List[str]] = None,
+                            variable_labels: Optional[Dict] = None,
+                            value_labels: Optional[Dict] = None,
+                            fill_missing: Optional[Any] = None,
+                            progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        """Write a survey that arrives as consecutive row chunks.
+
+        Only one chunk, and afterwards one column, is held in memory at a
+        time: each chunk is split into per-column spill files, then columns
+        are reassembled and encoded one by one exactly as write_survey would.
+        ``columns`` names the columns of a survey that may have no rows.
+        """
+        spill_dir = Path(tempfile.mkdtemp(prefix=f".{survey_id}-spill-", dir=self.data_folder))
+        try:
+            row_count = 0
+            for chunk in chunks:
+                if columns is None:
+                    columns = chunk.columns.tolist()
+                elif chunk.columns.tolist() != columns:
+                    raise ValueError("Chunk columns differ from the survey's columns")
+                for position, col in enumerate(columns):
+                    with open(spill_dir / f"{position:04d}.pkl", 'ab') as f:
+                        pickle.dump(chunk[col].reset_index(drop=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+                row_count += len(chunk)
+
+            spilled = _SpilledColumns(spill_dir, columns or [])
+            return self._write_survey(survey_id, spilled, columns or [], row_count, file_type,
+                                      variable_labels, value_labels, fill_missing, progress)
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def _write_survey(self, survey_id: str, data: Mapping[str, pd.Series], columns: List[str],
+                      row_count: int, file_type: str, variable_labels: Optional[Dict],
+                      value_labels: Optional[Dict], fill_missing: Optional[Any],
+                      progress: Optional[Callable[[str, float], None]]) -> Dict[str, Any]:
+        """Encode columns fetched one at a time from ``data`` and swap them into place"""
+        target = self.survey_path(survey_id)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{survey_id}-", dir=self.data_folder))
+
+        try:
+            columns_dir = tmp_dir / COLUMNS_DIR
+            columns_dir.mkdir()
+
+            column_storage = {}
+            report_columns = []
+            for position, col in enumerate(columns):
+                if progress:
+                    progress('serialize', position / max(len(columns), 1))
+                file_stem = f"{position:04d}"
+                series = data[col]
+                column_storage[col] = self._write_column(
+                    columns_dir, file_stem, series, labelled=bool(value_labels and value_labels.get(col)))
+                report_columns.append(_column_report(col, series, columns_dir, column_storage[col]))
+                del series
+
+            meta = {
+                'storage_version': STORAGE_VERSION,
+                'file_type': file_type,
+                'row_count': row_count,
+                'columns': columns,
+                'column_storage': column_storage,
+            }
+            if fill_missing is not None:
+                meta['fill_missing'] = fill_missing
+
+            # Questions with value labels get a bitmap per coded value
+            if value_labels:
+                labelled = [col for col in columns if value_labels.get(col)]
+                file_stems = {col: storage['file'] for col, storage in column_storage.items()}
+                meta['bitmap_index'] = write_index(
+                    tmp_dir / INDEX_DIR, data, labelled, file_stems,
+                    progress=(lambda fraction: progress('index', fraction)) if progress else None)
+                # Joint counts of indexed question pairs, demographics and
+                # questions in catalog order first, metadata columns last
+                contingency = write_contingency(
+                    tmp_dir / INDEX_DIR, meta['bitmap_index'], row_count,
+                    lambda question: np.load(
+                        tmp_dir / INDEX_DIR / f"{meta['bitmap_index'][question]['file']}.npy",
+                        mmap_mode='r'),
+                    questions=sorted(meta['bitmap_index'], key=lambda question: (
+                        is_metadata_column(question), question_sort_key(question))))
+                if contingency is not None:
+                    meta['contingency'] = contingency
+            if variable_labels is not None:
+                meta['variable_labels'] = variable_labels
+            if value_labels is not None:
+                meta['value_labels'] = value_labels
+
+            with open(tmp_dir / META_FILE, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            with open(tmp_dir / MEMORY_REPORT_FILE, 'w', encoding='utf-8') as f:
+                json.dump(_memory_report(row_count, report_columns), f, ensure_ascii=False)
+
+            self._write_responses(tmp_dir)
+
+            _swap_into_place(tmp_dir, target)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        finally:
+            self._invalidate(survey_id)
+
+        # The JSON round trip normalizes label keys exactly as readers see them
+        return self.read_meta(survey_id)
+
+    def _write_responses(self, survey_dir: Path):
+        """Precompute response bodies from the stored files.
+
+        The data body is built from the decoded columns, exactly as the data
+        endpoint would build it, a slice of rows at a time; only its
+        compressed variants are kept and other clients get it built on
+        request. The question catalog is small and kept in every form.
+        """
+        with open(survey_dir / META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        columns_dir = survey_dir / COLUMNS_DIR
+
+        stored = {}
+        for col in meta['columns']:
+            storage = meta['column_storage'][col]
+            dictionary = None
+            if storage['kind'] == 'dictionary':
+                with open(columns_dir / f"{storage['file']}.json", 'r', encoding='utf-8') as f:
+                    dictionary = json.load(f)
+            stored[col] = (np.load(columns_dir / f"{storage['file']}.npy", mmap_mode='r'), dictionary, storage)
+
+        responses_dir = survey_dir / RESPONSES_DIR
+        responses_dir.mkdir(exist_ok=True)
+        try:
+            write_precompressed(responses_dir / 'data.json',
+                                iter_survey_frames_json(meta, _iter_frames(meta, stored)),
+                                identity=False)
+        finally:
+            # Unmap before the directory is moved into place
+            stored.clear()
+
+        # Labelled surveys get their cross-question catalog (metadata only)
+        if 'value_labels' in meta:
+            write_precompressed(responses_dir / 'metadata.json', [encode_json(build_question_catalog(meta))])
+
+    def _write_column(self, columns_dir: Path, file_stem: str, series: pd.Series,
+                      labelled: bool = False) -> Dict[str, Any]:
+        """Write a single column in its most compact form and return its storage descriptor.
+
+        Integers are downcast to the smallest integer type holding them and
+        floats to float32 when that is lossless. Labelled, low-cardinality
+        or incomplete float columns, and all strings, mixed objects,
+        datetimes and extension dtypes, are dictionary encoded: int8/int16/
+        int32 codes into a sorted list of JSON scalars, with -1 marking a
+        missing value.
+        """
+        dtype = series.dtype
+
+        if pd.api.types.is_bool_dtype(dtype) and dtype == np.bool_:
+            np.save(columns_dir / f"{file_stem}.npy", series.to_numpy(dtype=np.bool_))
+            return {'file': file_stem, 'kind': 'bool'}
+
+        if isinstance(dtype, np.dtype) and dtype.kind in 'iu':
+            values = series.to_numpy()
+            if len(values):
+                values = values.astype(_smallest_int_dtype(values.min(), values.max(), dtype))
+            np.save(columns_dir / f"{file_stem}.npy", values)
+            return {'file': file_stem, 'kind': 'numeric'}
+
+        if isinstance(dtype, np.dtype) and dtype.kind == 'f':
+            values = series.to_numpy()
+            missing = int(np.isnan(values).sum())
+            # Only count distinct values when the answer could change the encoding
+            if not (labelled or missing) and series.nunique() > LOW_CARDINALITY:
+                narrow = values.astype(np.float32)
+                if np.array_equal(narrow.astype(dtype), values, equal_nan=True):
+                    values = narrow
+                np.save(columns_dir / f"{file_stem}.npy", values)
+                return {'file': file_stem, 'kind': 'numeric', 'missing': missing}
+
+        codes, uniques = _factorize_sorted(series)
+        dictionary = [_to_json_scalar(value) for value in uniques]
+        np.save(columns_dir / f"{file_stem}.npy", codes.astype(_code_dtype(len(dictionary))))
+        with open(columns_dir / f"{file_stem}.json", 'w', encoding='utf-8') as f:
+            json.dump(dictionary, f, ensure_ascii=False)
+
+        storage = {'file': file_stem, 'kind': 'dictionary',
+                   'sorted': uniques is not None and _is_sorted(uniques),
+                   'missing': int((codes < 0).sum())}
+        if isinstance(dtype, np.dtype) and dtype.kind == 'f':
+            # Decoded back to floats (NaN for missing) rather than objects
+            storage['dtype'] = dtype.name
+        return storage
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def version(self, survey_id: str) -> Optional[int]:
+        """Storage version token (mtime of the survey's metadata), None if missing.
+
+        Re-ingesting a survey rewrites its metadata, so anything keyed on
+        this token is automatically superseded.
+        """
+        survey_dir = self.survey_path(survey_id)
+        for path in (survey_dir / META_FILE, survey_dir / CROSSTAB_FILE, self.legacy_path(survey_id)):
+            try:
+                return os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+        return None
+
+    def read_meta(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Load survey metadata without touching any respondent rows.
+
+        The returned dict may be shared with other requests; treat it as
+        read-only.
+        """
+        meta_path = self.survey_path(survey_id) / META_FILE
+        try:
+            mtime = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            legacy = self._read_legacy(survey_id)
+            return legacy[0] if legacy is not None else None
+
+        def load():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        # Decoded JSON objects take a few times their size on disk
+        return self._cached((survey_id, mtime, 'meta'), load,
+                            lambda _: meta_path.stat().st_size * 4)
+
+    def read_columns(self, survey_id: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load the requested columns (all columns if None) as a DataFrame.
+
+        Unknown column names are ignored, so callers can pass user input
+        straight through and check membership on the result. Column arrays
+        are shared through the cache and marked read-only.
+        """
+        meta = self.read_meta(survey_id)
+        if meta is None:
+            raise FileNotFoundError(f"Survey {survey_id} not found")
+
+        requested = None if columns is None else set(columns)
+        wanted = [c for c in meta['columns'] if requested is None or c in requested]
+
+        if 'column_storage' not in meta:
+            _, frame = self._read_legacy(survey_id)
+            return frame[wanted]
+
+        mtime = self.version(survey_id)
+        fill_missing = meta.get('fill_missing')
+        data = {}
+        for col in wanted:
+            storage = meta['column_storage'][col]
+            data[col] = self._cached(
+                (survey_id, mtime, 'column', col),
+                lambda col=col, storage=storage: _decode_column(
+                    *self._read_stored(survey_id, col), storage, fill_missing),
+                lambda loaded: loaded[1])[0]
+        return pd.DataFrame(data, columns=wanted, index=pd.RangeIndex(meta['row_count']), copy=False)
+
+    def read_rows(self, survey_id: str, rows: np.ndarray,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Decode only the given rows (positions) of the requested columns.
+
+        Reads straight from the stored (memory-mapped) arrays, so serving a
+        page of a survey never decodes its full columns.
+        """
+        meta = self.read_meta(survey_id)
+        if meta is None:
+            raise FileNotFoundError(f"Survey {survey_id} not found")
+
+        requested = None if columns is None else set(columns)
+        wanted = [c for c in meta['columns'] if requested is None or c in requested]
+
+        if 'column_storage' not in meta:
+            _, frame = self._read_legacy(survey_id)
+            return frame.iloc[rows][wanted].reset_index(drop=True)
+
+        fill_missing = meta.get('fill_missing')
+        data = {}
+        for col in wanted:
+            values, dictionary = self._read_stored(survey_id, col)
+            data[col] = _decode_column(values[rows], dictionary, meta['column_storage'][col], fill_missing)[0]
+        return pd.DataFrame(data, columns=wanted, index=pd.RangeIndex(len(rows)))
+
+    def iter_frames(self, survey_id: str) -> Iterator[pd.DataFrame]:
+        """All rows as consecutive DataFrames of bounded size (see RESPONSE_CHUNK_CELLS).
+
+        Slices are decoded from the stored arrays as they are consumed, so
+        streaming a survey never holds its decoded columns in full.
+        """
+        meta = self.read_meta(survey_id)
+        if meta is None:
+            raise FileNotFoundError(f"Survey {survey_id} not found")
+
+        if 'column_storage' not in meta:
+            _, frame = self._read_legacy(survey_id)
+            chunk_rows = _chunk_rows(len(meta['columns']))
+            for start in range(0, len(frame), chunk_rows):
+                yield frame.iloc[start:start + chunk_rows]
+            return
+
+        stored = {}
+        for col in meta['columns']:
+            values, dictionary = self._read_stored(survey_id, col)
+            stored[col] = (values, dictionary, meta['column_storage'][col])
+        yield from _iter_frames(meta, stored)
+
+    def _read_stored(self, survey_id: str, column: str):
+        """A column's stored array and dictionary (None unless dictionary encoded)"""
+        meta = self.read_meta(survey_id)
+        storage = meta['column_storage'][column]
+        columns_dir = self.survey_path(survey_id) / COLUMNS_DIR
+
+        def load():
+            dictionary = None
+            if storage['kind'] == 'dictionary':
+                with open(columns_dir / f"{storage['file']}.json", 'r', encoding='utf-8') as f:
+                    dictionary = json.load(f)
+            return self._load_array(columns_dir / f"{storage['file']}.npy"), dictionary
+
+        # Mapped arrays are charged in full too, which keeps the number of
+        # open mappings bounded by the cache budget
+        return self._cached((survey_id, self.version(survey_id), 'stored', column), load,
+                            lambda loaded: loaded[0].nbytes + estimate_size(loaded[1] or []))
+
+    def _load_array(self, path: Path) -> np.ndarray:
+        """Open a stored array read-only, memory-mapped when large enough"""
+        if self.use_mmap and path.stat().st_size >= MMAP_MIN_BYTES:
+            return np.load(path, mmap_mode='r')
+        values = np.load(path, allow_pickle=False)
+        values.flags.writeable = False
+        return values
+
+    def read_codes(self, survey_id: str, column: str):
+        """Integer codes for a column as (codes, values).
+
+        Codes index into values (sorted distinct non-null answers, the same
+        order as the bitmap index); -1 marks a missing answer.
+        """
+        stored = self._read_stored_codes(survey_id, column)
+        if stored is not None:
+            return stored
+
+        mtime = self.version(survey_id)
+
+        def load():
+            series = self.read_columns(survey_id, [column])[column]
+            try:
+                codes, uniques = pd.factorize(series, sort=True)
+            except TypeError:
+                codes, uniques = pd.factorize(series)
+            values = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+            codes.flags.writeable = False
+            return codes, values
+
+        return self._cached((survey_id, mtime, 'codes', column), load,
+                            lambda loaded: loaded[0].nbytes + estimate_size(loaded[1]))
+
+    def _read_stored_codes(self, survey_id: str, column: str):
+        """Codes straight from a dictionary-encoded column, if they already
+        match what factorizing the decoded column would give"""
+        meta = self.read_meta(survey_id)
+        storage = meta.get('column_storage', {}).get(column)
+        if (storage is None or storage['kind'] != 'dictionary' or 'sorted' not in storage
+                or (storage.get('missing') and meta.get('fill_missing') is not None)):
+            return None
+        return self._read_stored(survey_id, column)
+
+    def memory_report(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Before/after footprint recorded when the survey was stored, None if absent"""
+        try:
+            with open(self.survey_path(survey_id) / MEMORY_REPORT_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def read_index(self, survey_id: str) -> Optional[BitmapIndex]:
+        """Bitmap index for a survey's labelled questions, None if not indexed"""
+        meta = self.read_meta(survey_id)
+        if meta is None or 'bitmap_index' not in meta:
+            return None
+
+        mtime = self.version(survey_id)
+        index_dir = self.survey_path(survey_id) / INDEX_DIR
+        entries = meta['bitmap_index']
+
+        def load_bitmaps(question):
+            def load():
+                return self._load_array(index_dir / f"{entries[question]['file']}.npy")
+            return self._cached((survey_id, mtime, 'bitmaps', question), load, lambda b: b.nbytes)
+
+        return BitmapIndex(entries, meta['row_count'], load_bitmaps)
+
+    def read_contingency(self, survey_id: str) -> Optional[ContingencyCube]:
+        """Pairwise joint counts of a survey's labelled questions, None if not built"""
+        meta = self.read_meta(survey_id)
+        if meta is None or 'contingency' not in meta:
+            return None
+
+        mtime = self.version(survey_id)
+        descriptor = meta['contingency']
+        matrix_path = self.survey_path(survey_id) / INDEX_DIR / descriptor['file']
+
+        def load_matrix():
+            return self._cached((survey_id, mtime, 'contingency'),
+                                lambda: self._load_array(matrix_path), lambda m: m.nbytes)
+
+        return ContingencyCube(descriptor, meta['bitmap_index'], load_matrix)
+
+    def _read_legacy(self, survey_id: str):
+        """Load a legacy JSON survey as (meta, DataFrame), None if not tabular"""
+        legacy_path = self.legacy_path(survey_id)
+        try:
+            mtime = os.stat(legacy_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        def load():
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Crosstab documents share the legacy path but are not tabular
+            if 'data' not in data or 'columns' not in data:
+                return None
+            meta = {k: v for k, v in data.items() if k != 'data'}
+            meta['row_count'] = len(data['data'])
+            meta.setdefault('file_type', 'standard')
+            return meta, pd.DataFrame(data['data'], columns=data['columns'])
+
+        return self._cached((survey_id, mtime, 'legacy'), load,
+                            lambda loaded: estimate_size(loaded[1]) if loaded else 0)
+
+    def _cached(self, key, loader, sizer):
+        if self.cache is None:
+            return loader()
+        return self.cache.get(key, loader, sizer)
+
+    # ------------------------------------------------------------------
+    # Crosstabs
+    # ------------------------------------------------------------------
+    def write_crosstab(self, survey_id: str, data: Dict[str, Any]):
+        """Write a parsed crosstab document plus per-question shards.
+
+        ``crosstab/questions.json`` and each ``crosstab/qNNNN.json`` hold
+        the exact response bodies of the questions and question endpoints,
+        so those requests read only the bytes they return.
+        """
+        target = self.survey_path(survey_id)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{survey_id}-", dir=self.data_folder))
+
+        try:
+            write_precompressed(tmp_dir / CROSSTAB_FILE, [encode_json(data)])
+
+            shard_dir = tmp_dir / CROSSTAB_DIR
+            shard_dir.mkdir()
+
+            # Question list comes from the first banner
+            questions = []
+            if data['banners']:
+                first_banner = list(data['banners'].values())[0]
+                questions = [{'id': q['id'], 'text': q['text']} for q in first_banner['questions']]
+            write_precompressed(shard_dir / 'questions.json', [encode_json({'questions': questions})])
+
+            # One shard per question id with its data from every banner
+            # (first occurrence per banner, as the question lookup always did)
+            shards: Dict[str, Dict[str, Any]] = {}
+            for banner_name, banner_data in data['banners'].items():
+                seen = set()
+                for question in banner_data['questions']:
+                    if question['id'] in seen:
+                        continue
+                    seen.add(question['id'])
+                    shard = shards.setdefault(question['id'], {'question_id': question['id'], 'banners': {}})
+                    shard['banners'][banner_name] = {
+                        'question': question,
+                        'demographics': banner_data['demographics'],
+                        'column_labels': banner_data['column_labels']
+                    }
+
+            shard_index = {}
+            for position, (question_id, shard) in enumerate(shards.items()):
+                shard_index[question_id] = f"q{position:04d}"
+                _write_json(shard_dir / f"{shard_index[question_id]}.json", shard)
+            _write_json(shard_dir / 'index.json', shard_index)
+
+            _swap_into_place(tmp_dir, target)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        finally:
+            self._invalidate(survey_id)
+
+    def response_path(self, survey_id: str, name: str) -> Path:
+        """Path of a precompressed response body (variants add .gz/.br)"""
+        return self.survey_path(survey_id) / RESPONSES_DIR / f"{name}.json"
+
+    def sharded_crosstab_path(self, survey_id: str) -> Path:
+        return self.survey_path(survey_id) / CROSSTAB_FILE
+
+    def crosstab_questions_path(self, survey_id: str) -> Path:
+        return self.survey_path(survey_id) / CROSSTAB_DIR / 'questions.json'
+
+    def crosstab_path(self, survey_id: str) -> Optional[Path]:
+        """Path of the full crosstab document (sharded or legacy), None if missing"""
+        for path in (self.sharded_crosstab_path(survey_id), self.legacy_path(survey_id)):
+            if path.exists():
+                return path
+        return None
+
+    def read_crosstab_question(self, survey_id: str, question_id: str) -> Optional[bytes]:
+        """JSON body for one question across all banners.
+
+        Returns None if the crosstab isn't sharded, b'' if the question
+        doesn't exist.
+        """
+        shard_dir = self.survey_path(survey_id) / CROSSTAB_DIR
+        index_path = shard_dir / 'index.json'
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        def load():
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        shard_index = self._cached((survey_id, mtime, 'crosstab_index'), load,
+                                   lambda _: index_path.stat().st_size * 4)
+        if question_id not in shard_index:
+            return b''
+        return self._read_shard_bytes(survey_id, shard_index[question_id])
+
+    def _read_shard_bytes(self, survey_id: str, name: str) -> Optional[bytes]:
+        try:
+            with open(self.survey_path(survey_id) / CROSSTAB_DIR / f"{name}.json", 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def delete_survey(self, survey_id: str):
+        """Remove columnar and legacy storage for a survey"""
+        target = self.survey_path(survey_id)
+        if target.exists():
+            shutil.rmtree(target)
+        legacy_path = self.legacy_path(survey_id)
+        if legacy_path.exists():
+            os.remove(legacy_path)
+        self._invalidate(survey_id)
+
+    def _invalidate(self, survey_id: str):
+        if self.cache is not None:
+            self.cache.invalidate(survey_id)
+
+    def migrate_legacy(self, survey_id: str, keep_json: bool = False) -> bool:
+        """Convert a legacy ``<survey_id>.json`` survey to the current layout.
+
+        Tabular surveys become columnar storage and crosstab documents are
+        sharded per question. Returns False when there is nothing to migrate
+        (already migrated or missing).
+        """
+        if self.has_columnar(survey_id) or (self.survey_path(survey_id) / CROSSTAB_FILE).exists():
+            return False
+
+        legacy_path = self.legacy_path(survey_id)
+        if not legacy_path.exists():
+            return False
+
+        legacy = self._read_legacy(survey_id)
+        if legacy is None:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if 'banners' not in data:
+                return False
+            self.write_crosstab(survey_id, data)
+            if not keep_json:
+                os.remove(legacy_path)
+            return True
+
+        meta, df = legacy
+        self.write_survey(survey_id, df,
+                          file_type=meta['file_type'],
+                          variable_labels=meta.get('variable_labels'),
+                          value_labels=meta.get('value_labels'))
+
+        if not keep_json:
+            os.remove(self.legacy_path(survey_id))
+        return True
+
+
+def _swap_into_place(tmp_dir: Path, target: Path):
+    """Move a finished directory to ``target``, replacing any previous version.
+
+    The previous version is renamed aside and deleted only once the new one
+    is in place, so readers see the old or the new survey, apart from the
+    instant between the two renames (directories can't be swapped in one).
+    """
+    old_dir = None
+    if target.exists():
+        old_dir = target.with_name(f".{target.name}-old-{uuid.uuid4().hex[:8]}")
+        os.replace(target, old_dir)
+    try:
+        os.replace(tmp_dir, target)
+    except OSError:
+        if old_dir is not None:
+            os.replace(old_dir, target)
+        raise
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _write_json(path: Path, data: Any):
+    # Encoded as jsonify would, so stored bodies can be served as-is
+    with open(path, 'wb') as f:
+        f.write(encode_json(data))
+
+
+class _SpilledColumns(Mapping):
+    """Columns spilled to disk chunk by chunk; each access reassembles one column"""
+
+    def __init__(self, spill_dir: Path, columns: List[str]):
+        self.spill_dir = spill_dir
+        self.positions = {col: position for position, col in enumerate(columns)}
+
+    def __getitem__(self, col: str) -> pd.Series:
+        parts = []
+        try:
+            with open(self.spill_dir / f"{self.positions[col]:04d}.pkl", 'rb') as f:
+                while True:
+                    try:
+                        parts.append(pickle.load(f))
+                    except EOFError:
+                        break
+        except FileNotFoundError:
+            pass
+        if not parts:
+            return pd.Series([], dtype=np.float64, name=col)
+        return pd.concat(parts, ignore_index=True)
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def _chunk_rows(n_columns: int) -> int:
+    return max(RESPONSE_CHUNK_CELLS // max(n_columns, 1), 1)
+
+
+def _iter_frames(meta: Dict[str, Any], stored: Dict[str, Any]) -> Iterator[pd.DataFrame]:
+    """Decode consecutive row slices of stored columns ({col: (values, dictionary, storage)})"""
+    chunk_rows = _chunk_rows(len(stored))
+    fill_missing = meta.get('fill_missing')
+    for start in range(0, meta['row_count'], chunk_rows):
+        yield pd.DataFrame(
+            {col: _decode_column(values[start:start + chunk_rows], dictionary, storage, fill_missing)[0]
+             for col, (values, dictionary, storage) in stored.items()},
+            columns=meta['columns'])
+
+
+def _decode_column(values: np.ndarray, dictionary: Optional[List[Any]], storage: Dict[str, Any],
+                   fill_missing: Any = None):
+    """Decode stored values of a column; returns (array, approximate size in bytes).
+
+    Missing values decode as NaN, or as ``fill_missing`` when given. Plain
+    numeric and bool arrays are returned as stored (still mapped, if they
+    were), so they share the page cache instead of taking private memory.
+    """
+    size = values.nbytes
+    missing_value = np.nan if fill_missing is None else fill_missing
+
+    if storage['kind'] == 'dictionary':
+        # Code -1 indexes the trailing missing slot
+        if 'dtype' in storage and (fill_missing is None or not storage.get('missing')):
+            lookup = np.empty(len(dictionary) + 1, dtype=storage['dtype'])
+            lookup[:-1] = dictionary
+            lookup[-1] = np.nan
+            values = lookup[values]
+            size = values.nbytes
+        else:
+            lookup = np.empty(len(dictionary) + 1, dtype=object)
+            lookup[:-1] = dictionary
+            lookup[-1] = missing_value
+            size = values.size * lookup.itemsize + sum(sys.getsizeof(v) for v in dictionary)
+            values = lookup[values]
+
+    elif storage['kind'] == 'numeric' and fill_missing is not None and storage.get('missing'):
+        filled = values.astype(object)
+        filled[np.isnan(values)] = fill_missing
+        values = filled
+        size = values.size * values.itemsize
+
+    if values.flags.writeable:
+        values.flags.writeable = False
+    return values, size
+
+
+def _smallest_int_dtype(low, high, dtype: np.dtype) -> np.dtype:
+    """Narrowest signed integer type holding [low, high] (dtype itself if none is narrower)"""
+    for candidate in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            return np.dtype(candidate) if np.dtype(candidate).itemsize < dtype.itemsize else dtype
+    return dtype
+
+
+def _code_dtype(n_values: int) -> np.dtype:
+    """Narrowest code type for a dictionary of n values (plus the -1 sentinel)"""
+    for candidate in (np.int8, np.int16):
+        if n_values <= np.iinfo(candidate).max:
+            return np.dtype(candidate)
+    return np.dtype(np.int32)
+
+
+def _factorize_sorted(series: pd.Series):
+    """pd.factorize with sorted uniques, or first-appearance order for unorderable mixes"""
+    try:
+        return pd.factorize(series, sort=True, use_na_sentinel=True)
+    except TypeError:
+        return pd.factorize(series, use_na_sentinel=True)
+
+
+def _is_sorted(uniques) -> bool:
+    try:
+        return bool(uniques.is_monotonic_increasing)
+    except TypeError:
+        return False
+
+
+def _column_report(col: str, series: pd.Series, columns_dir: Path, storage: Dict[str, Any]) -> Dict[str, Any]:
+    """In-memory size of the ingested column vs. its stored files"""
+    stored = sum(path.stat().st_size for path in columns_dir.glob(f"{storage['file']}.*"))
+    stored_dtype = np.load(columns_dir / f"{storage['file']}.npy", mmap_mode='r').dtype
+    return {
+        'column': col,
+        'source_dtype': str(series.dtype),
+        'kind': storage['kind'],
+        'stored_dtype': stored_dtype.name,
+        'before_bytes': int(series.memory_usage(deep=True, index=False)),
+        'after_bytes': int(stored)
+    }
+
+
+def _memory_report(row_count: int, columns: List[Dict[str, Any]]) -> Dict[str, Any]:
+    before = sum(column['before_bytes'] for column in columns)
+    after = sum(column['after_bytes'] for column in columns)
+    return {
+        'row_count': row_count,
+        'column_count': len(columns),
+        'before_bytes': before,
+        'after_bytes': after,
+        'ratio': round(after / before, 3) if before else None,
+        'columns': columns
+    }
+
+
+def _to_json_scalar(value: Any) -> Any:
+    """Convert a dictionary entry into something json.dump accepts"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
@@ -13,6 +13,18 @@ a = Analysis(
         ('static', 'static'),
         ('app.py', '.'),
         ('crosstab_parser.py', '.'),
+        ('survey_store.py', '.'),
+        ('survey_cache.py', '.'),
+        ('bitmap_index.py', '.'),
+        ('contingency.py', '.'),
+        ('cross_analysis.py', '.'),
+        ('ingest.py', '.'),
+        ('survey_db.py', '.'),
+        ('table_query.py', '.'),
+        ('http_cache.py', '.'),
+        ('question_catalog.py', '.'),
+        ('compute_pool.py', '.'),
+        ('export.py', '.'),
         ('.env.example', '.'),
     ],
     hiddenimports=[
@@ -29,6 +41,18 @@ a = Analysis(
         'sqlalchemy',
         'email_validator',
         'crosstab_parser',
+        'survey_store',
+        'survey_cache',
+        'bitmap_index',
+        'contingency',
+        'cross_analysis',
+        'ingest',
+        'survey_db',
+        'table_query',
+        'http_cache',
+        'question_catalog',
+        'compute_pool',
+        'export',
     ],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,275 @@
+"""
+Server-Side Table Queries
+Answers the standard survey view from a survey's cached column codes: DataTables
+server-side processing (paging, ordering, global search and per-column
+filters) and the value counts behind its charts and filter dropdowns, so the
+browser only receives the rows and aggregates it displays, and the rows of
+table exports
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from survey_store import SurveyStore
+
+# Charts are drawn for columns with at most this many distinct values, and
+# filter dropdowns for columns with at most FILTER_MAX_VALUES
+CHART_MAX_VALUES = 20
+FILTER_MAX_VALUES = 100
+
+# Exported rows are decoded this many at a time
+EXPORT_CHUNK_ROWS = 10000
+
+# Largest page a table request may ask for (exports stream instead)
+TABLE_MAX_ROWS = 1000
+
+
+class TableRequest(NamedTuple):
+    """Parsed DataTables request"""
+    draw: int
+    start: int
+    length: int                       # page size, at most the caller's max_length
+    order: List[Tuple[str, bool]]     # (column, descending)
+    search: str
+    column_filters: Dict[str, str]
+
+
+def parse_table_request(params, columns: List[str], max_length: int = TABLE_MAX_ROWS) -> TableRequest:
+    """Read the DataTables protocol fields from request args/form data.
+
+    Column indexes resolve through ``columns[i][data]`` (falling back to
+    the survey's column order); unknown columns are ignored. Page lengths
+    above ``max_length``, or -1 (all rows), are clamped to ``max_length``.
+    """
+    known = set(columns)
+
+    def column_name(position: int):
+        name = params.get(f'columns[{position}][data]')
+        if name is None and 0 <= position < len(columns):
+            name = columns[position]
+        return name if name in known else None
+
+    order = []
+    position = 0
+    while f'order[{position}][column]' in params:
+        name = column_name(_to_int(params.get(f'order[{position}][column]'), -1))
+        if name is not None:
+            order.append((name, params.get(f'order[{position}][dir]', 'asc') == 'desc'))
+        position += 1
+
+    column_filters = {}
+    position = 0
+    while f'columns[{position}][data]' in params:
+        value = params.get(f'columns[{position}][search][value]', '')
+        name = column_name(position)
+        if value and name is not None:
+            column_filters[name] = value
+        position += 1
+
+    return TableRequest(
+        draw=_to_int(params.get('draw'), 0),
+        start=max(_to_int(params.get('start'), 0), 0),
+        length=_page_length(_to_int(params.get('length'), 25), max_length),
+        order=order,
+        search=params.get('search[value]', '').strip(),
+        column_filters=column_filters
+    )
+
+
+def query_table(store: SurveyStore, survey_id: str, meta: Dict[str, Any],
+                table_request: TableRequest) -> Dict[str, Any]:
+    """Filter, order and page a survey; returns the DataTables response body"""
+    rows = table_rows(store, survey_id, meta, table_request)
+
+    page = rows[table_request.start:table_request.start + table_request.length]
+
+    return {
+        'draw': table_request.draw,
+        'recordsTotal': meta['row_count'],
+        'recordsFiltered': int(len(rows)),
+        'data': store.read_rows(survey_id, page).to_dict('records')
+    }
+
+
+def table_rows(store: SurveyStore, survey_id: str, meta: Dict[str, Any],
+               table_request: TableRequest) -> np.ndarray:
+    """Positions of the rows matching a table request, in display order.
+
+    Every predicate is evaluated once per distinct value and mapped onto
+    rows through the column's integer codes. Column filters match the
+    displayed value exactly (the page's filter dropdowns); the global search
+    matches each word case-insensitively anywhere in the row, like
+    DataTables' client-side smart search. Paging is left to the caller.
+    """
+    columns = meta['columns']
+    row_count = meta['row_count']
+    mask = filter_mask(store, survey_id, row_count, table_request.column_filters)
+
+    terms = _search_terms(table_request.search)
+    if terms:
+        lowered = {}
+        for column in columns:
+            codes, values = store.read_codes(survey_id, column)
+            lowered[column] = (codes, [display_string(value).lower() for value in values])
+
+        for term in terms:
+            term_mask = np.zeros(row_count, dtype=bool)
+            for codes, strings in lowered.values():
+                matches = np.array([term in string for string in strings] + [False])
+                term_mask |= matches[codes]
+            mask &= term_mask
+
+    rows = np.flatnonzero(mask)
+
+    if table_request.order and len(rows):
+        # np.lexsort treats the last key as primary
+        keys = []
+        for column, descending in reversed(table_request.order):
+            codes, values = store.read_codes(survey_id, column)
+            # Missing answers (code -1) index the appended rank and sort first
+            ranks = np.append(_value_ranks(values), -1)
+            key = ranks[codes[rows]]
+            keys.append(-key if descending else key)
+        rows = rows[np.lexsort(keys)]
+
+    return rows
+
+
+def iter_row_values(store: SurveyStore, survey_id: str, columns: List[str], rows: np.ndarray,
+                    chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List[Any]]:
+    """Values of the given rows as plain Python objects (None where missing),
+    one tuple per row, decoded from storage ``chunk_rows`` rows at a time"""
+    for start in range(0, len(rows), chunk_rows):
+        frame = store.read_rows(survey_id, rows[start:start + chunk_rows], columns)
+        # Converted a column at a time rather than per cell
+        yield from zip(*(series.astype(object).where(series.notna(), None).tolist()
+                         for _, series in frame.items()))
+
+
+def filter_mask(store: SurveyStore, survey_id: str, row_count: int,
+                column_filters: Dict[str, Any]) -> np.ndarray:
+    """Rows whose displayed value equals the filter value in every filtered column"""
+    mask = np.ones(row_count, dtype=bool)
+    for column, wanted in column_filters.items():
+        codes, values = store.read_codes(survey_id, column)
+        wanted = display_string(wanted)
+        # Trailing False is picked up by missing answers (code -1)
+        matches = np.array([display_string(value) == wanted for value in values] + [False])
+        mask &= matches[codes]
+    return mask
+
+
+def aggregate_columns(store: SurveyStore, survey_id: str, meta: Dict[str, Any],
+                      column_filters: Dict[str, Any], max_values: int = CHART_MAX_VALUES,
+                      include_distinct: bool = False,
+                      max_distinct: int = FILTER_MAX_VALUES) -> Dict[str, Any]:
+    """Per-column value counts over the filtered rows, one bincount per column.
+
+    Counts are returned for columns with at most ``max_values`` distinct
+    values among the filtered rows, in order of first appearance (the order
+    the browser used when it counted rows itself). With ``include_distinct``
+    the distinct non-empty values of the whole survey are added for columns
+    with at most ``max_distinct`` of them, for building filter dropdowns.
+    """
+    columns = meta['columns']
+    row_count = meta['row_count']
+    known_filters = {c: v for c, v in column_filters.items() if c in meta['columns'] and v != ''}
+    mask = filter_mask(store, survey_id, row_count, known_filters)
+    filtered_rows = np.flatnonzero(mask)
+
+    counts = {}
+    distinct = {}
+    for column in columns:
+        codes, values = store.read_codes(survey_id, column)
+        # Shift so missing answers (code -1) land in bin 0
+        selected = codes[filtered_rows].astype(np.int64) + 1
+        value_counts = np.bincount(selected, minlength=len(values) + 1)
+        present = np.flatnonzero(value_counts)
+
+        if len(present) <= max_values:
+            ordered = _first_appearance_order(selected, len(present))
+            counts[column] = {
+                'values': [None if code == 0 else values[code - 1] for code in ordered],
+                'counts': value_counts[ordered].tolist()
+            }
+
+        if include_distinct:
+            non_empty = [value for value in values if value != '']
+            if len(non_empty) <= max_distinct:
+                distinct[column] = non_empty
+
+    result = {
+        'total_rows': row_count,
+        'filtered_rows': int(len(filtered_rows)),
+        'filters_applied': known_filters,
+        'columns': counts
+    }
+    if include_distinct:
+        result['distinct_values'] = distinct
+    return result
+
+
+def display_string(value: Any) -> str:
+    """String form of a value as the browser shows it (JavaScript ``String()``)"""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value.is_integer() and abs(value) < 1e21:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def _first_appearance_order(codes: np.ndarray, n_present: int, chunk_rows: int = 4096) -> List[int]:
+    """Distinct codes in order of first appearance, scanning only as far as needed"""
+    first_seen: Dict[int, int] = {}
+    for start in range(0, len(codes), chunk_rows):
+        uniques, positions = np.unique(codes[start:start + chunk_rows], return_index=True)
+        for code, position in zip(uniques.tolist(), positions.tolist()):
+            first_seen.setdefault(code, start + position)
+        if len(first_seen) == n_present:
+            break
+    return sorted(first_seen, key=first_seen.get)
+
+
+def _value_ranks(values: List[Any]) -> np.ndarray:
+    """Sort rank of each distinct value; numbers before text if types mix"""
+    keys = (lambda i: values[i],
+            lambda i: (isinstance(values[i], str), values[i]),
+            lambda i: display_string(values[i]))
+    for key in keys:
+        try:
+            order = sorted(range(len(values)), key=key)
+            break
+        except TypeError:
+            continue
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(len(values))
+    return ranks
+
+
+def _search_terms(search: str) -> List[str]:
+    """Split a search string into lowercase words, keeping "quoted phrases" whole"""
+    terms = []
+    for quoted, word in re.findall(r'"([^"]*)"|(\S+)', search):
+        term = (quoted or word).lower()
+        if term:
+            terms.append(term)
+    return terms
+
+
+def _page_length(length: int, max_length: int) -> int:
+    return max_length if length < 0 else min(length, max_length)
+
+
+def _to_int(value, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The application modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# app.py reads its settings at import; uploads are ingested inline
+os.environ.setdefault('APP_DATA_PATH', tempfile.mkdtemp(prefix='survey-viewer-test-'))
+os.environ.setdefault('INGEST_WORKERS', '0')
+
+
+@pytest.fixture
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    """Logged-in test client"""
+    client = app_module.app.test_client()
+    client.post('/login', data={'password': app_module.app.config['SITE_PASSWORD']})
+    return client
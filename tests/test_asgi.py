@@ -0,0 +1,82 @@
+import asyncio
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('a2wsgi')
+
+from asgi import asgi_app  # noqa: E402
+
+
+async def call(method, path, headers=(), body=b''):
+    """One request through the ASGI app, returned as (status, headers, body)"""
+    headers = list(headers) + [('Content-Length', str(len(body)))]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': None, 'headers': {}, 'body': b''}
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {k.decode().lower(): v.decode() for k, v in message['headers']}
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await asgi_app(scope, receive, send)
+    return response['status'], response['headers'], response['body']
+
+
+@pytest.fixture
+def session_cookie(client):
+    return f"session={client.get_cookie('session').value}"
+
+
+def test_light_route_answers_while_analysis_runs(monkeypatch, app_module, session_cookie):
+    survey_id = 'asgi-test'
+    app_module.store.write_survey(survey_id, pd.DataFrame({'Q1': ['a', 'b', 'a']}), file_type='csv')
+
+    started, release = threading.Event(), threading.Event()
+    read_index = app_module.store.read_index
+
+    def slow_read_index(*args, **kwargs):
+        # Hold the analysis on its compute thread until the test lets go
+        started.set()
+        release.wait(10)
+        return read_index(*args, **kwargs)
+
+    monkeypatch.setattr(app_module.store, 'read_index', slow_read_index)
+    analyze_body = json.dumps({'target_question': 'Q1', 'filters': []}).encode()
+
+    async def scenario():
+        analysis = asyncio.ensure_future(call(
+            'POST', f'/api/cross-question/{survey_id}/analyze',
+            headers=[('Cookie', session_cookie), ('Content-Type', 'application/json')],
+            body=analyze_body))
+        assert await asyncio.to_thread(started.wait, 5)
+
+        try:
+            status, _, _ = await asyncio.wait_for(
+                call('GET', '/', headers=[('Cookie', session_cookie)]), timeout=5)
+            assert status == 200
+            assert not analysis.done()
+        finally:
+            release.set()
+
+        status, _, body = await asyncio.wait_for(analysis, timeout=10)
+        assert status == 200
+        assert json.loads(body)['total_filtered'] == 3
+
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from contingency import CONTINGENCY_MAX_VALUES
+from cross_analysis import count_with_cube, count_with_index
+from survey_store import SurveyStore
+
+QUESTIONS = 400
+VALUES = 6
+
+
+@pytest.fixture(scope='module')
+def survey(tmp_path_factory):
+    """A wide labelled survey: more values in total than the cube budget"""
+    rng = np.random.default_rng(0)
+    rows = 300
+    data = {'respondent_id': np.arange(rows, dtype=float),
+            'AGE': rng.integers(1, 5, rows).astype(float)}
+    for question in range(1, QUESTIONS + 1):
+        answers = rng.integers(1, VALUES + 1, rows).astype(float)
+        answers[rng.random(rows) < 0.1] = np.nan
+        data[f'Q{question}'] = answers
+    df = pd.DataFrame(data)
+    value_labels = {column: {float(v): f'Option {v}' for v in range(1, VALUES + 1)} for column in df}
+    value_labels['respondent_id'] = {float(v): str(v) for v in range(rows)}
+
+    store = SurveyStore(tmp_path_factory.mktemp('data'))
+    meta = store.write_survey('wide', df, file_type='raw_survey', variable_labels={},
+                             value_labels=value_labels)
+    return store, meta
+
+
+def test_cube_keeps_priority_questions_within_budget(survey):
+    store, meta = survey
+    offsets = meta['contingency']['offsets']
+    covered = sum(len(meta['bitmap_index'][question]['values']) for question in offsets)
+    assert covered <= CONTINGENCY_MAX_VALUES
+    # Demographics and early questions first, metadata columns last
+    assert list(offsets)[:3] == ['AGE', 'Q1', 'Q2']
+    assert 'respondent_id' not in offsets
+    assert f'Q{QUESTIONS}' not in offsets
+    assert len(offsets) > 300
+
+
+@pytest.mark.parametrize('target, filters', [
+    ('Q1', []),
+    ('Q1', [{'question_id': 'AGE', 'values': [2.0]}]),
+    ('AGE', [{'question_id': 'Q7', 'values': [1.0, 3.0, 6.0]}]),
+    ('Q250', [{'question_id': 'Q3', 'values': [5]}]),
+])
+def test_cube_matches_bitmap_index(survey, target, filters):
+    store, meta = survey
+    cube, index = store.read_contingency('wide'), store.read_index('wide')
+    assert count_with_cube(cube, index, target, filters, meta['columns']) == \
+        count_with_index(index, target, filters, meta['columns'])
+
+
+def test_questions_outside_the_cube_fall_back(survey):
+    store, meta = survey
+    cube, index = store.read_contingency('wide'), store.read_index('wide')
+    last = f'Q{QUESTIONS}'
+    assert count_with_cube(cube, index, last, [], meta['columns']) is None
+    assert count_with_cube(cube, index, 'Q1', [{'question_id': last, 'values': [1.0]}],
+                           meta['columns']) is None
+    # Several filters always use the bitmaps
+    assert count_with_cube(cube, index, 'Q1', [{'question_id': 'AGE', 'values': [1.0]},
+                                               {'question_id': 'Q2', 'values': [1.0]}],
+                           meta['columns']) is None
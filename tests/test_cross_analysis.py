@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cross_analysis import count_with_index, count_with_rows
+from survey_store import SurveyStore
+
+ROWS = 1000
+
+
+@pytest.fixture(scope='module')
+def survey(tmp_path_factory):
+    rng = np.random.default_rng(3)
+    data = {}
+    for question, size in (('AGE', 4), ('REGION', 5), ('Q1', 3), ('Q2', 7)):
+        answers = rng.integers(1, size + 1, ROWS).astype(float)
+        answers[rng.random(ROWS) < 0.08] = np.nan
+        data[question] = answers
+    df = pd.DataFrame(data)
+    value_labels = {column: {float(v): f'{column} {v}' for v in range(1, 8)} for column in df}
+
+    store = SurveyStore(tmp_path_factory.mktemp('data'))
+    meta = store.write_survey('s1', df, file_type='raw_survey', variable_labels={},
+                              value_labels=value_labels)
+    return store, meta, df
+
+
+def expected_counts(df, target, filters):
+    mask = pd.Series(True, index=df.index)
+    for filter_item in filters:
+        mask &= df[filter_item['question_id']].isin(filter_item['values'])
+    return df.loc[mask, target].value_counts().to_dict(), int(mask.sum())
+
+
+@pytest.mark.parametrize('target, filters', [
+    ('Q1', []),
+    ('Q2', [{'question_id': 'AGE', 'values': [2.0]}]),
+    ('Q1', [{'question_id': 'REGION', 'values': [1.0, 4.0, 5.0]}]),
+    ('AGE', [{'question_id': 'Q1', 'values': [1.0]}, {'question_id': 'Q2', 'values': [2.0, 3.0, 7.0]}]),
+    ('Q2', [{'question_id': 'AGE', 'values': [1, 3]}, {'question_id': 'REGION', 'values': [2]}]),
+    # Empty value lists and unknown questions don't filter
+    ('Q1', [{'question_id': 'AGE', 'values': []}, {'question_id': 'NOPE', 'values': [1.0]}]),
+])
+def test_index_and_row_engines_match_pandas(survey, target, filters):
+    store, meta, df = survey
+    filtered, total_filtered = expected_counts(
+        df, target, [f for f in filters if f['question_id'] in df and f['values']])
+    unfiltered = df[target].value_counts().to_dict()
+
+    by_index = count_with_index(store.read_index('s1'), target, filters, meta['columns'])
+    needed = [target] + [f['question_id'] for f in filters if f['question_id'] in df]
+    by_rows = count_with_rows(store.read_columns('s1', needed), target,
+                              [f for f in filters if f['question_id'] in df])
+
+    for counts in (by_index, by_rows):
+        assert counts.filtered == filtered
+        assert counts.unfiltered == unfiltered
+        assert counts.total_filtered == total_filtered
+        assert counts.total_original == ROWS
+
+
+def test_index_defers_to_rows_for_unindexed_values(survey):
+    store, meta, _ = survey
+    # Missing answers have no bitmap
+    filters = [{'question_id': 'AGE', 'values': [None]}]
+    assert count_with_index(store.read_index('s1'), 'Q1', filters, meta['columns']) is None
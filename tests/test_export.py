@@ -0,0 +1,49 @@
+import csv
+import io
+
+from openpyxl import load_workbook
+
+from export import Sheet, iter_csv, iter_xlsx
+
+
+def read_csv(sheets):
+    body = b''.join(iter_csv(sheets)).decode('utf-8-sig')
+    return list(csv.reader(io.StringIO(body)))
+
+
+def test_formula_like_text_is_escaped():
+    rows = read_csv([Sheet('Survey', ['Answer'], [
+        ['=HYPERLINK("http://example.com")'],
+        ['+1+2'],
+        ['-2+3'],
+        ['@SUM(A1)'],
+        ['\tindented'],
+    ])])
+    assert [row[0] for row in rows[1:]] == [
+        '\'=HYPERLINK("http://example.com")', "'+1+2", "'-2+3", "'@SUM(A1)", "'\tindented"]
+
+
+def test_numbers_and_plain_text_are_unchanged():
+    rows = read_csv([Sheet('Survey', ['A', 'B', 'C', 'D'], [
+        ['-5', '-', 'ok - fine', -1.5],
+        [None, 'a=b', '+', 3],
+    ])])
+    assert rows[1] == ['-5', '-', 'ok - fine', '-1.5']
+    assert rows[2] == ['', 'a=b', '+', '3']
+
+
+def test_header_and_section_titles_are_escaped():
+    rows = read_csv([Sheet('=cmd', ['=x'], [[1]]), Sheet('Second', ['y'], [[2]])])
+    assert rows[0] == ["'=cmd"]
+    assert rows[1] == ["'=x"]
+
+
+def test_xlsx_header_and_cells_are_written_as_text():
+    workbook = load_workbook(io.BytesIO(b''.join(iter_xlsx(
+        [Sheet('Survey', ['=HYPERLINK("http://example.com")', 'B'], [['=1+1', 2]])]))))
+    worksheet = workbook['Survey']
+    assert worksheet['A1'].value == '=HYPERLINK("http://example.com")'
+    assert worksheet['A1'].data_type == 's'
+    assert worksheet['A2'].data_type == 's'
+    assert worksheet['B1'].value == 'B'
+    assert worksheet['B2'].value == 2
@@ -0,0 +1,53 @@
+import gzip
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def survey_id(client, tmp_path):
+    path = tmp_path / 'survey.csv'
+    pd.DataFrame({'Q1': ['Yes', 'No', 'Yes'], 'Q2': [1, 2, 3]}).to_csv(path, index=False)
+    with open(path, 'rb') as f:
+        return client.post('/upload', data={'file': (f, 'survey.csv')},
+                           content_type='multipart/form-data').get_json()['survey_id']
+
+
+def test_data_response_is_cacheable_and_precompressed(client, survey_id):
+    url = f'/api/survey/{survey_id}/data'
+    plain = client.get(url)
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+    assert plain.status_code == 200
+    assert plain.headers['ETag'] and plain.headers['Last-Modified']
+    assert plain.headers['Cache-Control'] == 'private, no-cache'
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    assert plain.get_json()['data'] == [{'Q1': 'Yes', 'Q2': 1}, {'Q1': 'No', 'Q2': 2}, {'Q1': 'Yes', 'Q2': 3}]
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+@pytest.mark.parametrize('encoding', [None, 'gzip'])
+def test_matching_validators_answer_304(client, survey_id, encoding):
+    url = f'/api/survey/{survey_id}/data'
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    first = client.get(url, headers=headers)
+
+    revalidated = client.get(url, headers={**headers, 'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+    assert client.get(url, headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_rewritten_survey_gets_a_new_etag(client, app_module, survey_id):
+    url = f'/api/survey/{survey_id}/data'
+    etag = client.get(url).headers['ETag']
+
+    app_module.store.write_survey(survey_id, pd.DataFrame({'Q1': ['Maybe']}), file_type='standard')
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['data'] == [{'Q1': 'Maybe'}]
@@ -0,0 +1,110 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyreadstat
+import pytest
+from openpyxl import Workbook
+
+import ingest
+from ingest import IngestQueue, ingest_survey, sniff_file
+from survey_db import SurveyDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = SurveyDB(tmp_path / 'surveys.db')
+    db.init_schema()
+    return db
+
+
+def crosstab_rows():
+    return [['Survey title'], [None, 'Region', None, 'Age'], [None, 'West', 'East', '16-34'],
+            ['Q1. By Region and Age'], ['Total', 10, 20, 30]]
+
+
+@pytest.mark.parametrize('name, sheets, expected', [
+    ('banners.xlsx', {'BANNER 1': [['x']], 'BANNER 2': [['y']]}, 'crosstab'),
+    ('tables.xlsx', {'Sheet': crosstab_rows()}, 'crosstab'),
+    ('survey.xlsx', {'Sheet': [['id', 'Q1'], [1, 'Yes']]}, 'standard'),
+])
+def test_sniff_excel(tmp_path, name, sheets, expected):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(tmp_path / name)
+
+    sniffed = sniff_file(str(tmp_path / name), 'xlsx')
+    try:
+        assert sniffed.file_type == expected
+        # The workbook is left open for the parser
+        assert sniffed.workbook.sheet_names == list(sheets)
+    finally:
+        sniffed.workbook.close()
+
+
+def test_sniff_csv(tmp_path):
+    path = tmp_path / 'survey.csv'
+    pd.DataFrame({'id': [1, 2], 'Q1': ['Yes', 'No']}).to_csv(path, index=False)
+    assert sniff_file(str(path), 'csv') == ('standard', None)
+    pd.DataFrame(crosstab_rows()).to_csv(path, index=False, header=False)
+    assert sniff_file(str(path), 'csv').file_type == 'crosstab'
+
+
+def test_sav_upload_reports_every_phase(tmp_path, db, monkeypatch):
+    path = tmp_path / 'survey.sav'
+    pyreadstat.write_sav(pd.DataFrame({'Q1': [1.0, 2.0, 1.0]}), str(path),
+                         variable_value_labels={'Q1': {1.0: 'Yes', 2.0: 'No'}})
+
+    phases = []
+    report = ingest.JobReporter.report
+
+    def record(self, phase, fraction=0.0):
+        if not phases or phases[-1] != phase:
+            phases.append(phase)
+        report(self, phase, fraction)
+
+    monkeypatch.setattr(ingest.JobReporter, 'report', record)
+    (tmp_path / 'data').mkdir()
+    queue = IngestQueue(db, tmp_path / 'data', max_workers=0)
+    job = db.get_job(queue.submit(uuid.uuid4().hex[:8], str(path), 'survey.sav', 'sav'))
+
+    assert job['status'] == 'done', job['error']
+    assert phases == ['detect', 'parse', 'serialize', 'index', 'commit']
+
+
+def test_chunked_sav_ingest_matches_whole_file(tmp_path, db):
+    rng = np.random.default_rng(1)
+    rows = 100
+    df = pd.DataFrame({
+        'ID': np.arange(rows, dtype=float),
+        'Q1': rng.integers(1, 4, rows).astype(float),
+        'Q2': np.where(rng.random(rows) < 0.2, np.nan, rng.integers(1, 6, rows)).astype(float),
+        'City': rng.choice(['Toronto', 'Montréal', ''], rows),
+    })
+    path = tmp_path / 'survey.sav'
+    pyreadstat.write_sav(df, str(path), column_labels=['Respondent', 'Q1. Happy?', 'Q2. Rating', 'City'],
+                         variable_value_labels={'Q1': {1.0: 'Yes', 2.0: 'No', 3.0: 'Unsure'},
+                                                'Q2': {float(v): str(v) for v in range(1, 6)}})
+
+    data = tmp_path / 'data'
+    data.mkdir()
+    for survey_id, chunk_rows in (('whole', 1000), ('chunked', 7)):
+        job_id = uuid.uuid4().hex
+        db.create_job(job_id, survey_id, 'survey.sav')
+        ingest_survey(str(db.db_path), str(data), job_id, survey_id, str(path), 'survey.sav', 'sav',
+                      sav_chunk_rows=chunk_rows)
+        assert db.get_job(job_id)['status'] == 'done'
+
+    def files(survey_id):
+        root = data / survey_id
+        return {str(p.relative_to(root)): p.read_bytes() for p in sorted(root.rglob('*')) if p.is_file()}
+
+    whole, chunked = files('whole'), files('chunked')
+    assert 'index/contingency.npy' in whole
+    assert whole.keys() == chunked.keys()
+    for name in whole:
+        assert whole[name] == chunked[name], name
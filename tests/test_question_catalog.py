@@ -0,0 +1,46 @@
+from question_catalog import build_question_catalog, clean_question_label
+
+
+def catalog_meta(**overrides):
+    meta = {
+        'columns': ['respondent_id', 'Q10', 'Q2', 'AGE', 'comment'],
+        'row_count': 4,
+        'variable_labels': {'Q10': 'Q10. How satisfied are you?', 'Q2': 'Q2', 'AGE': 'Age group'},
+        'value_labels': {
+            'respondent_id': {'1.0': 'One'},
+            'Q10': {'1.0': 'Yes', '2.0': 'No'},
+            'Q2': {'1.0': 'Agree', '2.0': 'Disagree', '3.0': 'Unsure'},
+            'AGE': {'1.0': '18-34', '2.0': '35+'},
+        },
+        'bitmap_index': {
+            'Q10': {'file': '0001', 'values': [1.0, 2.0], 'counts': [3, 1]},
+            'Q2': {'file': '0002', 'values': [1.0, 3.0, 4.0], 'counts': [1, 2, 1]},
+        },
+    }
+    meta.update(overrides)
+    return meta
+
+
+def test_catalog_orders_and_filters_questions():
+    catalog = build_question_catalog(catalog_meta())
+    assert [q['id'] for q in catalog['questions']] == ['AGE', 'Q2', 'Q10']
+    assert catalog['total_responses'] == 4
+
+
+def test_catalog_carries_clean_labels_and_value_counts():
+    questions = {q['id']: q for q in build_question_catalog(catalog_meta())['questions']}
+    assert questions['Q10']['clean_label'] == 'How satisfied are you?'
+    assert questions['Q10']['value_counts'] == {'1.0': 3, '2.0': 1}
+    # Unanswered labelled values count 0, answered unlabelled ones are kept
+    assert questions['Q2']['value_counts'] == {'1.0': 1, '2.0': 0, '3.0': 2, '4.0': 1}
+    assert questions['Q2']['value_count'] == 3
+    # Questions without a bitmap index have no counts
+    assert 'value_counts' not in questions['AGE']
+
+
+def test_clean_question_label():
+    assert clean_question_label('Q5. Overall rating', 'Q5') == 'Overall rating'
+    assert clean_question_label('Question 3. Region...', 'Q3') == 'Region'
+    assert clean_question_label('Q5', 'Q5') == 'Q5'
+    assert clean_question_label('Q1. A', 'Q1') == 'Q1'
+    assert clean_question_label(None, 'Q7') == 'Q7'
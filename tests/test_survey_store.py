@@ -0,0 +1,150 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import survey_store
+from survey_store import SurveyStore
+
+
+def sample_frame(rows=300):
+    rng = np.random.default_rng(0)
+    floats = rng.choice([1.5, 2.0, -3.25], rows)
+    floats[::7] = np.nan
+    strings = rng.choice(['alpha', 'beta', 'gamma', 'é ü'], rows).astype(object)
+    strings[::5] = None
+    return pd.DataFrame({
+        'respondent_id': np.arange(rows),
+        'score': floats,
+        'answer': strings,
+        'mixed': [[1, 'x', 2.5, None][i % 4] for i in range(rows)],
+        'flag': rng.random(rows) < 0.5,
+        'comment': [f'free text {i}' for i in range(rows)],
+    })
+
+
+def missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def same_values(left, right):
+    """Element-wise equality, None and NaN both counting as missing"""
+    return len(left) == len(right) and all(
+        (missing(a) and missing(b)) or (not missing(a) and a == b) for a, b in zip(left, right))
+
+
+@pytest.mark.parametrize('use_mmap', [True, False])
+def test_round_trip_keeps_every_value(tmp_path, use_mmap):
+    df = sample_frame()
+    store = SurveyStore(tmp_path, use_mmap=use_mmap)
+    meta = store.write_survey('s1', df, file_type='standard')
+
+    assert meta['columns'] == list(df.columns)
+    assert meta['row_count'] == len(df)
+    stored = store.read_columns('s1')
+    for column in df.columns:
+        assert same_values(stored[column].tolist(), df[column].tolist()), column
+
+    rows = np.array([250, 3, 0, 14])
+    page = store.read_rows('s1', rows, ['answer', 'score'])
+    assert list(page.columns) == ['score', 'answer']
+    assert same_values(page['answer'].tolist(), df['answer'].iloc[rows].tolist())
+    assert same_values(page['score'].tolist(), df['score'].iloc[rows].tolist())
+
+
+def test_fill_missing_is_applied_on_read(tmp_path):
+    df = sample_frame()
+    store = SurveyStore(tmp_path)
+    store.write_survey('s1', df, file_type='standard', fill_missing='')
+
+    stored = store.read_columns('s1', ['score', 'answer'])
+    assert stored['answer'].tolist() == df['answer'].fillna('').tolist()
+    assert stored['score'].tolist() == df['score'].astype(object).fillna('').tolist()
+
+
+def test_codes_match_factorized_columns(tmp_path):
+    df = sample_frame()
+    store = SurveyStore(tmp_path)
+    store.write_survey('s1', df, file_type='standard')
+
+    codes, values = store.read_codes('s1', 'answer')
+    expected_codes, expected_values = pd.factorize(df['answer'], sort=True)
+    assert values == list(expected_values)
+    assert codes.tolist() == expected_codes.tolist()
+
+
+def test_frames_stream_every_row_in_order(tmp_path):
+    df = sample_frame()
+    store = SurveyStore(tmp_path)
+    store.write_survey('s1', df, file_type='standard')
+
+    streamed = pd.concat(list(store.iter_frames('s1')), ignore_index=True)
+    assert streamed['respondent_id'].tolist() == df['respondent_id'].tolist()
+    assert same_values(streamed['mixed'].tolist(), df['mixed'].tolist())
+
+
+def test_legacy_json_migrates_to_columnar(tmp_path):
+    store = SurveyStore(tmp_path)
+    legacy = {'columns': ['Q1', 'Q2'], 'data': [{'Q1': 1.0, 'Q2': 'a'}, {'Q1': 2.0, 'Q2': 'b'}],
+              'file_type': 'standard'}
+    store.legacy_path('old').write_text(json.dumps(legacy), encoding='utf-8')
+
+    assert store.migrate_legacy('old')
+    assert store.has_columnar('old')
+    assert not store.legacy_path('old').exists()
+    assert store.read_columns('old').to_dict('records') == legacy['data']
+
+
+def test_delete_survey_removes_storage(tmp_path):
+    store = SurveyStore(tmp_path)
+    store.write_survey('s1', sample_frame(), file_type='standard')
+    store.delete_survey('s1')
+    assert not store.exists('s1')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rewrite_keeps_old_version_until_new_one_is_in_place(tmp_path, monkeypatch):
+    store = SurveyStore(tmp_path)
+    store.write_survey('s1', pd.DataFrame({'Q1': ['old'] * 3}), file_type='standard')
+
+    seen = []
+    replace = os.replace
+
+    def checked_replace(source, destination):
+        # When the new version moves in, the old one is still on disk (aside)
+        if str(destination) == str(store.survey_path('s1')):
+            aside = [p for p in tmp_path.iterdir() if p.name.startswith('.s1-old-')]
+            seen.append(bool(aside) and (aside[0] / 'meta.json').exists())
+        replace(source, destination)
+
+    monkeypatch.setattr(survey_store.os, 'replace', checked_replace)
+    store.write_survey('s1', pd.DataFrame({'Q1': ['new'] * 2}), file_type='standard')
+
+    assert seen == [True]
+    assert store.read_columns('s1', ['Q1'])['Q1'].tolist() == ['new', 'new']
+    # Nothing is left behind: no temporary or old directories
+    assert [p.name for p in tmp_path.iterdir()] == ['s1']
+
+
+def test_failed_swap_restores_previous_version(tmp_path, monkeypatch):
+    store = SurveyStore(tmp_path)
+    store.write_survey('s1', pd.DataFrame({'Q1': ['old']}), file_type='standard')
+
+    replace = os.replace
+
+    def failing_replace(source, destination):
+        if str(destination) == str(store.survey_path('s1')) and '-old-' not in str(source):
+            raise OSError('disk full')
+        replace(source, destination)
+
+    monkeypatch.setattr(survey_store.os, 'replace', failing_replace)
+    try:
+        store.write_survey('s1', pd.DataFrame({'Q1': ['new']}), file_type='standard')
+    except OSError:
+        pass
+    monkeypatch.undo()
+
+    assert store.read_columns('s1', ['Q1'])['Q1'].tolist() == ['old']
+    assert [p.name for p in tmp_path.iterdir()] == ['s1']
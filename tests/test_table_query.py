@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from survey_store import SurveyStore
+from table_query import parse_table_request, query_table, table_rows
+
+COLUMNS = ['Region', 'Age', 'Name']
+
+
+@pytest.fixture
+def survey(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Region': rng.choice(['West', 'East', 'North'], 500),
+        'Age': rng.integers(18, 80, 500),
+        'Name': [f'Person {i}' for i in range(500)],
+    })
+    store = SurveyStore(tmp_path)
+    meta = store.write_survey('s1', df, file_type='standard', fill_missing='')
+    return store, meta, df
+
+
+def table_params(start=0, length=10, search='', filters=None, order=()):
+    params = {'draw': '2', 'start': str(start), 'length': str(length), 'search[value]': search}
+    for position, column in enumerate(COLUMNS):
+        params[f'columns[{position}][data]'] = column
+        params[f'columns[{position}][search][value]'] = (filters or {}).get(column, '')
+    for position, (column, direction) in enumerate(order):
+        params[f'order[{position}][column]'] = str(COLUMNS.index(column))
+        params[f'order[{position}][dir]'] = direction
+    return params
+
+
+def test_filters_search_and_order_match_pandas(survey):
+    store, meta, df = survey
+    table_request = parse_table_request(
+        table_params(search='person 1', filters={'Region': 'West'}, order=[('Age', 'desc'), ('Name', 'asc')]),
+        meta['columns'])
+    rows = table_rows(store, 's1', meta, table_request)
+
+    # Each search word may match any column
+    text = df.astype(str).apply(lambda column: column.str.lower())
+    matches = [text.apply(lambda column: column.str.contains(term, regex=False)).any(axis=1)
+               for term in ('person', '1')]
+    expected = df[(df['Region'] == 'West') & matches[0] & matches[1]]
+    expected = expected.sort_values(['Age', 'Name'], ascending=[False, True], kind='stable')
+    assert rows.tolist() == expected.index.tolist()
+
+
+def test_pages_are_sliced_from_the_ordered_rows(survey):
+    store, meta, df = survey
+    table_request = parse_table_request(table_params(start=20, length=10, order=[('Name', 'asc')]),
+                                        meta['columns'])
+    result = query_table(store, 's1', meta, table_request)
+
+    expected = df.sort_values('Name', kind='stable').iloc[20:30]
+    assert result['draw'] == 2
+    assert result['recordsTotal'] == result['recordsFiltered'] == 500
+    assert [row['Name'] for row in result['data']] == expected['Name'].tolist()
+
+
+@pytest.mark.parametrize('length, expected', [(-1, 100), (5000, 100), (50, 50)])
+def test_page_length_is_capped(survey, length, expected):
+    store, meta, _ = survey
+    table_request = parse_table_request(table_params(length=length), meta['columns'], max_length=100)
+    assert table_request.length == expected
+    assert len(query_table(store, 's1', meta, table_request)['data']) == expected
+
+
+def test_table_endpoint_caps_pages_and_json_export_streams_all_rows(client, app_module, tmp_path):
+    df = pd.DataFrame({'Region': ['West', 'East'] * 600, 'Age': list(range(1200)), 'Name': ['x'] * 1200})
+    path = tmp_path / 'big.csv'
+    df.to_csv(path, index=False)
+    with open(path, 'rb') as f:
+        survey_id = client.post('/upload', data={'file': (f, 'big.csv')},
+                                content_type='multipart/form-data').get_json()['survey_id']
+
+    page = client.post(f'/api/survey/{survey_id}/table', data=table_params(length=-1)).get_json()
+    assert len(page['data']) == app_module.app.config['TABLE_MAX_ROWS']
+
+    response = client.post(f'/api/survey/{survey_id}/export?format=json',
+                           data=table_params(filters={'Region': 'West'}, order=[('Age', 'desc')]))
+    assert response.mimetype == 'application/json'
+    rows = json.loads(response.data)
+    assert len(rows) == 600
+    assert rows[0] == {'Region': 'West', 'Age': 1198, 'Name': 'x'}
+
+    # JSON is only offered for survey tables
+    assert client.post(f'/api/cross-question/{survey_id}/analyze/export?format=json', json={}).status_code == 400